@@ -2,22 +2,26 @@ from fastapi import FastAPI, Query, HTTPException
 from bson import ObjectId
 import sys
 import httpx
+import asyncio
 import os
 import crawler
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.responses import RedirectResponse
-from introlix_api.app.routes import auth, posts, run_spider, similarity
+from introlix_api.app.routes import auth, posts, run_spider, similarity, metrics
 from typing import List
 from dotenv import load_dotenv, dotenv_values
 
 from introlix_api.app.appwrite import databases, APPWRITE_DATABASE_ID, ID, APPWRITE_ACCOUNT_COLLECTION_ID, get_interests
-from introlix_api.app.database import startup_db_client, shutdown_db_client
+from introlix_api.app.database import startup_db_client, shutdown_db_client, feed_data
+from introlix_api.crawler.bulk_writer import BulkWriter
+from introlix_api.logger import logger
 from introlix_api.ml.recommendation import Recommendation
 from introlix_api.utils.tags import fetch_tags
 
 from introlix_api.exception import CustomException
 
 from contextlib import asynccontextmanager
+from pymongo.errors import PyMongoError
 
 from pydantic import BaseModel, Field
 
@@ -39,6 +43,12 @@ class FeedModel(BaseModel):
 async def lifespan(app: FastAPI):
     # Start the database connection
     await startup_db_client(app)
+    # one feed article per canonical URL, the spider's saves upsert on it. pymongo blocks, and an
+    # unreachable database must not stop the API from starting
+    try:
+        await asyncio.to_thread(BulkWriter(feed_data).ensure_indexes)
+    except PyMongoError as e:
+        logger.error(f"Feed data indexes not created: {e}")
     yield
     # Close the database connection
     await shutdown_db_client(app)
@@ -202,4 +212,5 @@ app.include_router(auth.router, prefix="/auth")
 app.include_router(run_spider.router, prefix="/spider")
 app.include_router(similarity.router, prefix="/feed")
 app.include_router(crawler.router)
-app.include_router(posts.router)
\ No newline at end of file
+app.include_router(posts.router)
+app.include_router(metrics.router)
\ No newline at end of file
@@ -1,23 +1,106 @@
-import re
+import os
 import sys
 import time
-from urllib.parse import urlparse
+import signal
 from fastapi import APIRouter, HTTPException, Query
-from introlix_api.crawler.bot import IntrolixBot, BotArgs
+from introlix_api.crawler.bot import BotArgs
+from introlix_api.crawler.pipeline import CrawlPipeline
+from introlix_api.crawler.archive import PageArchive
+from introlix_api.crawler.url_classifier import url_classifier
+from introlix_api.crawler.backlog import UrlBacklog
+from introlix_api.crawler.harvest import LinkHarvester
+from introlix_api.crawler.retention import RetentionManager, INSERTED_AT, inserted_now
+from introlix_api.crawler.bulk_writer import BulkWriter
+from introlix_api.crawler.discovery import SiteDiscovery, SitemapStore
+from introlix_api.crawler.checkpoint import CrawlCheckpoint
+from introlix_api.crawler.status import CrawlStatus
+from introlix_api.crawler.frontier import URLFrontier
+from introlix_api.crawler.seen import SeenFilter
+from introlix_api.crawler.validators import ValidatorStore
+from introlix_api.crawler.metrics import metrics, host_of, WRITE_SECONDS, WRITTEN_DOCUMENTS
+from introlix_api.crawler.throttle import host_controller
 from introlix_api.exception import CustomException
 from introlix_api.logger import logger
 from introlix_api.utils.root_sites import root_sites
-from introlix_api.app.database import search_data, db
+from introlix_api.utils.canonical import canonicalize_url
+from introlix_api.utils.fingerprint import drop_near_duplicates
 from introlix_api.app.appwrite import fetch_root_sites, fetch_saved_urls, save_urls
-from pymongo import ASCENDING
-from pymongo.errors import DuplicateKeyError
 
 router = APIRouter()
 
 BATCH_SIZE = 10
-urls_batch = []
-storage_threshold = 500 * 1024 * 1024
-delete_batch = 1000
+RETRY_ERRORS = ('HostBackoff', 'Throttled')  # pages to crawl again once their host is ready
+# pages without content that a retry would not change, any other error (timeout, connection, parse) is retried
+FINAL_ERRORS = ('NotModified', 'RobotsDenied', 'ContentTooLarge', 'ContentTypeRejected')
+LEASE_SIZE = 100
+SESSION_SECONDS = 600
+ROOT_PRIORITY = 10
+DISCOVERY_PRIORITY = 5
+# crawl state, built by `init` so that importing this module (the web app, the parse
+# workers of the pipeline) opens no database client, state file or thread
+search_data = db = None
+seen_filter = validators = frontier = checkpoint = harvester = url_backlog = None
+archive = retention = writer = pipeline = discovery = status = None
+
+def init(collection=None, database=None):
+    """
+    Function to build the crawl state, once.
+
+    Args:
+        collection (pymongo.collection.Collection, optional): collection of the stored articles.
+            Defaults to the `search_data` collection of the app database.
+        database (pymongo.database.Database, optional): database of the collection.
+    """
+    global search_data, db, seen_filter, validators, frontier, checkpoint, harvester, url_backlog
+    global archive, retention, writer, pipeline, discovery, status
+    if pipeline is not None:
+        return
+
+    if collection is None:
+        from introlix_api.app.database import search_data as collection, db as database
+    search_data, db = collection, database
+
+    seen_filter = SeenFilter(os.path.join(BotArgs.STATE_DIR, "seen"),
+                             capacity=BotArgs.SEEN_CAPACITY,
+                             error_rate=BotArgs.SEEN_ERROR_RATE,
+                             max_bytes=BotArgs.SEEN_MAX_BYTES)
+    validators = ValidatorStore(os.path.join(BotArgs.STATE_DIR, "validators.sqlite3"))
+    frontier = URLFrontier(os.path.join(BotArgs.STATE_DIR, "frontier.sqlite3"),
+                           min_delay=BotArgs.MIN_HOST_DELAY,
+                           latency_factor=BotArgs.HOST_DELAY_FACTOR,
+                           lease_seconds=BotArgs.LEASE_SECONDS,
+                           seen=seen_filter,
+                           hosts=host_controller)
+    checkpoint = CrawlCheckpoint(frontier, seen=seen_filter, interval=BotArgs.CHECKPOINT_SECONDS)
+    # host states and metrics, read by the routes of the web app that runs apart from the crawler
+    status = CrawlStatus(BotArgs.STATE_DIR, interval=BotArgs.STATUS_SECONDS)
+    # links of the stored articles, read incrementally from the last _id harvested
+    harvester = LinkHarvester(search_data, frontier,
+                              use_change_stream=BotArgs.HARVEST_CHANGE_STREAM,
+                              cursor_batch_size=BotArgs.HARVEST_CURSOR_BATCH)
+    # extracted URLs waiting to be saved to Appwrite, bounded in memory
+    url_backlog = UrlBacklog(os.path.join(BotArgs.STATE_DIR, "backlog.sqlite3"),
+                             max_memory=BotArgs.BACKLOG_MEMORY_URLS,
+                             dedup_capacity=BotArgs.BACKLOG_DEDUP_CAPACITY)
+    # raw pages kept to re-extract them later (`python -m introlix_api.crawler.archive`)
+    archive = PageArchive(os.path.join(BotArgs.STATE_DIR, "archive"),
+                          compression=BotArgs.ARCHIVE_COMPRESSION,
+                          segment_bytes=BotArgs.ARCHIVE_SEGMENT_BYTES,
+                          max_bytes=BotArgs.ARCHIVE_MAX_BYTES) if BotArgs.ARCHIVE_RAW_PAGES else None
+    # size and age limits of the stored articles, enforced in the background
+    retention = RetentionManager(search_data, db,
+                                 max_bytes=BotArgs.RETENTION_MAX_BYTES,
+                                 ttl_seconds=BotArgs.RETENTION_TTL_SECONDS,
+                                 delete_batch=BotArgs.RETENTION_DELETE_BATCH,
+                                 check_seconds=BotArgs.RETENTION_CHECK_SECONDS,
+                                 protect_voted=BotArgs.RETENTION_PROTECT_VOTED)
+    # upserts of the new articles, unique on their canonical URL
+    writer = BulkWriter(search_data)
+
+    pipeline = CrawlPipeline(write=write_batch, args=BotArgs, batch_size=BATCH_SIZE, seen=seen_filter,
+                             validators=validators, archive=archive)
+    discovery = SiteDiscovery(SitemapStore(os.path.join(BotArgs.STATE_DIR, "sitemaps.sqlite3")), pipeline.bot,
+                              url_filter=filter_urls)
 
 def filter_urls(url: str) -> bool:
     """
@@ -27,182 +110,219 @@ def filter_urls(url: str) -> bool:
     Returns:
         bool: True if the url is article url else False
     """
-    parsed_url = urlparse(url)
-
-    if parsed_url.path in ('', '/'):
-        return False
-    
-    non_article_keywords = [
-        "/product", "/products", "/home", "/item", "/items", "/category", "/categories",
-        "/login", "/signin", "/logout", "/signup", "/register", "/account", "/user",
-        "/profile", "/dashboard", "/settings", "/preferences", "/order", "/orders",
-        "/cart", "/checkout", "/payment", "/subscribe", "/subscription",
-        "/contact", "/support", "/help", "/faq", "/about", "/privacy", "/terms",
-        "/policy", "/conditions", "/legal", "/service", "/services", "/guide",
-        "/how-to", "/pricing", "/price", "fees", "/plans", "/features", "/partners",
-        "/team", "/careers", "/jobs", "/join", "/apply", "/training", "/demo",
-        "/trial", "/download", "/install", "/app", "/apps", "/software", "/portal",
-        "/index", "/main", "/video", "/videos", "/photo", "/photos",
-        "/image", "/images", "/gallery", "/portfolio", "/showcase", "/testimonials",
-        "/reviews", "/search", "/find", "/browse", "/list", "/tags", "/explore",
-        "/new", "/trending", "/latest", "/promotions", "/offers", "/deals", "/discount",
-        "/coupon", "/coupons", "/gift", "/store", "/stores", "/locator", "/locations",
-        "/branches", "/events", "/webinar", "/calendar", "/schedule",
-        "/class", "/classes", "/lesson", "/lessons", "/training", "/activity",
-        "/activities", "/workshop", "/exhibit", "/performance", "/map", "/directions",
-        "/weather", "/traffic", "/rates", "/auction", "/bid", "/tender", "/investment",
-        "/loan", "/mortgage", "/property", "/real-estate", "/construction", "/project",
-        "/client", "/clients", "/partner", "/sponsor", "/media", "/press", "/releases",
-        "/announcements", "/newsroom", "/resources", "courses", "collections", "/u/", "/members/",
-        "/@", "/shop", "/wiki", "/author", "/dynamic", "/image", "/submit"  # TODO: need to add more
-    ]
-
-    article_keywords = [
-        "/blog/", "post", "article", "insights", "guide", "tutorial",
-        "how-to", "what", "how", "introduction", "/news/"
-    ]
-
-    article_pattern = [
-        r'/(/blog/|article|articles|post|posts|blogs|news|)/\d{4}/\d{2}/+[a-z0-9-]+/?',
-        r'/(/blog/|article|articles|post|posts|blogs|news|)/[a-z0-9-]+/[a-z0-9-]+',
-        r'(?<!\/\/www)(/blog/|article|articles|post|posts|blogs|news|)/[a-z0-9-]+',
-        r'^(?!.*\/category\/).*\/[a-z0-9-]+\/[a-z0-9-]+(-[a-z0-9-]+)+$',
-        r'/[^/]+/\d{4}/\d{2}/\d{2}/+[a-z0-9]+/?',
-        r'/[^/]+/\d{4}/\d{2}/+[a-z0-9]+/?'
-        r'/[a-z0-9-]+/\d{4}/\d{2}/+/?',
-        r'/[a-z0-9-]+/\d{4}/\d{2}/\d{2}/+/?'
-    ]
-
-    for pattern in article_pattern:
-        if re.search(pattern, url):
-            if not any(keyword in url for keyword in non_article_keywords):
-                return True
-            
-    if any (keyword in url for keyword in article_keywords):
-        return True
-    
-    last_segment = parsed_url.path.strip('/').split('/')[-1]
-    if '-' in last_segment and len(last_segment.split('-')) > 2:
-        return True
-    
-    return False
+    return url_classifier.is_article(url)
 
 def save_to_db(data):
-    global urls_batch
     try:
-        # Check database storage size and delete old documents if needed
-        stats = db.command("collStats", "search_data")
-        storage_size = stats['size']
-
-        if storage_size >= storage_threshold:
-            oldest_docs = search_data.find().sort("createdAt", ASCENDING).limit(delete_batch)
-            oldest_ids = [doc['_id'] for doc in oldest_docs]
-            search_data.delete_many({"_id": {"$in": oldest_ids}})
+        # Pages crawled in an earlier session were already saved, they don't need a database lookup.
+        # They are only fetched again when requeued (changed in their sitemap or feed, root pages),
+        # and only parsed when their validators did not answer 304: their stored copy is updated
+        known = [seen_filter.seen(d["url"]) for d in data]
+        refreshed = [d for d, seen in zip(data, known) if seen]
+        data = [d for d, seen in zip(data, known) if not seen]
+        if refreshed:
+            report = writer.refresh(refreshed, max_distance=BotArgs.NEAR_DUPLICATE_DISTANCE)
+            if report.updated:
+                logger.debug(f"Updated {report.updated} articles that changed since their last crawl")
 
-        # Prepare list of URLs to check in the database
-        urls = [d["url"] for d in data if filter_urls(d["url"])]
+        # Pages are deduplicated on their canonical URL, so variants of a stored page are not stored again.
+        # Stored pages are skipped by the upserts of the writer, without a lookup first
+        unique_data = []
+        for d in data:
+            if d.get("content") is not None:
+                unique_data.append({"url": d["url"],
+                                    "canonical_url": d.get("canonical_url") or canonicalize_url(d["url"]),
+                                    "content": d["content"], "simhash": d.get("simhash"), "type": "article",
+                                    INSERTED_AT: inserted_now()})
 
-        # Retrieve existing URLs from the database to filter out duplicates
-        existing_urls = set(search_data.find({"url": {"$in": urls}}).distinct("url"))
-
-        # Filter out documents with URLs that already exist in the database
-        unique_data = [
-            {"url": d["url"], "content": d["content"], "type": "article"}
-            for d in data
-            if d["url"] not in existing_urls and d.get("content") is not None
-        ]
+        # Syndicated copies of a stored article have another URL but a close fingerprint
+        if unique_data:
+            with WRITE_SECONDS.time(store='mongo', operation='near_duplicates'):
+                unique_data = drop_near_duplicates(search_data, unique_data,
+                                                   max_distance=BotArgs.NEAR_DUPLICATE_DISTANCE,
+                                                   mode=BotArgs.NEAR_DUPLICATE_MODE)
 
-        # Insert only unique documents
+        # Insert only unique documents, one unordered bulk upsert per batch
         if unique_data:
-            try:
-                search_data.insert_many(unique_data)
-            except DuplicateKeyError as e:
-                logger.info("Duplicate URL detected during insertion. Skipping duplicate entries.")
+            report = writer.write(unique_data)
+            if report.duplicates:
+                logger.debug(f"Skipped {report.duplicates} articles already stored")
+            # the size is checked by the retention thread, not on the write path
+            retention.record_inserts(report.inserted)
+            for url in report.inserted_urls:
+                WRITTEN_DOCUMENTS.inc(store='mongo', host=host_of(url))
 
-        # Process URLs in `urls_batch` if it has URLs
-        if urls_batch:
+        # Save the oldest URLs of the backlog, a batch at a time
+        saved_urls = url_backlog.pop(BotArgs.BACKLOG_SAVE_BATCH)
+        if saved_urls:
             try:
-                save_urls(urls_batch)
+                with WRITE_SECONDS.time(store='appwrite', operation='save_urls'):
+                    save_urls(saved_urls)
+                for url in saved_urls:
+                    WRITTEN_DOCUMENTS.inc(store='appwrite', host=host_of(url))
             except Exception as e:
                 logger.error(f"Error saving URLs to Appwrite: {str(e)}")
-            urls_batch.clear()
 
     except Exception as e:
         raise CustomException(e, sys) from e
     
+def written_urls(urls: list) -> list:
+    """
+    Function to get the URLs whose page is already saved in the database, under the URL itself
+    or under another variant of it with the same canonical URL
+    Args:
+        urls (list): crawled URLs
+    Returns:
+        list: URLs of `urls` found in the database
+    """
+    by_canonical = {}
+    for url in urls:
+        by_canonical.setdefault(canonicalize_url(url), []).append(url)
+
+    written = set()
+    query = {"$or": [{"url": {"$in": urls}}, {"canonical_url": {"$in": list(by_canonical)}}]}
+    for document in search_data.find(query, {"url": 1, "canonical_url": 1}):
+        written.add(document["url"])
+        written.update(by_canonical.get(document.get("canonical_url"), ()))
+
+    return [url for url in urls if url in written]
+
 def extract_urls(batch_size=BATCH_SIZE):
-    # Fetch documents with required fields only, reducing memory footprint per document
-    documents = search_data.find({}, {"content.links": 1})
-
-    # Initialize a list to store URLs in batches
-    batch_urls = []
-
-    for doc in documents:
-        # Extract URLs only if 'content' and 'links' exist
-        links = doc.get("content", {}).get("links")
-        if links:
-            # Use a generator to iterate over links directly
-            for url in links:
-                batch_urls.append(url)
-                # Yield URLs in batches to control memory usage
-                if len(batch_urls) >= batch_size:
-                    yield batch_urls
-                    batch_urls = []  # Clear the batch after yielding
-
-    # Yield any remaining URLs
-    if batch_urls:
-        yield batch_urls
+    """
+    Function to get the links of the articles stored since the last call, in batches
+    Args:
+        batch_size (int): links per batch
+    Yields:
+        list: links of the new articles
+    """
+    # documents already read are skipped through the _id watermark of the harvester
+    yield from harvester.harvest(batch_size)
+
+def write_batch(data_batch):
+    """
+    Function to save a batch of scraped data, then settle its URLs in the frontier.
+
+    Called by the writer stage of the crawl pipeline, pages are only acked once written.
+
+    Args:
+        data_batch (list): scraped data of a batch of URLs.
+    """
+    save_to_db(data_batch)
+
+    # mark the pages as crawled so the frontier can schedule their hosts again
+    for d in data_batch:
+        error = (d.get("error") or {}).get("name")
+        if error in RETRY_ERRORS:
+            # throttled hosts keep their URLs, leased again once the backoff is over
+            frontier.release(d["url"], delay=host_controller.blocked_for(host_of(d["url"])))
+            continue
+        if d.get("content") is None and error not in FINAL_ERRORS:
+            # a transient failure must not mark the page as crawled forever
+            if not frontier.retry(d["url"], delay=BotArgs.RETRY_DELAY_SECONDS, max_attempts=BotArgs.MAX_FETCH_ATTEMPTS):
+                logger.info(f"Giving up {d['url']} after {BotArgs.MAX_FETCH_ATTEMPTS} failed attempts: {error}")
+            continue
+        frontier.ack(d["url"], latency=d.get("fetch", {}).get("elapsed"),
+                     crawl_delay=pipeline.bot.crawl_delay(d["url"]))
 
 def crawler(urls_batch):
     try:
-        bot = IntrolixBot(urls=urls_batch, args=BotArgs)
-        
-        # Process each batch of scraped data
-        for data_batch in bot.scrape_parallel(batch_size=BATCH_SIZE):
-            save_to_db(data_batch)
+        init()
+        stats = pipeline.run(urls_batch)
+        logger.info(f"Crawled {len(urls_batch)} URLs: {stats}")
 
     except Exception as e:
         raise CustomException(e, sys) from e
+
+def seed_frontier():
+    """
+    Queue the root sites and the saved urls for a new crawl session.
+    Root sites are queued again even if they were crawled in the last session.
+    """
+    try:
+        root_urls = fetch_root_sites()
+        saved_urls = fetch_saved_urls()
+    except Exception as e:
+        logger.info("Error fetching URLs from Appwrite: %s", str(e))
+        root_urls = []
+        saved_urls = []
+
+    if not root_urls:
+        root_urls = root_sites()
+
+    # articles listed in sitemaps and feeds, changed ones are crawled again
+    discovered = discovery.discover(root_urls)
+    logger.info(f"Discovered {len(discovered.new)} new and {len(discovered.changed)} changed URLs from "
+                f"{discovered.fetched} sitemaps and feeds ({discovered.not_modified} not modified)")
+    frontier.add(discovered.new, priority=DISCOVERY_PRIORITY)
+    frontier.add(discovered.changed, priority=DISCOVERY_PRIORITY, requeue=True)
+
+    # root pages are only scraped for links on sites without a sitemap or feed
+    covered = set(discovered.covered)
+    frontier.add([url for url in root_urls if url not in covered], priority=ROOT_PRIORITY, requeue=True)
+    frontier.add(saved_urls)
     
 def run_crawler_continuously():
-    global urls_batch
+    init()
     try:
+        # near-duplicate lookups go through the fingerprint bands
+        search_data.create_index("simhash_bands")
+        # one document per canonical URL, enforced by the database
+        writer.ensure_indexes()
+        # eviction sorts on the insertion time, deletes run in the background
+        retention.ensure_indexes()
+        retention.start()
+
+        # pages left leased by a crashed or killed crawler are acked if saved, crawled again otherwise
+        checkpoint.resume(is_written=written_urls)
+        session = dict(checkpoint.state)
+
         while True:
-            start_time = time.time()  # Record the start time
-
-            while (time.time() - start_time) < 600:  # Run for 10 minutes (600 seconds)
-                try:
-                    root_urls = fetch_root_sites()
-                    saved_urls = fetch_saved_urls()
-                except Exception as e:
-                    logger.info("Error fetching URLs from Appwrite: %s", str(e))
-                    root_urls = []
-                    saved_urls = []
-
-                if root_urls and saved_urls:
-                    urls = root_urls + saved_urls
-                    urls = list(set(urls))
-                else:
-                    urls = root_sites() + urls_batch
+            if session.get("seeded") and time.time() - session.get("started", 0) < SESSION_SECONDS:
+                # resume the interrupted session, its seeds are already in the frontier
+                start_time = session["started"]
+            else:
+                start_time = time.time()  # Record the start time
+                seed_frontier()
+                checkpoint.update(started=start_time, seeded=True)
+                checkpoint.save()
+            session = {}
+
+            while (time.time() - start_time) < SESSION_SECONDS:  # Run for 10 minutes (600 seconds)
+                urls = frontier.lease(LEASE_SIZE)
 
                 if urls:
-                    logger.info(f"Starting crawler with {len(urls)} root URLs")
-                    crawler(urls[::-1])
+                    logger.info(f"Starting crawler with {len(urls)} URLs from the frontier {frontier.stats()}")
+                    crawler(urls)
+                    checkpoint.maybe_save()
+                    status.maybe_publish()
 
 
                 # Extract and process URLs in batches
                 for extracted_urls in extract_urls(batch_size=BATCH_SIZE):
-                    urls_batch.extend(list(set(extracted_urls)))
+                    url_backlog.push(extracted_urls)
+                    frontier.add(extracted_urls)
                     # logger.info(f"Starting crawler with {len(set(urls_batch))} extracted URLs from MongoDB")
                     # crawler(list(set(urls_batch)))
                 time.sleep(1)
 
             time.sleep(1)
+            checkpoint.save()
+            logger.info(f"Seen filter stats: {seen_filter.stats()}")
+            logger.info(f"URL backlog stats: {url_backlog.stats()}")
+            logger.info(f"Conditional re-crawl summary: {validators.summary()}")
+            validators.reset_summary()
+            logger.info(f"Crawl metrics since start: {metrics.summary()}")
 
             # After 10 minutes, the while loop will restart without any pause
             logger.info("Restarting the crawler for another 10-minute session.")
     except Exception as e:
         raise CustomException(e, sys) from e
+    finally:
+        checkpoint.save()
+        status.publish()
+        url_backlog.save()
+        harvester.save()
+        pipeline.close()
 
 
 @router.post('/crawler')
@@ -211,9 +331,25 @@ def run_crawler():
         run_crawler_continuously()
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+
+@router.get('/crawler/hosts')
+def crawler_hosts(throttled_only: bool = Query(False, description="only hosts set aside or slowed down")):
+    """
+    Function to get the concurrency limit, latency, error rate and backoff of the crawled hosts
+    """
+    try:
+        # published by the crawler process, this process's own hosts until it publishes
+        hosts = CrawlStatus(BotArgs.STATE_DIR).hosts(throttled_only=throttled_only)
+        if hosts is None:
+            hosts = host_controller.snapshot(throttled_only=throttled_only)
+        return hosts
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
 
 if __name__ == "__main__":
+    # start.sh stops the crawler with SIGTERM, exit through the final checkpoint
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     while True:
         start_time = time.time()
         while (time.time() - start_time) < 600:
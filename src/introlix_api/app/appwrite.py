@@ -9,6 +9,7 @@ from dotenv import load_dotenv, dotenv_values
 from introlix_api.logger import logger
 from introlix_api.exception import CustomException
 from introlix_api.utils.common import is_valid_url, sanitize_url
+from introlix_api.utils.canonical import canonicalize_url, strip_tracking
 
 from pydantic import HttpUrl
 
@@ -152,9 +153,9 @@ def save_urls(urls):
                 queries=[Query.limit(limit), Query.offset(offset)]
             )
             
-            # Add the fetched URLs to the set
+            # Add the fetched URLs to the set, by canonical URL so variants of a saved URL are skipped
             for doc in response['documents']:
-                existing_urls.add(doc['url'])
+                existing_urls.add(canonicalize_url(doc['url']))
             
             # Check if we have fetched all documents
             if len(response['documents']) < limit:
@@ -165,9 +166,11 @@ def save_urls(urls):
         
         # Save only unique URLs that are not already in the set
         for url in urls:
-            if url not in existing_urls:
+            key = canonicalize_url(url)
+            if key not in existing_urls:
+                existing_urls.add(key)
                 if is_valid_url(url):
-                    sanitized_url = sanitize_url(url)
+                    sanitized_url = sanitize_url(strip_tracking(url))
                     databases.create_document(
                         database_id=APPWRITE_DATABASE_ID,
                         collection_id=APPWRITE_SAVED_URLS_COLLECTION_ID,
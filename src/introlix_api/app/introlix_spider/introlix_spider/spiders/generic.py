@@ -7,6 +7,9 @@ import asyncio
 from dotenv import load_dotenv, dotenv_values
 from introlix_api.app.database import feed_data, db
 from introlix_api.app.appwrite import fetch_root_sites
+from introlix_api.utils.canonical import canonicalize_url, canonical_link
+from introlix_api.crawler.url_classifier import spider_url_classifier
+from introlix_api.crawler.bulk_writer import BulkWriter
 
 
 load_dotenv()
@@ -46,37 +49,19 @@ class GenericSpider(scrapy.Spider):
         """
         Function to verify if the url is article url or not
         """
-
-        # list of article url patterns
-        article_pattern = [
-            r'/(blog|article|articles|post|blog|posts|blogs|)/\d{4}/\d{2}/+[a-z0-9-]+/?',
-            r'/(blog|article|articles|post|blog|posts|blogs|)/[a-z0-9-]+/[a-z0-9-]+',
-            r'(?<!\/\/www)(blog|article|articles|post|posts|blogs)/[a-z0-9-]+',
-            r'^(?!.*\/category\/).*\/[a-z0-9-]+\/[a-z0-9-]+(-[a-z0-9-]+)+$',
-            r'/[^/]+/\d{4}/\d{2}/\d{2}/+[a-z0-9]+/?',
-            r'/[^/]+/\d{4}/\d{2}/+[a-z0-9]+/?'
-            r'/[a-z0-9-]+/\d{4}/\d{2}/+/?',
-            r'/[a-z0-9-]+/\d{4}/\d{2}/\d{2}/+/?'
-         ]
-
-        # list of non article keywords
-        non_article_words = [
-            "category", "signup", "login", "about", "contact",  # Add more non-article keywords...
-        ]
-
-        # Check if the url matches any of the article patterns
-        for pattern in article_pattern:
-            if re.search(pattern, url):
-                if not any(word in url for word in non_article_words):
-                    return True
-        return False
+        return spider_url_classifier.is_article(url)
 
     def parse(self, response):
         # Get all the urls from the response
         urls = response.css('a::attr(href)').extract()
 
-        # Filter out the urls that are not article urls
-        article_urls = [response.urljoin(url.split("?")[0]) for url in urls if self.is_this_article(url)]
+        # Filter out the urls that are not article urls, variants of the same article are requested once
+        article_urls = {}
+        for url, is_article in zip(urls, spider_url_classifier.classify(urls)):
+            if is_article:
+                url = response.urljoin(url.split("?")[0])
+                article_urls.setdefault(canonicalize_url(url), url)
+        article_urls = list(article_urls.values())
 
         # Send a request to each article url
         for url in article_urls:
@@ -110,6 +95,7 @@ class GenericSpider(scrapy.Spider):
         desc = response.css('meta[name="description"]::attr(content)').get() # getting the description of the article
         publication_date = response.css('span::text, time::text').re_first(r'(\w+ \d+|\d+\s?\w+,? \w+)') # getting the publication date of the article
         image_url = response.css('meta[property="og:image"]::attr(content)').get() # getting the image url of the article
+        canonical_url = canonical_link(response.css('link[rel="canonical"]::attr(href)').get(), url) # getting the dedup key of the article
 
         # Classify article title asynchronously
         category = await self.classify_article(title) # getting the category of the article from the classification API
@@ -119,6 +105,7 @@ class GenericSpider(scrapy.Spider):
             "title": title,
             "desc": desc,
             "url": url,
+            "canonical_url": canonical_url,
             "publication_date": publication_date,
             "image_url": image_url,
             "category": category,
@@ -136,8 +123,10 @@ class GenericSpider(scrapy.Spider):
         # if "feed_Data" in db.list_collection_names():
         #     feed_data.drop()
 
-        for feed_items in self.data:
-            feed_data.insert_one(feed_items)
+        # the same article reached through several URLs is saved once, the unique index
+        # on the canonical URL is created when the app starts
+        report = BulkWriter(feed_data).write(self.data)
+        print(f"Saved {report.inserted} articles, {report.duplicates} already saved")
 
 
 # import re
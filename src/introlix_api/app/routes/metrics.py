@@ -0,0 +1,32 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from introlix_api.crawler.bot import BotArgs
+from introlix_api.crawler.metrics import metrics, PROMETHEUS_CONTENT_TYPE
+from introlix_api.crawler.status import CrawlStatus
+
+router = APIRouter()
+
+@router.get('/metrics', response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Function to export the crawler counters and latency histograms in the Prometheus text format
+    """
+    try:
+        # published by the crawler process, this process's own metrics until it publishes
+        status = CrawlStatus(BotArgs.STATE_DIR).read()
+        page = status['metrics'] if status is not None else metrics.render()
+        return PlainTextResponse(page, media_type=PROMETHEUS_CONTENT_TYPE)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get('/metrics/summary')
+def get_metrics_summary():
+    """
+    Function to get the crawler metrics aggregated over hosts, with p50 and p99 latencies
+    """
+    try:
+        status = CrawlStatus(BotArgs.STATE_DIR).read()
+        return status['summary'] if status is not None else metrics.summary()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
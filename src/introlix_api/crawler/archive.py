@@ -0,0 +1,348 @@
+import os
+import sys
+import gzip
+import json
+import mmap
+import sqlite3
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlparse
+
+from introlix_api.logger import logger
+from introlix_api.crawler.bot import IntrolixBot, BotArgs
+from introlix_api.crawler.fetch import FetchResult
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+EXTENSIONS = {GZIP: '.warc.gz', ZSTD: '.warc.zst'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL,
+    segment TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS records_by_url ON records (url);
+"""
+
+
+def encode_record(fetched: FetchResult, timestamp: int, compression: str = GZIP) -> bytes:
+    """
+    Function to serialize and compress a fetched response into one archive record.
+
+    A record is a JSON header line (URL, status, headers, time of the crawl) followed
+    by the raw body, compressed on its own so any record can be read from its offset.
+
+    Args:
+        fetched (FetchResult): fetched page.
+        timestamp (int): time of the crawl in milliseconds.
+        compression (str, optional): `GZIP` or `ZSTD`. Defaults to `GZIP`.
+    Returns:
+        bytes: compressed record.
+    """
+    header = json.dumps({
+        'url': fetched.url,
+        'status': fetched.status_code,
+        'timestamp': timestamp,
+        'headers': fetched.headers,
+        'truncated': fetched.truncated,
+    }, separators=(',', ':')).encode()
+    payload = header + b"\n" + fetched.content
+
+    if compression == ZSTD:
+        return zstandard.ZstdCompressor(level=3).compress(payload)
+    return gzip.compress(payload, compresslevel=6)
+
+
+def decode_record(data: bytes, compression: str = GZIP) -> tuple:
+    """
+    Function to read back a record written by `encode_record`.
+
+    Args:
+        data (bytes): compressed record.
+        compression (str, optional): `GZIP` or `ZSTD`. Defaults to `GZIP`.
+    Returns:
+        tuple: (FetchResult, time of the crawl in milliseconds).
+    """
+    if compression == ZSTD:
+        payload = zstandard.ZstdDecompressor().decompress(data)
+    else:
+        payload = gzip.decompress(data)
+
+    header, _, content = payload.partition(b"\n")
+    header = json.loads(header)
+    fetched = FetchResult(url=header['url'], status_code=header['status'], content=content,
+                          headers=header['headers'], bytes_read=len(content), truncated=header['truncated'])
+    return fetched, header['timestamp']
+
+
+class PageArchive:
+    """
+    Append-only archive of fetched pages, to re-extract them without crawling again.
+
+    Records are appended to numbered segment files, each record compressed on its
+    own (gzip members, or zstd frames when `zstandard` is installed), WARC style. A
+    new segment starts once the current one reaches `segment_bytes`. An SQLite index
+    maps every URL to the segment, offset and length of its records.
+
+    The archive is not covered by the retention of the stored articles: when a new
+    segment starts and the segments exceed `max_bytes`, the oldest are deleted with
+    their index rows, so the pages they held can't be re-extracted anymore.
+    """
+    def __init__(self, directory: str, compression: str = GZIP, segment_bytes: int = 256 * 1024 * 1024,
+                 max_bytes: int = None):
+        """
+        Initialize the PageArchive.
+
+        Args:
+            directory (str): directory of the segments and the index. Created if missing.
+            compression (str, optional): `GZIP` or `ZSTD`. Defaults to `GZIP`.
+            segment_bytes (int, optional): size after which a new segment is started. Defaults to 256 MB.
+            max_bytes (int, optional): size of the segments after which the oldest are deleted. None keeps
+                every segment. Defaults to None.
+        """
+        if compression == ZSTD and zstandard is None:
+            logger.info("zstandard is not installed, archiving pages with gzip")
+            compression = GZIP
+        if compression not in EXTENSIONS:
+            raise ValueError(f"Unknown archive compression {compression}")
+
+        self.directory = directory
+        self.compression = compression
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, "index.sqlite3"), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+        self._segment = None
+        self._file = None
+
+    def _segments(self) -> list:
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(EXTENSIONS[self.compression]))
+
+    def _open_segment(self):
+        segments = self._segments()
+        last = segments[-1] if segments else None
+
+        if last is None or os.path.getsize(os.path.join(self.directory, last)) >= self.segment_bytes:
+            number = int(last.split('.', 1)[0]) + 1 if last else 1
+            last = f"{number:06d}{EXTENSIONS[self.compression]}"
+            self._prune(segments)
+
+        self._segment = last
+        self._file = open(os.path.join(self.directory, last), "ab")
+
+    def _prune(self, segments: list):
+        """
+        Delete the oldest full segments while the archive is over `max_bytes`.
+        """
+        if self.max_bytes is None:
+            return
+
+        sizes = [(name, os.path.getsize(os.path.join(self.directory, name))) for name in segments]
+        total = sum(size for _, size in sizes)
+        for name, size in sizes:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM records WHERE segment = ?", (name,))
+            self._conn.commit()
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+            logger.info(f"Deleted archive segment {name} ({size} bytes), the archive is over {self.max_bytes} bytes")
+
+    def append(self, fetched: FetchResult, timestamp: int, record: bytes = None):
+        """
+        Function to add a fetched page to the archive.
+
+        Args:
+            fetched (FetchResult): fetched page.
+            timestamp (int): time of the crawl in milliseconds.
+            record (bytes, optional): the page already encoded by `encode_record`, e.g. in a parse worker.
+        """
+        if record is None:
+            record = encode_record(fetched, timestamp, self.compression)
+
+        with self._lock:
+            if self._file is None or self._file.tell() >= self.segment_bytes:
+                if self._file is not None:
+                    self._file.close()
+                self._open_segment()
+
+            offset = self._file.tell()
+            self._file.write(record)
+            self._file.flush()
+
+            self._conn.execute("INSERT INTO records (url, segment, offset, length, timestamp) VALUES (?, ?, ?, ?, ?)",
+                               (fetched.url, self._segment, offset, len(record), timestamp))
+            self._conn.commit()
+
+    def get(self, url: str) -> tuple | None:
+        """
+        Function to read the last archived version of a page.
+
+        Args:
+            url (str): URL of the page.
+        Returns:
+            tuple | None: (FetchResult, time of the crawl in milliseconds), None if the page is not archived.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT segment, offset, length FROM records WHERE url = ? "
+                                     "ORDER BY id DESC LIMIT 1", (url,)).fetchone()
+            if self._file is not None:
+                self._file.flush()
+        if row is None:
+            return None
+
+        segment, offset, length = row
+        with open(os.path.join(self.directory, segment), "rb") as f:
+            f.seek(offset)
+            return decode_record(f.read(length), self.compression)
+
+    def latest(self) -> dict:
+        """
+        Function to list the last archived version of every page.
+
+        Returns:
+            dict: segment name -> (offset, length) spans of its latest records, in file order.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT segment, offset, length FROM records WHERE id IN (SELECT MAX(id) FROM records GROUP BY url) "
+                "ORDER BY segment, offset").fetchall()
+
+        spans = {}
+        for segment, offset, length in rows:
+            spans.setdefault(segment, []).append((offset, length))
+        return spans
+
+    def stats(self) -> dict:
+        with self._lock:
+            records, pages = self._conn.execute("SELECT COUNT(*), COUNT(DISTINCT url) FROM records").fetchone()
+        segments = self._segments()
+        return {
+            'records': records,
+            'pages': pages,
+            'segments': len(segments),
+            'bytes': sum(os.path.getsize(os.path.join(self.directory, name)) for name in segments),
+        }
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._conn.close()
+
+
+# parse-only bot of a re-extraction worker process, built by `_init_extractor`
+_extractor = None
+
+
+def _init_extractor(args, sites: list):
+    global _extractor
+    _extractor = IntrolixBot(urls=[], args=args)
+    _extractor.root_sites = sites
+    _extractor.root_sites_netlocs = {urlparse(root_url).netloc for root_url in sites}
+
+
+def _extract_span(path: str, spans: list, compression: str) -> list:
+    """
+    Re-extract records of one segment in a worker process, the segment is memory-mapped.
+    """
+    results = []
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as segment:
+        for offset, length in spans:
+            fetched, timestamp = decode_record(segment[offset:offset + length], compression)
+            try:
+                results.append(_extractor.parse_page(fetched, timestamp))
+            except Exception as e:
+                results.append(IntrolixBot.error_result(fetched.url, fetched.status_code, timestamp,
+                                                        e.__class__.__name__, str(e)))
+    return results
+
+
+def reextract(archive: PageArchive, args: BotArgs = BotArgs, workers: int = None, chunk_size: int = 200):
+    """
+    Run the current extraction again over the last archived version of every page.
+
+    Segments are read from local disk, memory-mapped, and parsed by a process pool,
+    so the speed is bound by the disk and the cores instead of the network.
+
+    Args:
+        archive (PageArchive): archive to read.
+        args (BotArgs, optional): bot settings. Defaults to BotArgs.
+        workers (int, optional): parse processes. Defaults to `BotArgs.PARSE_WORKERS`.
+        chunk_size (int, optional): records parsed per task. Defaults to 200.
+    Yields:
+        list: scraped data of a chunk of pages, in the format of `IntrolixBot.scrape`.
+    """
+    tasks = []
+    for segment, spans in archive.latest().items():
+        path = os.path.join(archive.directory, segment)
+        for i in range(0, len(spans), chunk_size):
+            tasks.append((path, spans[i:i + chunk_size]))
+
+    if not tasks:
+        return
+
+    # the current segment may still be buffered by the crawler writing it
+    with archive._lock:
+        if archive._file is not None:
+            archive._file.flush()
+
+    sites = IntrolixBot(urls=[], args=args).root_sites
+    with ProcessPoolExecutor(max_workers=workers or args.PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_extractor, initargs=(args, sites)) as pool:
+        futures = [pool.submit(_extract_span, path, spans, archive.compression) for path, spans in tasks]
+        for future in futures:
+            yield future.result()
+
+
+if __name__ == "__main__":
+    # rebuild the content of the stored articles from the archive of the crawler:
+    #     python -m introlix_api.crawler.archive [ARCHIVE_DIR]
+    from pymongo.errors import DuplicateKeyError
+    from introlix_api.app.database import search_data
+    from introlix_api.crawler.bulk_writer import content_update
+
+    directory = sys.argv[1] if len(sys.argv) > 1 else os.path.join(BotArgs.STATE_DIR, "archive")
+    archive = PageArchive(directory, compression=BotArgs.ARCHIVE_COMPRESSION)
+    logger.info(f"Re-extracting pages from {directory}: {archive.stats()}")
+
+    start = time.perf_counter()
+    pages = updated = collisions = 0
+    for batch in reextract(archive):
+        for d in batch:
+            pages += 1
+            content = d.get("content")
+            if content is None:
+                continue
+
+            fields = content_update(d, BotArgs.NEAR_DUPLICATE_DISTANCE)
+            fields["canonical_url"] = d["canonical_url"]
+            try:
+                updated += search_data.update_one({"url": d["url"]}, {"$set": fields}).modified_count
+            except DuplicateKeyError:
+                # the new canonical link is the key of another stored article, the old key is kept
+                collisions += 1
+                del fields["canonical_url"]
+                updated += search_data.update_one({"url": d["url"]}, {"$set": fields}).modified_count
+
+    logger.info(f"Re-extracted {pages} pages in {time.perf_counter() - start:.1f}s, {updated} articles updated, "
+                f"{collisions} canonical URLs of other articles kept unchanged")
@@ -0,0 +1,198 @@
+import os
+import sqlite3
+import threading
+from collections import deque
+
+from introlix_api.logger import logger
+from introlix_api.crawler.metrics import metrics
+from introlix_api.crawler.seen import BloomFilter, SeenFilter
+
+BACKLOG_SIZE = metrics.gauge("crawler_backlog_urls", "URLs waiting in the backlog", ("location",))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS backlog (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    url TEXT NOT NULL
+);
+"""
+
+
+class UrlBacklog:
+    """
+    Bounded FIFO of URLs waiting to be saved, spilling to disk past its memory cap.
+
+    The oldest `max_memory` URLs are kept in memory, the rest in an SQLite table,
+    moved back to memory as the front is popped. URLs are deduplicated on the way
+    in, against the URLs waiting and, through a fixed size Bloom filter, against
+    the URLs pushed before. The filter is started again once it holds
+    `dedup_capacity` URLs, so its memory and error rate stay bounded; a URL may then
+    be queued once more.
+    """
+    def __init__(self, path: str, max_memory: int = 10_000, dedup_capacity: int = 1_000_000,
+                 dedup_error_rate: float = 0.001):
+        """
+        Initialize the UrlBacklog.
+
+        Args:
+            path (str): SQLite file of the URLs spilled to disk. Created if missing.
+            max_memory (int, optional): URLs kept in memory. Defaults to 10000.
+            dedup_capacity (int, optional): URLs remembered to drop duplicates. Defaults to 1000000.
+            dedup_error_rate (float, optional): share of new URLs wrongly dropped as duplicates.
+                Defaults to 0.001.
+        """
+        self.max_memory = max_memory
+        self.dedup_capacity = dedup_capacity
+        self.dedup_error_rate = dedup_error_rate
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+        self._memory = deque()
+        self._memory_keys = set()
+        self._recent = self._new_recent()
+        self._disk = self._conn.execute("SELECT COUNT(*) FROM backlog").fetchone()[0]
+        self.added = 0
+        self.duplicates = 0
+
+        if self._disk:
+            logger.info(f"URL backlog resumed with {self._disk} URLs on disk")
+        self._refill()
+
+    def _new_recent(self) -> BloomFilter:
+        return BloomFilter(self.dedup_capacity, self.dedup_error_rate)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._memory) + self._disk
+
+    def _update_gauge(self):
+        BACKLOG_SIZE.set(len(self._memory), location='memory')
+        BACKLOG_SIZE.set(self._disk, location='disk')
+
+    def _refill(self):
+        # move the oldest spilled URLs to memory once half of it is free
+        if not self._disk or len(self._memory) > self.max_memory // 2:
+            return
+
+        rows = self._conn.execute("SELECT id, key, url FROM backlog ORDER BY id LIMIT ?",
+                                  (self.max_memory - len(self._memory),)).fetchall()
+        for _, key, url in rows:
+            self._memory.append((key, url))
+            self._memory_keys.add(key)
+
+        if rows:
+            self._conn.execute("DELETE FROM backlog WHERE id <= ?", (rows[-1][0],))
+            self._conn.commit()
+            self._disk -= len(rows)
+        self._update_gauge()
+
+    def push(self, urls: list) -> int:
+        """
+        Function to add URLs at the back of the backlog.
+
+        Args:
+            urls (list): URLs to add, duplicates are dropped.
+        Returns:
+            int: URLs added.
+        """
+        spilled = []
+        added = 0
+        with self._lock:
+            for url in urls:
+                key = SeenFilter.key_for(url)
+                if key in self._memory_keys or not self._recent.add(key):
+                    self.duplicates += 1
+                    continue
+                if self._recent.count >= self.dedup_capacity:
+                    self._recent = self._new_recent()
+
+                # once URLs are on disk, newer ones go there too so the order is kept
+                if not self._disk and not spilled and len(self._memory) < self.max_memory:
+                    self._memory.append((key, url))
+                    self._memory_keys.add(key)
+                    added += 1
+                else:
+                    spilled.append((key, url))
+
+            if spilled:
+                before = self._conn.total_changes
+                self._conn.executemany("INSERT OR IGNORE INTO backlog (key, url) VALUES (?, ?)", spilled)
+                self._conn.commit()
+                inserted = self._conn.total_changes - before
+                self._disk += inserted
+                added += inserted
+                self.duplicates += len(spilled) - inserted
+
+            self.added += added
+            self._update_gauge()
+        return added
+
+    def pop(self, limit: int) -> list:
+        """
+        Function to take URLs from the front of the backlog.
+
+        Args:
+            limit (int): maximum number of URLs.
+        Returns:
+            list: oldest URLs of the backlog.
+        """
+        urls = []
+        with self._lock:
+            while len(urls) < limit:
+                if not self._memory:
+                    self._refill()
+                    if not self._memory:
+                        break
+                key, url = self._memory.popleft()
+                self._memory_keys.discard(key)
+                urls.append(url)
+            self._refill()
+            self._update_gauge()
+        return urls
+
+    def stats(self) -> dict:
+        """
+        Function to get the size of the backlog.
+
+        Returns:
+            dict: URLs in memory and on disk, URLs added and duplicates dropped since start.
+        """
+        with self._lock:
+            return {
+                'memory': len(self._memory),
+                'disk': self._disk,
+                'added': self.added,
+                'duplicates': self.duplicates,
+            }
+
+    def save(self):
+        """
+        Function to write the URLs held in memory to disk, so a restart finds them.
+        """
+        with self._lock:
+            if self._memory:
+                # they are older than the spilled ones, ids below the first keep them at the front
+                first = self._conn.execute("SELECT MIN(id) FROM backlog").fetchone()[0]
+                if first is None:
+                    first = 1
+                start = first - len(self._memory)
+                self._conn.executemany("INSERT OR IGNORE INTO backlog (id, key, url) VALUES (?, ?, ?)",
+                                       [(start + i, key, url) for i, (key, url) in enumerate(self._memory)])
+                self._conn.commit()
+                self._disk += len(self._memory)
+                self._memory.clear()
+                self._memory_keys.clear()
+                self._update_gauge()
+
+    def close(self):
+        self.save()
+        with self._lock:
+            self._conn.close()
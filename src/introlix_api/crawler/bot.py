@@ -1,19 +1,27 @@
 import os, sys, re, time
 import errno
-import string
-import requests
+import asyncio
+import aiohttp
 import multiprocessing
-from bs4 import BeautifulSoup
 from dataclasses import dataclass
 from introlix_api.logger import logger
 from urllib.parse import urlparse, urlunsplit, urljoin
 from urllib.robotparser import RobotFileParser
 from introlix_api.exception import CustomException
-from urllib.robotparser import RobotFileParser
+from introlix_api.crawler.robots import RobotsCache, robots_cache
+from introlix_api.crawler.fetch import FetchResult, BodyBuffer
+from introlix_api.crawler.seen import SeenFilter
+from introlix_api.crawler.http import AsyncHTTPPool, SyncHTTPPool
+from introlix_api.crawler.validators import ValidatorStore
+from introlix_api.crawler.metadata import extract_metadata
+from introlix_api.crawler.throttle import HostController, HostBlocked, THROTTLE_STATUSES, host_controller
+from introlix_api.crawler.metrics import host_of, FETCH_PHASE_SECONDS, FETCH_BYTES, PAGES, ROBOTS_SECONDS, PARSE_SECONDS
 
 from requests import ReadTimeout
 from introlix_api.utils.core import html_to_dom
-from introlix_api.utils.tags import fetch_tags
+from introlix_api.utils.tags import fetch_tags, TagMatcher
+from introlix_api.utils.canonical import canonicalize_url, canonical_link, strip_tracking
+from introlix_api.utils.fingerprint import fingerprint, to_int64
 from introlix_api.utils.root_sites import root_sites
 from ssl import SSLCertVerificationError
 from urllib3.exceptions import NewConnectionError, MaxRetryError
@@ -22,151 +30,487 @@ from urllib3.exceptions import NewConnectionError, MaxRetryError
 class BotArgs:
     TIMEOUT_SECONDS = 3
     MAX_FETCH_SIZE = 1024*1024
+    CHUNK_SIZE = 64*1024
+    HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
     BAD_URL_REGEX = re.compile(r'\/\/localhost\b|\.jpg$|\.png$|\.js$|\.gz$|\.zip$|\.pdf$|\.bz2$|\.ipynb$|\.py$')
     GOOD_URL_REGEX = re.compile(r'https?:\/\/(www\.)?[-a-zA-Z0-9@:%._\+~#=]{1,256}\.[a-zA-Z0-9()]{1,6}\b([-a-zA-Z0-9()@:%_\+.~#?&//=]*)')
     DEFAULT_ENCODING = 'utf8'
     DEFAULT_ENC_ERRORS = 'replace'
+    MAX_CONCURRENCY = 32
+    POOL_MAX_CONNECTIONS = 100
+    POOL_CONNECTIONS_PER_HOST = 4
+    KEEPALIVE_SECONDS = 30.0
+    PARSE_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+    PARSE_QUEUE_SIZE = 64
+    WRITE_QUEUE_SIZE = 64
+    WRITE_FLUSH_SECONDS = 2.0
+    STATE_DIR = os.path.join(os.getcwd(), "crawl_state")
+    MIN_HOST_DELAY = 1.0
+    HOST_DELAY_FACTOR = 2.0
+    LEASE_SECONDS = 120.0
+    MAX_FETCH_ATTEMPTS = 3
+    RETRY_DELAY_SECONDS = 60.0
+    CHECKPOINT_SECONDS = 30.0
+    STATUS_SECONDS = 10.0
+    NEAR_DUPLICATE_DISTANCE = 3
+    NEAR_DUPLICATE_MODE = 'skip'
+    ARCHIVE_RAW_PAGES = False
+    ARCHIVE_COMPRESSION = 'gzip'
+    ARCHIVE_SEGMENT_BYTES = 256*1024*1024
+    ARCHIVE_MAX_BYTES = 20*1024*1024*1024
+    SEEN_CAPACITY = 5_000_000
+    SEEN_ERROR_RATE = 0.001
+    SEEN_MAX_BYTES = 32*1024*1024
+    BACKLOG_MEMORY_URLS = 10_000
+    BACKLOG_DEDUP_CAPACITY = 1_000_000
+    BACKLOG_SAVE_BATCH = 500
+    HARVEST_CHANGE_STREAM = True
+    HARVEST_CURSOR_BATCH = 500
+    RETENTION_MAX_BYTES = 500*1024*1024
+    RETENTION_TTL_SECONDS = None
+    RETENTION_DELETE_BATCH = 1000
+    RETENTION_CHECK_SECONDS = 60.0
+    RETENTION_PROTECT_VOTED = True
+    ROBOTS_CACHE_TTL = 60*60
+    ROBOTS_NEGATIVE_TTL = 10*60
     ALLOWED_EXCEPTIONS = (ValueError, ConnectionError, ReadTimeout, TimeoutError,
-                      OSError, NewConnectionError, MaxRetryError, SSLCertVerificationError)
+                      OSError, NewConnectionError, MaxRetryError, SSLCertVerificationError,
+                      aiohttp.ClientError)
 
 class IntrolixBot:
-    def __init__(self, urls: list, args: BotArgs, obey_robots_txt: bool = True):
+    def __init__(self, urls: list, args: BotArgs, obey_robots_txt: bool = True, robots: RobotsCache = robots_cache,
+                 seen: SeenFilter = None, validators: ValidatorStore = None, hosts: HostController = host_controller,
+                 archive=None):
         """
         Initialize the IntrolixBot.
 
         Args:
             urls (list): List of URLs to scrape.
             obey_robots_txt (bool, optional): Whether to obey robots.txt. Defaults to True.
+            robots (RobotsCache, optional): robots policy cache. Defaults to the cache shared by all bots.
+            seen (SeenFilter, optional): URLs already crawled, left out of the extracted links.
+            validators (ValidatorStore, optional): ETag / Last-Modified of crawled pages, used to revisit
+                them with conditional requests.
+            hosts (HostController, optional): per-host concurrency and backoff. Defaults to the controller
+                shared by all bots.
+            archive (PageArchive, optional): archive the fetched pages are written to, to re-extract them later.
         """
         self.urls = urls
         self.obey_robots_txt = obey_robots_txt
+        self.robots_cache = robots
+        self.seen = seen
+        self.validators = validators
+        self.hosts = hosts
+        self.archive = archive
+        self._robots_pending = {}
         self.root_sites = root_sites()
         self.root_sites_netlocs = {urlparse(root_url).netloc for root_url in self.root_sites}
         self.good_tags = fetch_tags()
+        self.tag_matcher = TagMatcher(self.good_tags)
 
         # bot args
         self.TIMEOUT_SECONDS = args.TIMEOUT_SECONDS
         self.MAX_FETCH_SIZE = args.MAX_FETCH_SIZE
+        self.CHUNK_SIZE = args.CHUNK_SIZE
+        self.HTML_CONTENT_TYPES = args.HTML_CONTENT_TYPES
         self.BAD_URL_REGEX = args.BAD_URL_REGEX
         self.GOOD_URL_REGEX = args.GOOD_URL_REGEX
         self.DEFAULT_ENCODING = args.DEFAULT_ENCODING
         self.DEFAULT_ENC_ERRORS = args.DEFAULT_ENC_ERRORS
+        self.MAX_CONCURRENCY = args.MAX_CONCURRENCY
+        self.POOL_MAX_CONNECTIONS = args.POOL_MAX_CONNECTIONS
+        self.POOL_CONNECTIONS_PER_HOST = args.POOL_CONNECTIONS_PER_HOST
+        self.KEEPALIVE_SECONDS = args.KEEPALIVE_SECONDS
+        self.ROBOTS_CACHE_TTL = args.ROBOTS_CACHE_TTL
+        self.ROBOTS_NEGATIVE_TTL = args.ROBOTS_NEGATIVE_TTL
         self.ALLOWED_EXCEPTIONS = args.ALLOWED_EXCEPTIONS
 
-    def fetch(self, url:str) -> tuple[int, bytes]:
+        # keep-alive connections, one pool per thread for `fetch` and one per crawl for `fetch_async`
+        self.http = SyncHTTPPool(max_hosts=self.POOL_MAX_CONNECTIONS,
+                                 connections_per_host=self.POOL_CONNECTIONS_PER_HOST)
+        self.async_http = None
+
+    def __getstate__(self):
+        # locks, sockets and SQLite connections can't be pickled: a process pool worker
+        # uses the robots cache of its own process, a fresh connection pool and no seen filter
+        state = self.__dict__.copy()
+        state['robots_cache'] = None
+        state['hosts'] = None
+        state['seen'] = None
+        state['validators'] = None
+        state['archive'] = None
+        state['async_http'] = None
+        state['_robots_pending'] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.robots_cache = robots_cache
+        self.hosts = host_controller
+
+    def fetch(self, url: str, html_only: bool = True, headers: dict = None, timeout: float = None) -> FetchResult:
         """
         Function to fetch a URL.
 
+        The body is streamed into a preallocated buffer and the connection is dropped
+        as soon as the headers show a response that would be thrown away.
+
         Args:
             url (str): URL to fetch.
+            html_only (bool, optional): reject responses that are not HTML. Defaults to True.
+            headers (dict, optional): extra request headers.
+            timeout (float, optional): seconds allowed for the whole fetch. Defaults to `BotArgs.TIMEOUT_SECONDS`.
         Returns:
-            tuple[int, bytes]: status code and content.
+            FetchResult: status code, content, headers and size and timing fields.
         """
+        timeout = timeout or self.TIMEOUT_SECONDS
+        start = time.perf_counter()
+        r = self.http.session().get(url, stream=True, timeout=timeout, headers=headers)
 
-        r = requests.get(url, stream=True, timeout=self.TIMEOUT_SECONDS)
+        try:
+            result = FetchResult(url=url, status_code=r.status_code,
+                                 headers=FetchResult.normalize_headers(r.headers),
+                                 ttfb=time.perf_counter() - start)
 
-        size = 0
-        start = time.time()
+            if self.reject_from_headers(result, html_only):
+                return result
 
-        content = b""
-        for chunk in r.iter_content(1024):
-            if time.time() - start > self.TIMEOUT_SECONDS:
-                raise ValueError('Timeout reached')
+            body = BodyBuffer(self.MAX_FETCH_SIZE, self.content_length(result.headers))
+            for chunk in r.iter_content(self.CHUNK_SIZE):
+                if time.perf_counter() - start > timeout:
+                    raise ValueError('Timeout reached')
 
-            content += chunk
+                if not body.write(chunk):
+                    logger.debug(f"Maximum size reached for URL {url}")
+                    break
+        finally:
+            r.close()
 
-            size += len(chunk)
-            if size > self.MAX_FETCH_SIZE:
-                logger.debug(f"Maximum size reached for URL {url}")
-                break
+        result.content = body.getvalue()
+        result.bytes_read = body.size
+        result.truncated = body.truncated
+        result.elapsed = time.perf_counter() - start
+        return result
 
-        return r.status_code, content
+    async def fetch_async(self, session: aiohttp.ClientSession, url: str, html_only: bool = True,
+                          headers: dict = None, timeout: float = None) -> FetchResult:
+        """
+        Async version of `fetch`.
+
+        Args:
+            session (aiohttp.ClientSession): session the request is sent with.
+            url (str): URL to fetch.
+            html_only (bool, optional): reject responses that are not HTML. Defaults to True.
+            headers (dict, optional): extra request headers.
+            timeout (float, optional): seconds allowed for the whole fetch. Defaults to `BotArgs.TIMEOUT_SECONDS`.
+        Returns:
+            FetchResult: status code, content, headers and size and timing fields.
+        """
+        start = time.perf_counter()
+        timeout = aiohttp.ClientTimeout(total=timeout or self.TIMEOUT_SECONDS)
+
+        async with session.get(url, timeout=timeout, headers=headers) as r:
+            result = FetchResult(url=url, status_code=r.status,
+                                 headers=FetchResult.normalize_headers(r.headers),
+                                 ttfb=time.perf_counter() - start)
+
+            if self.reject_from_headers(result, html_only):
+                r.close()
+                return result
+
+            body = BodyBuffer(self.MAX_FETCH_SIZE, self.content_length(result.headers))
+            async for chunk in r.content.iter_chunked(self.CHUNK_SIZE):
+                if not body.write(chunk):
+                    logger.debug(f"Maximum size reached for URL {url}")
+                    # the rest of the body is not wanted, don't let the connection drain it
+                    r.close()
+                    break
+
+        result.content = body.getvalue()
+        result.bytes_read = body.size
+        result.truncated = body.truncated
+        result.elapsed = time.perf_counter() - start
+        return result
+
+    @staticmethod
+    def content_length(headers: dict) -> int | None:
+        value = headers.get('content-length', '')
+        return int(value) if value.isdigit() else None
+
+    def reject_from_headers(self, result: FetchResult, html_only: bool) -> bool:
+        """
+        Function to decide from the response headers whether the body is worth downloading.
+
+        Args:
+            result (FetchResult): fetch result holding the response headers. Marked as rejected when needed.
+            html_only (bool): reject responses that are not HTML.
+        Returns:
+            bool: True if the body should not be downloaded.
+        """
+        content_length = self.content_length(result.headers)
+        if content_length is not None and content_length > self.MAX_FETCH_SIZE:
+            result.rejected = 'ContentTooLarge'
+            result.rejected_reason = f"Content-Length {content_length} is over the {self.MAX_FETCH_SIZE} bytes limit"
+        elif html_only and result.content_type and result.content_type not in self.HTML_CONTENT_TYPES:
+            result.rejected = 'ContentTypeRejected'
+            result.rejected_reason = f"Content-Type {result.content_type} is not HTML"
+        else:
+            return False
+
+        logger.debug(f"Rejected URL {result.url}: {result.rejected_reason}")
+        result.elapsed = result.ttfb
+        return True
 
     def see_robots_txt(self, url: str) -> bool:
         """
         Function to check if robots.txt allows this bot to crawl.
 
         Args:
-            main_url (str): main root url of the site.
             url (str): URL to check.
         Returns:
             bool: True if the bot is allowed to crawl, False otherwise.
         """
         try:
             try:
-                parsed_url = urlparse(url)
+                urlparse(url)
             except ValueError:
                 logger.debug(f"Unable to parse URL: {url}")
                 return False
 
-            robots_url = urlunsplit((parsed_url.scheme, parsed_url.netloc, 'robots.txt', '', ''))
-            parse_robots = RobotFileParser(robots_url)
-
-            try:
-                status_code, content = self.fetch(robots_url)
-            except Exception as e:  # Catch all exceptions for now
-                logger.debug(f"Robots error: {robots_url}, {e}")
-                return True
+            start = time.perf_counter()
+            allowed = self.can_fetch(self.robots_policy(url), url)
+            ROBOTS_SECONDS.observe(time.perf_counter() - start, result='allowed' if allowed else 'denied',
+                                   host=host_of(url))
+            return allowed
+        except Exception as e:
+            raise CustomException(e, sys) from e
 
-            decoded = None
-            for encoding in ['utf-8', 'iso-8859-1']:
-                try:
-                    decoded = content.decode(encoding).splitlines()
-                    break
-                except UnicodeDecodeError:
-                    pass
+    async def see_robots_txt_async(self, session: aiohttp.ClientSession, url: str) -> bool:
+        """
+        Async version of `see_robots_txt`.
 
-            if decoded is None:
-                logger.debug(f"Unable to decode robots file {robots_url}")
-                return True
+        Args:
+            session (aiohttp.ClientSession): session the robots.txt request is sent with.
+            url (str): URL to check.
+        Returns:
+            bool: True if the bot is allowed to crawl, False otherwise.
+        """
+        try:
+            try:
+                urlparse(url)
+            except ValueError:
+                logger.debug(f"Unable to parse URL: {url}")
+                return False
 
-            parse_robots.parse(decoded)
-            allowed = parse_robots.can_fetch('IntrolixBot', url)  # Your bot's name
-            logger.debug(f"Robots allowed for {url}: {allowed} and {decoded} is decoded with {robots_url}")
+            start = time.perf_counter()
+            allowed = self.can_fetch(await self.robots_policy_async(session, url), url)
+            ROBOTS_SECONDS.observe(time.perf_counter() - start, result='allowed' if allowed else 'denied',
+                                   host=host_of(url))
             return allowed
         except Exception as e:
             raise CustomException(e, sys) from e
 
-    def get_urls_from_page(self, url: str) -> list:
+    def can_fetch(self, policy: RobotFileParser | None, url: str) -> bool:
+        """
+        Function to check a URL against a robots policy.
+
+        Args:
+            policy (RobotFileParser | None): parsed robots.txt, None if it could not be fetched.
+            url (str): URL to check.
+        Returns:
+            bool: True if the bot is allowed to crawl, False otherwise.
+        """
+        if policy is None:
+            return True
+
+        allowed = policy.can_fetch('IntrolixBot', url)  # Your bot's name
+        logger.debug(f"Robots allowed for {url}: {allowed}")
+        return allowed
+
+    def robots_policy(self, url: str) -> RobotFileParser | None:
+        """
+        Function to get the robots policy of the site of a URL, from cache when possible.
+
+        Args:
+            url (str): any URL on the site.
+        Returns:
+            RobotFileParser | None: parsed robots.txt, None if it could not be fetched.
+        """
+        entry = self.robots_cache.get(url)
+        if entry is not None:
+            return entry.parser
+
+        robots_url = self.robots_url(url)
+
+        try:
+            fetched = self.fetch(robots_url, html_only=False)
+        except Exception as e:  # Catch all exceptions for now
+            logger.debug(f"Robots error: {robots_url}, {e}")
+            return self.robots_cache.set(url, None, self.ROBOTS_NEGATIVE_TTL).parser
+
+        return self.cache_robots_txt(url, robots_url, fetched.content)
+
+    async def robots_policy_async(self, session: aiohttp.ClientSession, url: str) -> RobotFileParser | None:
+        """
+        Async version of `robots_policy`. Concurrent misses for the same site share one download.
+
+        Args:
+            session (aiohttp.ClientSession): session the robots.txt request is sent with.
+            url (str): any URL on the site.
+        Returns:
+            RobotFileParser | None: parsed robots.txt, None if it could not be fetched.
+        """
+        entry = self.robots_cache.get(url)
+        if entry is not None:
+            return entry.parser
+
+        key = self.robots_cache.key_for(url)
+        pending = self._robots_pending.get(key)
+
+        if pending is None:
+            pending = asyncio.ensure_future(self._download_robots_async(session, url))
+            self._robots_pending[key] = pending
+            pending.add_done_callback(lambda _: self._robots_pending.pop(key, None))
+
+        return await asyncio.shield(pending)
+
+    async def _download_robots_async(self, session: aiohttp.ClientSession, url: str) -> RobotFileParser | None:
+        robots_url = self.robots_url(url)
+
+        try:
+            fetched = await self.fetch_async(session, robots_url, html_only=False)
+        except Exception as e:  # Catch all exceptions for now
+            logger.debug(f"Robots error: {robots_url}, {e}")
+            return self.robots_cache.set(url, None, self.ROBOTS_NEGATIVE_TTL).parser
+
+        return self.cache_robots_txt(url, robots_url, fetched.content)
+
+    def crawl_delay(self, url: str) -> float | None:
+        """
+        Function to get the robots.txt crawl-delay of the site of a URL, if already known.
+
+        Args:
+            url (str): any URL on the site.
+        Returns:
+            float | None: crawl-delay in seconds.
+        """
+        return self.robots_cache.crawl_delay(url, 'IntrolixBot')
+
+    @staticmethod
+    def robots_url(url: str) -> str:
+        parsed_url = urlparse(url)
+        return urlunsplit((parsed_url.scheme, parsed_url.netloc, 'robots.txt', '', ''))
+
+    def cache_robots_txt(self, url: str, robots_url: str, content: bytes) -> RobotFileParser | None:
+        """
+        Function to parse a downloaded robots.txt and store it in the robots cache.
+
+        Args:
+            url (str): any URL on the site.
+            robots_url (str): URL of the robots.txt file.
+            content (bytes): raw robots.txt content.
+        Returns:
+            RobotFileParser | None: parsed robots.txt, None if it could not be decoded.
+        """
+        parse_robots = RobotFileParser(robots_url)
+
+        decoded = None
+        for encoding in ['utf-8', 'iso-8859-1']:
+            try:
+                decoded = content.decode(encoding).splitlines()
+                break
+            except UnicodeDecodeError:
+                pass
+
+        if decoded is None:
+            logger.debug(f"Unable to decode robots file {robots_url}")
+            return self.robots_cache.set(url, None, self.ROBOTS_NEGATIVE_TTL).parser
+
+        parse_robots.parse(decoded)
+        return self.robots_cache.set(url, parse_robots, self.ROBOTS_CACHE_TTL).parser
+
+    def get_urls_from_page(self, url: str, content: bytes = None, dom=None) -> list:
         """
         Function to get all URLs from a page.
 
         Args:
             url (str): URL of the page.
+            content (bytes, optional): already fetched page content. Fetched when not given.
+            dom (lxml.html.HtmlElement, optional): already parsed page. Takes precedence over `content`.
         Returns:
             list: List of URLs from the page.
         """
         try:
-            status_code, content = self.fetch(url)
-
-            if status_code != 200:
-                return []
-
-            soup = BeautifulSoup(content, 'html.parser')
-            urls = []
-
-            for link in soup.find_all('a'):
-                href = link.get('href')
-                if href:
-                    if not href.startswith('http'):
-                        href = urljoin(url, href)
-                    # if not self.BAD_URL_REGEX.search(href):
-                    #     href = href
-                    if self.GOOD_URL_REGEX.search(href):
-                        href_netloc = urlparse(href).netloc
-
-                        logger.debug(f"Checking href domain: {href_netloc} against root domains")
-
-                        if href_netloc in self.root_sites_netlocs:
-                            urls.append(href)
-                            
-            return list(set(urls))
-            
+            if dom is None:
+                if content is None:
+                    fetched = self.fetch(url)
+
+                    if fetched.status_code != 200:
+                        return []
+                    content = fetched.content
+                    content_type = fetched.headers.get('content-type')
+                else:
+                    content_type = None
+
+                dom = html_to_dom(content, self.DEFAULT_ENCODING, None, self.DEFAULT_ENC_ERRORS,
+                                  content_type=content_type, host=urlparse(url).netloc)
+
+            return self.extract_links(dom, url)
+
         except Exception as e:
             logger.info(f"Error occured while getting urls from page {e}")
             return []
             # raise CustomException(e, sys) from e
 
+    def extract_links(self, dom, url: str) -> list:
+        """
+        Function to get the crawlable links of a parsed page.
+
+        Args:
+            dom (lxml.html.HtmlElement): parsed page.
+            url (str): URL of the page, used to resolve relative links.
+        Returns:
+            list: unique URLs on the root sites linked from the page.
+        """
+        hrefs = [href for element, attribute, href, _ in dom.iterlinks()
+                 if element.tag == 'a' and attribute == 'href']
+        return self.filter_links(hrefs, url)
+
+    def filter_links(self, hrefs: list, url: str) -> list:
+        """
+        Function to keep the crawlable links among the `href` values of a page.
+
+        Args:
+            hrefs (list): raw `href` values of the page's anchors.
+            url (str): URL of the page, used to resolve relative links.
+        Returns:
+            list: URLs on the root sites linked from the page, one per canonical URL,
+                without fragments and tracking parameters.
+        """
+        urls = {}
+
+        for href in hrefs:
+            if not href:
+                continue
+
+            if not href.startswith('http'):
+                href = urljoin(url, href)
+            href = strip_tracking(href)
+            # if not self.BAD_URL_REGEX.search(href):
+            #     href = href
+            if self.GOOD_URL_REGEX.search(href):
+                href_netloc = urlparse(href).netloc
+
+                if href_netloc in self.root_sites_netlocs:
+                    # variants of the same page (case, trailing slash, www...) are kept once
+                    urls.setdefault(canonicalize_url(href), href)
+
+        if self.seen is not None:
+            # links to pages crawled before are not worth queueing again
+            return self.seen.filter_new(list(urls.values()))
+
+        return list(urls.values())
+
     def scrape(self, url: str) -> dict:
         """
         Function to scrape the site.
@@ -179,146 +523,288 @@ class IntrolixBot:
         try:
             logger.info(f"Crawling URL {url}")
             js_timestamp = int(time.time() * 1000)
+            host = host_of(url)
+
+            try:
+                self.hosts.check(host)
+            except HostBlocked as e:
+                return self.error_result(url, None, js_timestamp, 'HostBackoff', str(e))
 
             if self.obey_robots_txt:
                 allowed = self.see_robots_txt(url)
 
                 if not allowed:
-                    return {
-                        'url': url,
-                        'status': None,
-                        'timestamp': js_timestamp,
-                        'content': None,
-                        'error': {
-                            'name': 'RobotsDenied',
-                            'message': 'Robots do not allow this URL',
-                        }
-                    }
+                    return self.error_result(url, None, js_timestamp, 'RobotsDenied', 'Robots do not allow this URL')
 
             try:
-                status_code, content = self.fetch(url)
+                fetched = self.fetch(url, headers=self.revisit_headers(url),
+                                     timeout=self.hosts.timeout(host, self.TIMEOUT_SECONDS))
             except self.ALLOWED_EXCEPTIONS as e:
                 logger.debug(f"Exception crawling URl {url}: {e}")
-                return {
-                    'url': url,
-                    'status': None,
-                    'timestamp': js_timestamp,
-                    'content': None,
-                    'error': {
-                        'name': 'AbortError',
-                        'message': str(e),
-                    }
-                }
-
-            if len(content) == 0:
-                return {
-                    'url': url,
-                    'status': status_code,
-                    'timestamp': js_timestamp,
-                    'content': None,
-                    'error': {
-                        'name': 'NoResponseText',
-                        'message': 'No response found',
-                    }
-                }
+                self.hosts.record_failure(host, e.__class__.__name__)
+                return self.error_result(url, None, js_timestamp, 'AbortError', str(e))
 
-            try:
-                dom = html_to_dom(content, self.DEFAULT_ENCODING, None, self.DEFAULT_ENC_ERRORS)
-            except Exception as e:
-                logger.exception(f"Error parsing dom: {url}")
-                return {
-                    'url': url,
-                    'status': status_code,
-                    'timestamp': js_timestamp,
-                    'content': None,
-                    'error': {
-                    'name': e.__class__.__name__,
-                    'message': str(e),
-                }
-            }
-        
-            title_element = dom.xpath("//title")
-            title = ""
-            if len(title_element) > 0:
-                title_text = title_element[0].text
-                if title_text is not None:
-                    title = title_text.strip()
-
-
-            desc_element = dom.xpath("//meta[@name='description']")
-            desc = ""
-            if len(desc_element) > 0:
-                desc_text = desc_element[0].get('content')
-                if desc_text is not None:
-                    desc = desc_text.strip()
-
-            og_image_element = dom.xpath("//meta[@property='og:image']/@content")
-            if og_image_element:
-                image = og_image_element[0]
-            else:
-                image_elements = dom.xpath("//img")
-                image_urls = [urljoin(url, img.get("src")) for img in image_elements if img.get("src")]
-                if len(image_urls) > 0:
-                    image = image_urls[0]
-                else:
-                    image = ""
+            self.hosts.record_response(host, fetched.status_code, fetched.ttfb, fetched.headers.get('retry-after'))
+            return self.process_fetched(fetched, js_timestamp)
 
-            new_links = self.get_urls_from_page(url)
-            new_links = list(set(new_links))
+        except Exception as e:
+            raise CustomException(e, sys) from e
 
-            # Normalize extracted keywords to match the format in good_tags
-            normalized_title = re.split(r'[\s-]+', title.lower().translate(str.maketrans('', '',
-                                    string.punctuation)))
-            # Filter based on good_tags
-            tags = [tag for tag in self.good_tags if tag in normalized_title]
-            if not tags:
-                tags = ['general']
+    async def scrape_async(self, session: aiohttp.ClientSession, url: str) -> dict:
+        """
+        Async version of `scrape`. Network I/O is awaited, parsing runs inline.
 
+        Args:
+            session (aiohttp.ClientSession): session the requests are sent with.
+            url (str): URL to scrape.
+        Returns:
+            dict: scraped data, in the same format as `scrape`.
+        """
+        fetched, error, js_timestamp = await self.fetch_page_async(session, url)
+        if error is not None:
+            return error
 
-            date = dom.xpath("string(//meta[@property='article:published_time']/@content)")
+        try:
+            return self.process_fetched(fetched, js_timestamp)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    async def fetch_page_async(self, session: aiohttp.ClientSession, url: str) -> tuple:
+        """
+        Fetch stage of `scrape_async`: host slot, robots.txt check and page download.
+
+        Args:
+            session (aiohttp.ClientSession): session the requests are sent with.
+            url (str): URL to scrape.
+        Returns:
+            tuple: (fetched page, None, crawl time in milliseconds) or (None, error result, crawl time)
+                when the page could not be fetched.
+        """
+        try:
+            logger.info(f"Crawling URL {url}")
+            js_timestamp = int(time.time() * 1000)
+            host = host_of(url)
+
+            try:
+                # waits while the host is at its concurrency limit
+                async with self.hosts.slot(host):
+                    if self.obey_robots_txt:
+                        allowed = await self.see_robots_txt_async(session, url)
+
+                        if not allowed:
+                            return None, self.error_result(url, None, js_timestamp, 'RobotsDenied',
+                                                           'Robots do not allow this URL'), js_timestamp
 
-            # Fallback: Check JSON-LD for datePublished in <script>
-            if not date:
-                json_ld_date = dom.xpath("string(//script[@type='application/ld+json'])")
-                if json_ld_date:
-                    import json
                     try:
-                        data = json.loads(json_ld_date)
-                        date = data.get("datePublished", "").split("T")[0]
-                    except json.JSONDecodeError:
-                        pass
-
-            # Fallback: Look for <time> tag with datetime attribute
-            if not date:
-                date = dom.xpath("string(//time/@datetime)")
-
-            # Fallback: Check for common patterns with 'Last Updated'
-            if not date:
-                date = dom.xpath("string(//span[contains(text(), 'Last Updated')])")
-
-            # Clean up date format if necessary (for example, strip out extra text)
-            if date:
-                # Extract date pattern YYYY-MM-DD or similar
-                match = re.search(r"\d{4}-\d{2}-\d{2}", date) or re.search(r"\d{2} \w{3}, \d{4}", date)
-                date = match.group(0) if match else date
-
-
-            return {
-                'url': url,
-                'content': {
-                    'title': title,
-                    'desc': desc,
-                    'image': image,
-                    'tags': tags,
-                    'vote': 0,
-                    'links': sorted(new_links),
-                    'created_at': date if date else 'No date found'
-                },
-            }
+                        fetched = await self.fetch_async(session, url, headers=self.revisit_headers(url),
+                                                         timeout=self.hosts.timeout(host, self.TIMEOUT_SECONDS))
+                    except self.ALLOWED_EXCEPTIONS as e:
+                        logger.debug(f"Exception crawling URl {url}: {e}")
+                        self.hosts.record_failure(host, e.__class__.__name__)
+                        return None, self.error_result(url, None, js_timestamp, 'AbortError', str(e)), js_timestamp
+
+                    self.hosts.record_response(host, fetched.status_code, fetched.ttfb,
+                                               fetched.headers.get('retry-after'))
+            except HostBlocked as e:
+                return None, self.error_result(url, None, js_timestamp, 'HostBackoff', str(e)), js_timestamp
+
+            return fetched, None, js_timestamp
 
         except Exception as e:
             raise CustomException(e, sys) from e
 
+    def revisit_headers(self, url: str) -> dict:
+        """
+        Function to get the conditional request headers of a page crawled before.
+
+        Args:
+            url (str): URL about to be fetched.
+        Returns:
+            dict: `If-None-Match` / `If-Modified-Since` headers, empty without validators.
+        """
+        if self.validators is None:
+            return {}
+        return self.validators.conditional_headers(url)
+
+    def process_fetched(self, fetched: FetchResult, js_timestamp: int) -> dict:
+        """
+        Function to turn a fetched page into scraped data.
+
+        A 304 answer to a conditional request is returned as a `NotModified` error
+        without parsing, so nothing is written for the page. A 429 or 503 answer is
+        returned as a `Throttled` error, the page has to be fetched again later.
+
+        Args:
+            fetched (FetchResult): fetched page.
+            js_timestamp (int): time of the crawl in milliseconds.
+        Returns:
+            dict: scraped data.
+        """
+        result = self.check_fetched(fetched, js_timestamp)
+        if result is not None:
+            return result
+
+        parse_start = time.perf_counter()
+        result = self.parse_page(fetched, js_timestamp)
+        return self.finish_page(fetched, result, time.perf_counter() - parse_start, js_timestamp)
+
+    def check_fetched(self, fetched: FetchResult, js_timestamp: int) -> dict | None:
+        """
+        Function to record a fetch and get the result of the pages that are not parsed (304, 429, 503).
+
+        Args:
+            fetched (FetchResult): fetched page.
+            js_timestamp (int): time of the crawl in milliseconds.
+        Returns:
+            dict | None: error result, None if the page has to be parsed.
+        """
+        self.observe_fetch(fetched)
+
+        if fetched.status_code == 304:
+            if self.validators is not None:
+                self.validators.record_not_modified(fetched.url)
+            result = self.error_result(fetched.url, 304, js_timestamp, 'NotModified',
+                                       'Page not modified since the last crawl')
+        elif fetched.status_code in THROTTLE_STATUSES:
+            result = self.error_result(fetched.url, fetched.status_code, js_timestamp, 'Throttled',
+                                       f'Host answered {fetched.status_code}')
+        else:
+            return None
+
+        result['fetch'] = fetched.stats()
+        return result
+
+    def finish_page(self, fetched: FetchResult, result: dict, parse_seconds: float, js_timestamp: int,
+                    record: bytes = None) -> dict:
+        """
+        Function to store the validators and archive record of a parsed page and add the fetch stats to its result.
+
+        Args:
+            fetched (FetchResult): fetched page.
+            result (dict): result of `parse_page`.
+            parse_seconds (float): seconds spent parsing the page.
+            js_timestamp (int): time of the crawl in milliseconds.
+            record (bytes, optional): archive record of the page, when it was encoded by a parse worker.
+        Returns:
+            dict: scraped data.
+        """
+        if self.validators is not None and fetched.status_code == 200 and result.get('content') is not None:
+            self.validators.record(fetched.url, fetched.headers, fetched.bytes_read, parse_seconds)
+
+        # pages that failed to parse are archived too, a later extraction may handle them
+        if self.archive is not None and fetched.status_code == 200 and fetched.content:
+            self.archive.append(fetched, js_timestamp, record=record)
+
+        result['fetch'] = fetched.stats()
+        result['fetch']['parse_seconds'] = round(parse_seconds, 4)
+        return result
+
+    @staticmethod
+    def observe_fetch(fetched: FetchResult):
+        """
+        Function to record the time to first byte, download time and size of a fetch in the crawler metrics.
+
+        Args:
+            fetched (FetchResult): fetched page.
+        """
+        host = host_of(fetched.url)
+        FETCH_PHASE_SECONDS.observe(fetched.ttfb, phase='ttfb', host=host)
+
+        if not fetched.rejected:
+            FETCH_PHASE_SECONDS.observe(max(fetched.elapsed - fetched.ttfb, 0.0), phase='download', host=host)
+            FETCH_BYTES.inc(fetched.bytes_read, host=host)
+
+    @staticmethod
+    def error_result(url: str, status_code, timestamp: int, name: str, message: str) -> dict:
+        """
+        Function to build the result of a page that could not be scraped. Counted in the page metrics.
+
+        Args:
+            url (str): URL of the page.
+            status_code (int | None): HTTP status code, if any.
+            timestamp (int): time of the crawl in milliseconds.
+            name (str): error name.
+            message (str): error message.
+        Returns:
+            dict: scraped data without content.
+        """
+        PAGES.inc(outcome=name, host=host_of(url))
+        return {
+            'url': url,
+            'status': status_code,
+            'timestamp': timestamp,
+            'content': None,
+            'error': {
+                'name': name,
+                'message': message,
+            }
+        }
+
+    def parse_page(self, fetched: FetchResult, js_timestamp: int) -> dict:
+        """
+        Function to extract the page data from fetched content.
+
+        Args:
+            fetched (FetchResult): fetched page.
+            js_timestamp (int): time of the crawl in milliseconds.
+        Returns:
+            dict: scraped data.
+        """
+        url, status_code, content = fetched.url, fetched.status_code, fetched.content
+
+        if fetched.rejected:
+            return self.error_result(url, status_code, js_timestamp, fetched.rejected, fetched.rejected_reason)
+
+        if len(content) == 0:
+            return self.error_result(url, status_code, js_timestamp, 'NoResponseText', 'No response found')
+
+        host = host_of(url)
+
+        try:
+            with PARSE_SECONDS.time(stage='dom', host=host):
+                # decoded with the charset of the Content-Type header, or the one cached for the host
+                dom = html_to_dom(content, self.DEFAULT_ENCODING, None, self.DEFAULT_ENC_ERRORS,
+                                  content_type=fetched.headers.get('content-type'), host=host)
+        except Exception as e:
+            logger.exception(f"Error parsing dom: {url}")
+            return self.error_result(url, status_code, js_timestamp, e.__class__.__name__, str(e))
+
+        # title, description, image, date and anchors in a single walk of the document
+        with PARSE_SECONDS.time(stage='metadata', host=host):
+            metadata = extract_metadata(dom, url)
+
+        # links come from the DOM built above, the page is not downloaded again
+        with PARSE_SECONDS.time(stage='links', host=host):
+            new_links = self.filter_links(metadata.links, url) if status_code == 200 else []
+
+        # Single and multi-token tags found in one pass over the title and description
+        with PARSE_SECONDS.time(stage='tags', host=host):
+            tags = self.tag_matcher.match(metadata.title, metadata.desc)
+        if not tags:
+            tags = ['general']
+
+        # SimHash of the article, syndicated copies on other URLs get a close fingerprint
+        with PARSE_SECONDS.time(stage='fingerprint', host=host):
+            simhash = fingerprint(metadata.title, metadata.desc, metadata.text)
+
+        PAGES.inc(outcome='ok', host=host)
+
+        return {
+            'url': url,
+            # dedup key of the page, from its <link rel="canonical"> when it declares one
+            'canonical_url': canonical_link(metadata.canonical, url),
+            'simhash': to_int64(simhash),
+            'content': {
+                'title': metadata.title,
+                'desc': metadata.desc,
+                'image': metadata.image,
+                'tags': tags,
+                'vote': 0,
+                'links': sorted(new_links),
+                'created_at': metadata.date if metadata.date else 'No date found'
+            },
+        }
+
     def batch_converter(self, lst: list, batch_size: int):
         """
         Convert list into batches of a specified size.
@@ -330,33 +816,99 @@ class IntrolixBot:
         for i in range(0, len(lst), batch_size):
             yield lst[i:i + batch_size]
 
-    def scrape_parallel(self, batch_size: int):
+    async def crawl_async(self, urls: list, max_concurrency: int = None):
         """
-        Process scrape in parallel using multiprocessing.
+        Scrape URLs concurrently with a bounded number of requests in flight.
 
         Args:
             urls (list): List of site URLs to process.
-            batch_size (int): Number of URLs to process in each batch.
-        Returns:
-            
+            max_concurrency (int, optional): maximum number of pages fetched at once.
+                Defaults to `BotArgs.MAX_CONCURRENCY`.
+        Yields:
+            dict: scraped data of each URL, in the order the pages finish.
         """
-        num_workers = max(1, os.cpu_count() - 1)
-        # getting urls in batch
-        batch_url = list(self.batch_converter(self.urls, batch_size))
+        num_workers = max(1, min(max_concurrency or self.MAX_CONCURRENCY, len(urls)))
+        url_iter = iter(urls)
+        results = asyncio.Queue()
+
+        self.async_http = AsyncHTTPPool(max_connections=self.POOL_MAX_CONNECTIONS,
+                                        connections_per_host=self.POOL_CONNECTIONS_PER_HOST,
+                                        keepalive_seconds=self.KEEPALIVE_SECONDS)
+
+        async with self.async_http.session() as session:
+            async def worker():
+                try:
+                    # every worker pulls from the same iterator, so at most
+                    # `num_workers` pages are in flight at any time
+                    for url in url_iter:
+                        await results.put(await self.scrape_async(session, url))
+                except Exception as e:
+                    await results.put(e)
+                finally:
+                    await results.put(None)
+
+            workers = [asyncio.create_task(worker()) for _ in range(num_workers)]
+
+            try:
+                finished = 0
+                while finished < num_workers:
+                    result = await results.get()
+                    if result is None:
+                        finished += 1
+                    elif isinstance(result, Exception):
+                        raise result
+                    else:
+                        yield result
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                await self.async_http.close()
+
+    def scrape_parallel(self, batch_size: int):
+        """
+        Process scrape concurrently using the asyncio crawl engine.
+
+        Args:
+            batch_size (int): Number of scraped pages to yield at once.
+        Yields:
+            list: scraped data of `batch_size` pages, in the order the pages finish.
+        """
+        loop = asyncio.new_event_loop()
+        results = self.crawl_async(self.urls)
 
         try:
-            # Create a multiprocessing pool
-            with multiprocessing.Pool(processes=num_workers) as pool:
-                for batch in batch_url:
-                    results = pool.map(self.scrape, batch)
-                    # data = list([sublist for sublist in results])
+            batch = []
+            while True:
+                try:
+                    batch.append(loop.run_until_complete(results.__anext__()))
+                except StopAsyncIteration:
+                    break
+
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+
+            if batch:
+                yield batch
+        finally:
+            loop.run_until_complete(results.aclose())
+            loop.close()
+            logger.info(f"Robots cache stats: {self.robots_cache.stats()}")
+            logger.info(f"Connection pool stats: {self.pool_stats()}")
+
+    def pool_stats(self) -> dict:
+        """
+        Function to report connection reuse of the bot's HTTP pools.
+
+        Returns:
+            dict: stats of the pool of `fetch` and of the pool of the last async crawl.
+        """
+        return {
+            'sync': self.http.stats(),
+            'async': self.async_http.stats() if self.async_http is not None else None,
+        }
 
-                    yield results
-                    time.sleep(0.1)
-        except IOError as e:
-            if e.errno == errno.EPIPE:
-                pass
-            
     def get_urls_from_page_parallel(self, urls: list, batch_size: int):
         """
         Process get_urls_from_page in parallel using multiprocessing.
@@ -0,0 +1,156 @@
+from dataclasses import dataclass, field
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+
+from introlix_api.logger import logger
+from introlix_api.utils.canonical import canonicalize_url
+from introlix_api.utils.fingerprint import band_keys, from_int64, MAX_DISTANCE
+from introlix_api.crawler.metrics import metrics, WRITE_SECONDS
+
+DUPLICATE_KEY = 11000
+
+BULK_WRITTEN = metrics.counter("crawler_bulk_written_documents_total", "Documents sent to a bulk upsert by result",
+                               ("store", "result"))
+
+
+@dataclass
+class BulkWriteReport:
+    inserted: int = 0                                   # documents stored for the first time
+    updated: int = 0                                    # stored documents changed by the batch
+    duplicates: int = 0                                 # already stored or repeated, unchanged by a refresh
+    inserted_urls: list = field(default_factory=list)  # url of the inserted documents
+
+
+def content_update(result: dict, max_distance: int = MAX_DISTANCE) -> dict:
+    """
+    Function to get the fields of a stored article a new extraction of its page replaces.
+
+    Args:
+        result (dict): scraped data of the page, with its content and fingerprint.
+        max_distance (int, optional): Hamming distance of the near-duplicate bands. Defaults to 3.
+    Returns:
+        dict: `$set` of the content (but the votes), fingerprint and fingerprint bands.
+    """
+    # votes belong to the stored article, not to the extraction
+    fields = {f"content.{key}": value for key, value in result["content"].items() if key != 'vote'}
+    fields["simhash"] = result.get("simhash")
+    # pages without words have no fingerprint, nor bands to be found by
+    fields["simhash_bands"] = (band_keys(from_int64(result["simhash"]), max_distance)
+                               if result.get("simhash") is not None else [])
+    return fields
+
+
+class BulkWriter:
+    """
+    Writer of new documents keyed on their canonical URL, shared by every ingestion path.
+
+    A batch is one unordered `bulk_write` of upserts that only set the document
+    when it is inserted (`$setOnInsert`), so stored documents keep their votes and
+    insertion time, and a duplicate does not stop the rest of the batch. A unique
+    index on the canonical URL makes concurrent writers of the same page insert it
+    once, the loser's upsert fails with a duplicate key error counted as a duplicate.
+
+    Documents stored before canonical URLs are matched on their url, and get their
+    canonical URL when a batch meets them again. The unique index is partial, on the
+    documents that have one.
+
+    Pages fetched again because they changed go through `refresh`, which updates the
+    stored article in place and never inserts.
+    """
+    def __init__(self, collection, key: str = "canonical_url", store: str = "mongo"):
+        """
+        Initialize the BulkWriter.
+
+        Args:
+            collection (pymongo.collection.Collection): collection the documents go to.
+            key (str, optional): field of the canonical URL, computed from `url` when missing.
+                Defaults to "canonical_url".
+            store (str, optional): store label of the metrics. Defaults to "mongo".
+        """
+        self.collection = collection
+        self.key = key
+        self.store = store
+
+    def ensure_indexes(self):
+        """
+        Function to create the unique index of the canonical URL and the index of the url.
+        """
+        self.collection.create_index("url")
+        try:
+            self.collection.create_index([(self.key, ASCENDING)], unique=True,
+                                         partialFilterExpression={self.key: {"$type": "string"}})
+        except OperationFailure as e:
+            # pages stored twice before the index existed, upserts still match the stored copy
+            logger.error(f"Unique index on {self.key} not created, remove the duplicates first: {e}")
+
+    def _requests(self, documents: list) -> tuple:
+        requests, urls, repeated, keys = [], [], 0, set()
+        for d in documents:
+            key = d.get(self.key) or canonicalize_url(d["url"])
+            if key in keys:
+                repeated += 1
+                continue
+            keys.add(key)
+
+            fields = {name: value for name, value in d.items() if name not in ("_id", self.key)}
+            requests.append(UpdateOne({"$or": [{self.key: key}, {"url": d["url"]}]},
+                                      {"$set": {self.key: key}, "$setOnInsert": fields}, upsert=True))
+            urls.append(d["url"])
+        return requests, urls, repeated
+
+    def write(self, documents: list) -> BulkWriteReport:
+        """
+        Function to store the documents not stored yet, in one round trip.
+
+        Args:
+            documents (list): documents with a `url`, their canonical URL is set when missing.
+        Returns:
+            BulkWriteReport: inserted, updated and duplicate documents.
+        """
+        requests, urls, repeated = self._requests(documents)
+        if not requests:
+            return BulkWriteReport(duplicates=repeated)
+
+        with WRITE_SECONDS.time(store=self.store, operation='bulk_upsert'):
+            try:
+                result = self.collection.bulk_write(requests, ordered=False).bulk_api_result
+            except BulkWriteError as e:
+                result = e.details
+                errors = [error for error in result.get("writeErrors", []) if error.get("code") != DUPLICATE_KEY]
+                if errors:
+                    raise
+
+        upserted = result.get("upserted", [])
+        report = BulkWriteReport(
+            inserted=len(upserted),
+            updated=result.get("nModified", 0),
+            duplicates=repeated + len(requests) - len(upserted) - result.get("nModified", 0),
+            inserted_urls=[urls[item["index"]] for item in upserted],
+        )
+        BULK_WRITTEN.inc(report.inserted, store=self.store, result='inserted')
+        BULK_WRITTEN.inc(report.updated, store=self.store, result='updated')
+        BULK_WRITTEN.inc(report.duplicates, store=self.store, result='duplicate')
+        return report
+
+    def refresh(self, results: list, max_distance: int = MAX_DISTANCE) -> BulkWriteReport:
+        """
+        Function to replace the content of stored articles with a new extraction, in one round trip.
+
+        Args:
+            results (list): scraped data of pages fetched again, with their content.
+            max_distance (int, optional): Hamming distance of the near-duplicate bands. Defaults to 3.
+        Returns:
+            BulkWriteReport: articles updated, the others were unchanged or are not stored.
+        """
+        requests = [UpdateOne({"$or": [{self.key: d.get(self.key) or canonicalize_url(d["url"])}, {"url": d["url"]}]},
+                              {"$set": content_update(d, max_distance)})
+                    for d in results if d.get("content") is not None]
+        if not requests:
+            return BulkWriteReport()
+
+        with WRITE_SECONDS.time(store=self.store, operation='bulk_refresh'):
+            updated = self.collection.bulk_write(requests, ordered=False).bulk_api_result.get("nModified", 0)
+
+        BULK_WRITTEN.inc(updated, store=self.store, result='refreshed')
+        return BulkWriteReport(updated=updated, duplicates=len(requests) - updated)
@@ -0,0 +1,138 @@
+import os
+import json
+import socket
+import time
+
+from introlix_api.logger import logger
+from introlix_api.crawler.frontier import URLFrontier
+from introlix_api.crawler.seen import SeenFilter
+
+CHECKPOINT_KEY = "checkpoint"
+
+
+class CrawlCheckpoint:
+    """
+    Periodic checkpoint of a crawl, and its recovery after a crash or restart.
+
+    The frontier and the exact store of the seen filter are written as the crawl
+    goes. The checkpoint saves the rest: the Bloom filter, the session state kept in
+    memory (when it started, whether its seeds were queued, ...) and a snapshot of
+    the frontier, in the frontier's meta table.
+
+    On startup `resume` settles the leases left by a dead crawler process: pages the
+    store already has are acked without fetching them again, the others go back to
+    the queue at once instead of waiting for their lease to expire.
+    """
+    def __init__(self, frontier: URLFrontier, seen: SeenFilter = None, interval: float = 30.0):
+        """
+        Initialize the CrawlCheckpoint.
+
+        Args:
+            frontier (URLFrontier): frontier of the crawl, the checkpoint is stored in its meta table.
+            seen (SeenFilter, optional): URLs already crawled, its Bloom filter is saved with each checkpoint.
+            interval (float, optional): minimum seconds between two saves by `maybe_save`. Defaults to 30.
+        """
+        self.frontier = frontier
+        self.seen = seen
+        self.interval = interval
+        self.state = self.load()
+        self._last_save = time.monotonic()
+
+    def load(self) -> dict:
+        """
+        Function to read the last checkpoint.
+
+        Returns:
+            dict: session state of the last checkpoint, empty if there is none.
+        """
+        value = self.frontier.get_meta(CHECKPOINT_KEY)
+        if not value:
+            return {}
+
+        try:
+            return json.loads(value).get('state', {})
+        except (ValueError, AttributeError):
+            logger.info("Ignoring an unreadable crawl checkpoint")
+            return {}
+
+    def update(self, **state):
+        """
+        Function to change the session state, written by the next save.
+        """
+        self.state.update(state)
+
+    def save(self):
+        """
+        Function to write a checkpoint now.
+        """
+        if self.seen is not None:
+            self.seen.save()
+
+        self.frontier.set_meta(CHECKPOINT_KEY, json.dumps({
+            'saved_at': time.time(),
+            'owner': self.frontier.owner,
+            'frontier': self.frontier.stats(),
+            'state': self.state,
+        }))
+        self._last_save = time.monotonic()
+
+    def maybe_save(self):
+        """
+        Function to write a checkpoint if `interval` passed since the last one.
+        """
+        if time.monotonic() - self._last_save >= self.interval:
+            self.save()
+
+    def is_orphaned(self, owner: str | None) -> bool:
+        """
+        Function to check if a lease owner is a crawler process that is gone.
+
+        Leases of this process's own name are orphaned too: `resume` runs before this
+        process leases anything, so they were left by an earlier process with the same
+        pid, as happens when a container restarts. Owners on other machines are never
+        orphaned, their leases expire on their own.
+
+        Args:
+            owner (str | None): `host:pid` of the lease owner.
+        Returns:
+            bool: True if the lease can be taken back.
+        """
+        if not owner:
+            return True
+        if owner == self.frontier.owner:
+            return True
+
+        host, _, pid = owner.rpartition(':')
+        if host != socket.gethostname() or not pid.isdigit():
+            return False
+
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            return False  # alive, run by another user
+        return False
+
+    def resume(self, is_written) -> dict:
+        """
+        Function to settle the leases of dead crawler processes.
+
+        Args:
+            is_written (callable): called with a list of URLs, returns those whose result is already stored.
+        Returns:
+            dict: orphaned leases found, acked because already stored, and released to be crawled again.
+        """
+        orphaned = [url for url, owner, _ in self.frontier.leases() if self.is_orphaned(owner)]
+        written = set(is_written(orphaned)) if orphaned else set()
+
+        for url in orphaned:
+            if url in written:
+                self.frontier.ack(url)
+            else:
+                self.frontier.release(url)
+
+        stats = {'orphaned': len(orphaned), 'acked': len(written & set(orphaned)),
+                 'released': len(set(orphaned) - written)}
+        logger.info(f"Resumed crawl from checkpoint {self.state}: {stats}")
+        return stats
@@ -0,0 +1,537 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from urllib.parse import urlparse, urljoin
+from xml.etree.ElementTree import XMLPullParser, ParseError
+
+from introlix_api.logger import logger
+from introlix_api.crawler.bot import IntrolixBot
+from introlix_api.crawler.throttle import HostBlocked
+from introlix_api.crawler.metrics import metrics
+from introlix_api.utils.canonical import canonicalize_url, strip_tracking
+
+DISCOVERED = metrics.counter("crawler_discovered_urls_total", "URLs read from sitemaps and feeds",
+                             ("result", "kind"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    lastmod TEXT,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS sources (
+    url TEXT PRIMARY KEY,
+    site TEXT NOT NULL,
+    kind TEXT,
+    lastmod TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    status INTEGER,
+    entries INTEGER NOT NULL DEFAULT 0,
+    checked_at REAL NOT NULL
+);
+"""
+
+# feed locations tried on every root site, relative to the root URL
+FEED_PATHS = ('feed', 'rss.xml', 'atom.xml', 'feed.xml', 'index.xml')
+ENTRY_TAGS = ('url', 'sitemap', 'item', 'entry')
+DOCUMENT_KINDS = ('urlset', 'sitemapindex', 'rss', 'RDF', 'feed')
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1] if tag[:1] == '{' else tag
+
+
+def _child_text(el, *names: str) -> str | None:
+    for name in names:
+        for child in el:
+            if _local_name(child.tag) == name and child.text and child.text.strip():
+                return child.text.strip()
+    return None
+
+
+@dataclass
+class FeedEntry:
+    url: str
+    lastmod: str | None
+    kind: str  # 'page' or 'sitemap' (a child of a sitemap index)
+
+
+class FeedParser:
+    """
+    Incremental parser of sitemaps, sitemap indexes, RSS and Atom feeds.
+
+    Bytes are fed as they are downloaded, gzipped documents are inflated on the fly,
+    and entries are dropped from the tree once read, so memory stays flat whatever
+    the size of the document.
+    """
+    def __init__(self, max_bytes: int = 50 * 1024 * 1024):
+        """
+        Initialize the FeedParser.
+
+        Args:
+            max_bytes (int, optional): uncompressed bytes after which the document is cut. Defaults to 50MB,
+                the limit of the sitemap protocol.
+        """
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.kind = None  # name of the root element: urlset, sitemapindex, rss, feed, ...
+        self._parser = XMLPullParser(events=('start', 'end'))
+        self._inflate = None
+        self._started = False
+        self._head = b''
+        self._stack = []
+
+    @property
+    def full(self) -> bool:
+        return self.size >= self.max_bytes
+
+    def feed(self, chunk: bytes) -> list:
+        """
+        Function to parse the next bytes of the document.
+
+        Args:
+            chunk (bytes): raw bytes, gzipped or not.
+        Returns:
+            list: FeedEntry of every entry completed by these bytes.
+        """
+        if not self._started:
+            # the gzip magic may be split across the first chunks
+            self._head += chunk
+            if len(self._head) < len(GZIP_MAGIC):
+                return []
+            chunk, self._head = self._head, b''
+            self._started = True
+            if chunk.startswith(GZIP_MAGIC):
+                self._inflate = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+        if self._inflate is not None:
+            chunk = self._inflate.decompress(chunk, max(self.max_bytes - self.size, 1))
+        else:
+            chunk = chunk[:max(self.max_bytes - self.size, 0)]
+
+        self.size += len(chunk)
+        self._parser.feed(chunk)
+        return list(self._read_entries())
+
+    def close(self) -> list:
+        """
+        Function to end the document. A document cut by `max_bytes` is not an error.
+
+        Returns:
+            list: FeedEntry of the entries completed by the end of the document.
+        """
+        if self._head:
+            # document shorter than the gzip magic
+            self._parser.feed(self._head)
+            self._head = b''
+        try:
+            self._parser.close()
+        except ParseError:
+            if not self.full:
+                raise
+        return list(self._read_entries())
+
+    def _read_entries(self):
+        for event, el in self._parser.read_events():
+            if event == 'start':
+                if self.kind is None:
+                    self.kind = _local_name(el.tag)
+                self._stack.append(el)
+                continue
+
+            self._stack.pop()
+            name = _local_name(el.tag)
+            if name not in ENTRY_TAGS:
+                continue
+
+            entry = self._entry(name, el)
+            if self._stack:
+                # read entries are not needed anymore
+                self._stack[-1].remove(el)
+            if entry is not None:
+                yield entry
+
+    def _entry(self, name: str, el) -> FeedEntry | None:
+        if name in ('url', 'sitemap'):
+            loc = _child_text(el, 'loc')
+            if loc is None:  # <url> of an RSS <image>
+                return None
+            return FeedEntry(loc, _child_text(el, 'lastmod'), 'sitemap' if name == 'sitemap' else 'page')
+
+        if name == 'item':  # RSS
+            link = _child_text(el, 'link')
+            guid = _child_text(el, 'guid')
+            if link is None and guid is not None and guid.startswith(('http://', 'https://')):
+                link = guid
+            if link is None:
+                return None
+            return FeedEntry(link, _child_text(el, 'updated', 'date', 'pubDate'), 'page')
+
+        # Atom
+        link = None
+        for child in el:
+            if _local_name(child.tag) == 'link' and child.get('href') and child.get('rel', 'alternate') == 'alternate':
+                link = child.get('href').strip()
+                break
+        if link is None:
+            return None
+        return FeedEntry(link, _child_text(el, 'updated', 'published'), 'page')
+
+
+class SitemapStore:
+    """
+    `lastmod` of every URL read from sitemaps and feeds, and the state of each sitemap or feed.
+    """
+    def __init__(self, path: str):
+        """
+        Initialize the SitemapStore.
+
+        Args:
+            path (str): SQLite file of the store. Created if missing.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def source(self, url: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute("SELECT kind, lastmod, etag, last_modified, status, entries, checked_at "
+                                     "FROM sources WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('kind', 'lastmod', 'etag', 'last_modified', 'status', 'entries', 'checked_at'), row))
+
+    def record_source(self, url: str, site: str, kind: str | None, status: int | None, headers: dict = None,
+                      lastmod: str = None, entries: int = 0):
+        """
+        Function to store the outcome of fetching a sitemap or feed.
+
+        Args:
+            url (str): sitemap or feed URL.
+            site (str): root site it was found for.
+            kind (str | None): root element of the document, None if it was not XML.
+            status (int | None): HTTP status, None if the request failed.
+            headers (dict, optional): response headers, lower-cased names.
+            lastmod (str, optional): `lastmod` given by the sitemap index.
+            entries (int, optional): entries read from the document.
+        """
+        headers = headers or {}
+        with self._lock:
+            if status == 304:
+                self._conn.execute("UPDATE sources SET checked_at = ?, status = 304 WHERE url = ?", (time.time(), url))
+            else:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sources (url, site, kind, lastmod, etag, last_modified, status, entries, "
+                    "checked_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (url, site, kind, lastmod, headers.get('etag'), headers.get('last-modified'), status, entries,
+                     time.time()),
+                )
+            self._conn.commit()
+
+    def update_entries(self, entries: list) -> tuple:
+        """
+        Function to store the `lastmod` of page entries and sort out the new and changed ones.
+
+        Args:
+            entries (list): FeedEntry of pages.
+        Returns:
+            tuple: (new, changed) lists of FeedEntry. A URL is only changed when both the stored and the
+                new entry have a `lastmod`.
+        """
+        now = time.time()
+        by_key = {}
+        for entry in entries:
+            # a URL in a sitemap and a feed keeps the entry that has a lastmod
+            key = canonicalize_url(entry.url)
+            if key not in by_key or entry.lastmod is not None:
+                by_key[key] = entry
+        entries = by_key
+        if not entries:
+            return [], []
+
+        new, changed = [], []
+        with self._lock:
+            keys = list(entries)
+            known = {}
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self._conn.execute(f"SELECT key, lastmod FROM entries WHERE key IN ({','.join('?' * len(chunk))})",
+                                          chunk)
+                known.update(rows)
+
+            for key, entry in entries.items():
+                if key not in known:
+                    new.append(entry)
+                elif entry.lastmod is not None and known[key] is not None and entry.lastmod != known[key]:
+                    changed.append(entry)
+
+            self._conn.executemany(
+                "INSERT INTO entries (key, lastmod, first_seen, last_seen) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET lastmod = COALESCE(excluded.lastmod, lastmod), last_seen = excluded.last_seen",
+                [(key, entry.lastmod, now, now) for key, entry in entries.items()],
+            )
+            self._conn.commit()
+
+        return new, changed
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+@dataclass
+class DiscoveryResult:
+    new: list = field(default_factory=list)      # URLs never listed before
+    changed: list = field(default_factory=list)  # URLs listed again with another lastmod
+    covered: list = field(default_factory=list)  # root sites with at least one working sitemap or feed
+    fetched: int = 0                             # sitemaps and feeds downloaded
+    not_modified: int = 0                        # sitemaps and feeds skipped by lastmod or a 304
+    entries: int = 0                             # page entries read
+
+
+class SiteDiscovery:
+    """
+    Finds the articles of root sites from their sitemaps and RSS/Atom feeds.
+
+    Sitemaps come from the `Sitemap:` lines of robots.txt, `/sitemap.xml` otherwise,
+    and feeds from a few usual locations. Documents are parsed while downloading,
+    children of a sitemap index whose `lastmod` did not change are skipped, and
+    revisits send the `ETag` / `Last-Modified` of the last download. Only URLs that
+    are new, or listed with a new `lastmod`, are returned to be crawled.
+    """
+    def __init__(self, store: SitemapStore, bot: IntrolixBot, url_filter=None, feed_paths: tuple = FEED_PATHS,
+                 max_depth: int = 2, max_documents: int = 50, max_urls: int = 50_000, recheck_missing: float = 7 * 24 * 3600,
+                 timeout: float = 30.0, workers: int = 8):
+        """
+        Initialize the SiteDiscovery.
+
+        Args:
+            store (SitemapStore): lastmod of the URLs already listed.
+            bot (IntrolixBot): bot whose HTTP pool, robots cache and host controller are used.
+            url_filter (callable, optional): only URLs it returns True for are kept, e.g. `filter_urls`.
+            feed_paths (tuple, optional): feed locations tried, relative to the root URL.
+            max_depth (int, optional): nesting of sitemap indexes followed. Defaults to 2.
+            max_documents (int, optional): sitemaps and feeds downloaded per site. Defaults to 50.
+            max_urls (int, optional): page entries read per site. Defaults to 50 000.
+            recheck_missing (float, optional): seconds before a location that was not a sitemap or feed
+                is tried again. Defaults to a week.
+            timeout (float, optional): seconds allowed for one download. Defaults to 30.
+            workers (int, optional): sites discovered in parallel. Defaults to 8.
+        """
+        self.store = store
+        self.bot = bot
+        self.url_filter = url_filter
+        self.feed_paths = feed_paths
+        self.max_depth = max_depth
+        self.max_documents = max_documents
+        self.max_urls = max_urls
+        self.recheck_missing = recheck_missing
+        self.timeout = timeout
+        self.workers = workers
+
+    def sources(self, root_url: str) -> list:
+        """
+        Function to list the sitemaps and feeds to read for a root site.
+
+        Args:
+            root_url (str): root site.
+        Returns:
+            list: sitemap and feed URLs, sitemaps from robots.txt first.
+        """
+        policy = self.bot.robots_policy(root_url)
+        sitemaps = (policy.site_maps() if policy is not None else None) or []
+
+        parsed = urlparse(root_url)
+        if not sitemaps:
+            sitemaps = [f"{parsed.scheme}://{parsed.netloc}/sitemap.xml"]
+
+        base = root_url if root_url.endswith('/') else root_url + '/'
+        feeds = [urljoin(base, path) for path in self.feed_paths]
+
+        now = time.time()
+        sources = []
+        for url in dict.fromkeys(sitemaps + feeds):
+            source = self.store.source(url)
+            if source is not None and source['kind'] is None and now - source['checked_at'] < self.recheck_missing:
+                continue  # nothing there the last time
+            sources.append(url)
+        return sources
+
+    def discover_site(self, root_url: str) -> DiscoveryResult:
+        """
+        Function to read the sitemaps and feeds of one root site.
+
+        Args:
+            root_url (str): root site.
+        Returns:
+            DiscoveryResult: new and changed URLs of the site.
+        """
+        result = DiscoveryResult()
+        root = urlparse(canonicalize_url(root_url))
+        # a root below the site (`example.com/blog`) only takes the pages under its path
+        root_path = root.path.rstrip('/') + '/'
+        pages = []
+
+        pending = [(url, 0, None) for url in self.sources(root_url)]
+        while pending and result.fetched < self.max_documents and len(pages) < self.max_urls:
+            url, depth, lastmod = pending.pop(0)
+
+            source = self.store.source(url)
+            if lastmod is not None and source is not None and source['lastmod'] == lastmod and source['status'] == 200:
+                result.not_modified += 1  # sitemap index says this child did not change
+                continue
+
+            entries, kind, status = self.read(url, root_url, source, lastmod)
+            if kind is None:
+                continue
+
+            if root_url not in result.covered:
+                result.covered.append(root_url)
+            if status == 304:
+                result.not_modified += 1
+                continue
+            result.fetched += 1
+
+            for entry in entries:
+                if entry.kind == 'sitemap':
+                    if depth < self.max_depth:
+                        pending.append((entry.url, depth + 1, entry.lastmod))
+                else:
+                    page = urlparse(canonicalize_url(entry.url))
+                    if page.netloc == root.netloc and (root_path == '/' or (page.path + '/').startswith(root_path)):
+                        pages.append(entry)
+
+        pages = pages[:self.max_urls]
+        result.entries = len(pages)
+        if self.url_filter is not None:
+            pages = [entry for entry in pages if self.url_filter(entry.url)]
+
+        new, changed = self.store.update_entries(pages)
+        result.new = [strip_tracking(entry.url) for entry in new]
+        result.changed = [strip_tracking(entry.url) for entry in changed]
+
+        DISCOVERED.inc(len(new), result='new', kind='page')
+        DISCOVERED.inc(len(changed), result='changed', kind='page')
+        DISCOVERED.inc(len(pages) - len(new) - len(changed), result='unchanged', kind='page')
+        return result
+
+    def read(self, url: str, root_url: str, source: dict | None = None, lastmod: str = None) -> tuple:
+        """
+        Function to download and parse a sitemap or feed, entries are read while the body streams in.
+
+        Args:
+            url (str): sitemap or feed URL.
+            root_url (str): root site it belongs to.
+            source (dict, optional): stored state of the document, for a conditional request.
+            lastmod (str, optional): `lastmod` given by the parent sitemap index.
+        Returns:
+            tuple: (entries, root element name or None if the document is not a sitemap or feed, HTTP status).
+        """
+        host = urlparse(url).netloc
+        headers = {}
+        if source is not None and source['kind'] is not None:
+            if source['etag']:
+                headers['If-None-Match'] = source['etag']
+            if source['last_modified']:
+                headers['If-Modified-Since'] = source['last_modified']
+
+        try:
+            self.bot.hosts.check(host)
+            if not self.bot.can_fetch(self.bot.robots_policy(url), url):
+                self.store.record_source(url, root_url, None, None)
+                return [], None, None
+
+            start = time.perf_counter()
+            r = self.bot.http.session().get(url, stream=True, timeout=self.timeout, headers=headers)
+        except HostBlocked as e:
+            logger.debug(f"Skipping {url}: {e}")
+            return [], None, None
+        except self.bot.ALLOWED_EXCEPTIONS as e:
+            # not recorded, a failed request is tried again next session
+            logger.debug(f"Exception fetching sitemap {url}: {e}")
+            self.bot.hosts.record_failure(host, e.__class__.__name__)
+            return [], None, None
+
+        try:
+            response_headers = {k.lower(): v for k, v in r.headers.items()}
+            self.bot.hosts.record_response(host, r.status_code, time.perf_counter() - start,
+                                           response_headers.get('retry-after'))
+
+            if r.status_code == 304:
+                self.store.record_source(url, root_url, source['kind'], 304)
+                return [], source['kind'], 304
+            if r.status_code != 200:
+                self.store.record_source(url, root_url, None, r.status_code)
+                return [], None, r.status_code
+
+            parser = FeedParser()
+            entries = []
+            try:
+                for chunk in r.iter_content(self.bot.CHUNK_SIZE):
+                    if time.perf_counter() - start > self.timeout:
+                        raise ValueError('Timeout reached')
+                    entries.extend(parser.feed(chunk))
+                    if parser.full or len(entries) >= self.max_urls:
+                        break
+                entries.extend(parser.close())
+            except ParseError as e:
+                if parser.kind not in DOCUMENT_KINDS:
+                    # an HTML page at a feed location
+                    self.store.record_source(url, root_url, None, r.status_code)
+                    return [], None, r.status_code
+                logger.debug(f"Sitemap {url} is cut or invalid, keeping {len(entries)} entries: {e}")
+        except self.bot.ALLOWED_EXCEPTIONS as e:
+            logger.debug(f"Exception reading sitemap {url}: {e}")
+            return [], None, None
+        finally:
+            r.close()
+
+        if parser.kind not in DOCUMENT_KINDS:
+            # XHTML, or another XML document
+            self.store.record_source(url, root_url, None, r.status_code)
+            return [], None, r.status_code
+
+        self.store.record_source(url, root_url, parser.kind, 200, response_headers, lastmod, len(entries))
+        DISCOVERED.inc(len(entries), result='listed', kind=parser.kind)
+        return entries, parser.kind, 200
+
+    def discover(self, root_urls: list) -> DiscoveryResult:
+        """
+        Function to read the sitemaps and feeds of every root site, several sites at a time.
+
+        Args:
+            root_urls (list): root sites.
+        Returns:
+            DiscoveryResult: new and changed URLs of all the sites.
+        """
+        total = DiscoveryResult()
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="discovery") as pool:
+            futures = {pool.submit(self.discover_site, url): url for url in dict.fromkeys(root_urls)}
+            for future, root_url in futures.items():
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.info(f"Discovery failed for {root_url}: {e}")
+                    continue
+
+                total.new.extend(result.new)
+                total.changed.extend(result.changed)
+                total.covered.extend(result.covered)
+                total.fetched += result.fetched
+                total.not_modified += result.not_modified
+                total.entries += result.entries
+
+        return total
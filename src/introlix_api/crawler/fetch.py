@@ -0,0 +1,89 @@
+from dataclasses import dataclass, field
+
+# first allocation of a body without Content-Length, doubled as the body grows
+INITIAL_BODY_SIZE = 64 * 1024
+
+
+@dataclass
+class FetchResult:
+    url: str
+    status_code: int | None
+    content: bytes = b""
+    headers: dict = field(default_factory=dict)  # lower-cased header names
+    bytes_read: int = 0
+    elapsed: float = 0.0  # seconds from sending the request to the last byte read
+    ttfb: float = 0.0  # seconds from sending the request to the response headers
+    truncated: bool = False  # body was cut at MAX_FETCH_SIZE
+    rejected: str | None = None  # error name when the body was not downloaded at all
+    rejected_reason: str = ""
+
+    @staticmethod
+    def normalize_headers(headers) -> dict:
+        return {name.lower(): value for name, value in headers.items()}
+
+    @property
+    def content_type(self) -> str:
+        return self.headers.get('content-type', '').split(';')[0].strip().lower()
+
+    def stats(self) -> dict:
+        """
+        Function to get the size and timing fields of the fetch.
+
+        Returns:
+            dict: bytes read, elapsed time, time to first byte and truncation flag.
+        """
+        return {
+            'bytes': self.bytes_read,
+            'elapsed': round(self.elapsed, 4),
+            'ttfb': round(self.ttfb, 4),
+            'truncated': self.truncated,
+        }
+
+
+class BodyBuffer:
+    """
+    Preallocated buffer a response body is streamed into.
+
+    Chunks are copied into a bytearray sized from `Content-Length`, so reading a body
+    costs one copy per byte instead of rebuilding the whole `bytes` object for every
+    chunk. Without a length the buffer starts at `INITIAL_BODY_SIZE` and doubles when
+    full, up to `limit`.
+    """
+    def __init__(self, limit: int, expected_size: int | None = None):
+        """
+        Initialize the BodyBuffer.
+
+        Args:
+            limit (int): maximum number of bytes kept.
+            expected_size (int, optional): size announced by `Content-Length`, None when unknown.
+        """
+        self.limit = limit
+        self.size = 0
+        self.truncated = False
+        self._buffer = bytearray(min(expected_size if expected_size is not None else INITIAL_BODY_SIZE, limit))
+
+    def write(self, chunk: bytes) -> bool:
+        """
+        Function to append a chunk to the buffer.
+
+        Args:
+            chunk (bytes): chunk read from the response.
+        Returns:
+            bool: False once the limit is reached and reading should stop.
+        """
+        room = self.limit - self.size
+        if len(chunk) > room:
+            chunk = chunk[:room]
+            self.truncated = True
+
+        end = self.size + len(chunk)
+        if end > len(self._buffer):
+            # unknown length, or the server sent more than Content-Length announced
+            self._buffer.extend(bytes(min(max(end, 2 * len(self._buffer)), self.limit) - len(self._buffer)))
+        self._buffer[self.size:end] = chunk
+        self.size = end
+
+        return not self.truncated
+
+    def getvalue(self) -> bytes:
+        return bytes(memoryview(self._buffer)[:self.size])
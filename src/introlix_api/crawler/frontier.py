@@ -0,0 +1,363 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from introlix_api.crawler.seen import SeenFilter
+from introlix_api.crawler.throttle import HostController
+
+QUEUED, LEASED, DONE = 0, 1, 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    state INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    added_at REAL NOT NULL,
+    done_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    retry_at REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS urls_by_host ON urls (host, state, priority DESC, added_at);
+CREATE INDEX IF NOT EXISTS urls_by_lease ON urls (state, lease_expires);
+
+CREATE TABLE IF NOT EXISTS hosts (
+    host TEXT PRIMARY KEY,
+    ready_at REAL NOT NULL DEFAULT 0,
+    crawl_delay REAL,
+    latency REAL,
+    leased INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class URLFrontier:
+    """
+    Persistent priority queue of URLs to crawl, with per-host politeness.
+
+    The frontier lives in a SQLite file so it survives restarts and can be shared by
+    several crawler processes. A URL is leased to one worker at a time, and a host
+    never has more leased URLs than the concurrency limit its `HostController`
+    gives it, one without a controller. When a URL is acked the host's next ready
+    time is pushed back by its robots.txt crawl-delay or a multiple of its recent
+    latency, whichever is larger.
+
+    With a `SeenFilter`, URLs already crawled are dropped before they reach the
+    queue, and acked URLs are added to the filter. URLs whose fetch failed are not
+    acked but retried, after a backoff, a few times.
+    """
+    def __init__(self, path: str, min_delay: float = 1.0, latency_factor: float = 2.0,
+                 lease_seconds: float = 120.0, seen: SeenFilter = None, hosts: HostController = None):
+        """
+        Initialize the URLFrontier.
+
+        Args:
+            path (str): SQLite file of the frontier. Created if missing.
+            min_delay (float, optional): minimum seconds between two requests to a host. Defaults to 1.0.
+            latency_factor (float, optional): host delay as a multiple of its average latency. Defaults to 2.0.
+            lease_seconds (float, optional): seconds after which an unacked lease is given to another worker.
+                Defaults to 120.0.
+            seen (SeenFilter, optional): URLs already crawled.
+            hosts (HostController, optional): concurrency limit of each host, the URLs a host can have
+                leased at once. One per host without it.
+        """
+        self.path = path
+        self.seen = seen
+        self.min_delay = min_delay
+        self.latency_factor = latency_factor
+        self.lease_seconds = lease_seconds
+        self.hosts = hosts
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._conn.create_function("host_limit", 1, self._host_limit)
+
+    def _migrate(self):
+        """
+        Add the columns of newer versions to a frontier file created by an older one.
+        """
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(urls)")}
+        if 'attempts' not in columns:
+            self._conn.execute("ALTER TABLE urls ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+        if 'retry_at' not in columns:
+            self._conn.execute("ALTER TABLE urls ADD COLUMN retry_at REAL NOT NULL DEFAULT 0")
+
+    def _host_limit(self, host: str) -> int:
+        return self.hosts.limit(host) if self.hosts is not None else 1
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        return urlparse(url).netloc.lower()
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Run the block in a write transaction, rolled back if it raises.
+        """
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._conn
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def add(self, urls: list, priority: int = 0, requeue: bool = False) -> int:
+        """
+        Function to add URLs to the frontier.
+
+        Args:
+            urls (list): URLs to add.
+            priority (int, optional): higher priorities are leased first. Defaults to 0.
+            requeue (bool, optional): queue URLs again even if they were already crawled. Defaults to False.
+        Returns:
+            int: number of URLs queued.
+        """
+        now = time.time()
+
+        if self.seen is not None and not requeue:
+            urls = self.seen.filter_new(urls)
+        rows = [(url, self.host_of(url), priority, now) for url in dict.fromkeys(urls) if url]
+
+        if requeue:
+            # leased URLs are left alone, the worker holding them will ack them
+            query = ("INSERT INTO urls (url, host, priority, added_at) VALUES (?, ?, ?, ?) "
+                     "ON CONFLICT(url) DO UPDATE SET state = 0, priority = excluded.priority, "
+                     "added_at = excluded.added_at, attempts = 0, retry_at = 0 WHERE state = 2")
+        else:
+            query = "INSERT OR IGNORE INTO urls (url, host, priority, added_at) VALUES (?, ?, ?, ?)"
+
+        with self._lock, self._transaction():
+            before = self._conn.total_changes
+            self._conn.executemany(query, rows)
+            queued = self._conn.total_changes - before
+            self._conn.executemany("INSERT OR IGNORE INTO hosts (host) VALUES (?)",
+                                   {(row[1],) for row in rows})
+
+        return queued
+
+    def lease(self, limit: int) -> list:
+        """
+        Function to lease the next URLs to crawl, at most as many per host as its concurrency limit.
+
+        Only hosts below their limit and whose ready time has passed are considered,
+        and URLs waiting to be retried after a failure are skipped until their retry time.
+        Every host gets one URL before any gets a second.
+
+        Args:
+            limit (int): maximum number of URLs to lease.
+        Returns:
+            list: leased URLs, highest priority first.
+        """
+        now = time.time()
+
+        with self._lock, self._transaction():
+            self._expire_leases(now)
+
+            heads = self._conn.execute(
+                "SELECT u.url, u.host, host_limit(h.host) - h.leased FROM hosts h "
+                "JOIN urls u ON u.url = (SELECT url FROM urls WHERE host = h.host AND state = 0 AND retry_at <= ? "
+                "                        ORDER BY priority DESC, added_at LIMIT 1) "
+                "WHERE h.ready_at <= ? AND h.leased < host_limit(h.host) "
+                "ORDER BY u.priority DESC, h.ready_at LIMIT ?",
+                (now, now, limit),
+            ).fetchall()
+
+            rows = [(url, host) for url, host, _ in heads]
+            for url, host, free in heads:
+                if len(rows) >= limit:
+                    break
+                if free > 1:
+                    # hosts allowed more requests in flight fill the rest of the lease
+                    rows.extend((next_url, host) for next_url, in self._conn.execute(
+                        "SELECT url FROM urls WHERE host = ? AND state = 0 AND retry_at <= ? AND url != ? "
+                        "ORDER BY priority DESC, added_at LIMIT ?",
+                        (host, now, url, min(free - 1, limit - len(rows)))))
+
+            self._conn.executemany(
+                "UPDATE urls SET state = 1, lease_owner = ?, lease_expires = ? WHERE url = ?",
+                [(self.owner, now + self.lease_seconds, url) for url, _ in rows],
+            )
+            self._conn.executemany("UPDATE hosts SET leased = leased + 1 WHERE host = ?",
+                                   [(host,) for _, host in rows])
+
+        return [url for url, _ in rows]
+
+    def _expire_leases(self, now: float):
+        expired = self._conn.execute(
+            "UPDATE urls SET state = 0, lease_owner = NULL, lease_expires = NULL "
+            "WHERE state = 1 AND lease_expires < ?", (now,)).rowcount
+
+        if expired:
+            self._conn.execute(
+                "UPDATE hosts SET leased = (SELECT COUNT(*) FROM urls WHERE urls.host = hosts.host AND state = 1)")
+
+    def ack(self, url: str, latency: float | None = None, crawl_delay: float | None = None):
+        """
+        Function to mark a URL as crawled and schedule the next request to its host.
+
+        Args:
+            url (str): crawled URL.
+            latency (float, optional): seconds the fetch took.
+            crawl_delay (float, optional): crawl-delay of the host's robots.txt.
+        """
+        now = time.time()
+        host = self.host_of(url)
+
+        with self._lock, self._transaction():
+            row = self._conn.execute("SELECT state FROM urls WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return
+
+            self._conn.execute("UPDATE urls SET state = 2, lease_owner = NULL, lease_expires = NULL, "
+                               "done_at = ? WHERE url = ?", (now, url))
+
+            old_latency, old_delay = self._conn.execute(
+                "SELECT latency, crawl_delay FROM hosts WHERE host = ?", (host,)).fetchone()
+
+            if latency is not None:
+                # exponentially weighted average so one slow page doesn't stall the host
+                latency = latency if old_latency is None else 0.7 * old_latency + 0.3 * latency
+            else:
+                latency = old_latency
+
+            crawl_delay = crawl_delay if crawl_delay is not None else old_delay
+            delay = max(self.min_delay, crawl_delay or 0, (latency or 0) * self.latency_factor)
+
+            self._conn.execute(
+                "UPDATE hosts SET leased = MAX(leased - ?, 0), latency = ?, crawl_delay = ?, ready_at = ? "
+                "WHERE host = ?",
+                (1 if row[0] == LEASED else 0, latency, crawl_delay, now + delay, host),
+            )
+
+        if self.seen is not None:
+            self.seen.add([url])
+            self.seen.maybe_save()
+
+    def retry(self, url: str, delay: float, max_attempts: int) -> bool:
+        """
+        Function to give back a leased URL whose fetch or parse failed, to crawl it again later.
+
+        The URL waits `delay` seconds, doubled on each failure, before it is leased again, and the
+        other URLs of its host are not held up meanwhile. After `max_attempts` failures it is given
+        up: marked done, but not added to the seen filter.
+
+        Args:
+            url (str): leased URL.
+            delay (float): seconds before the first retry.
+            max_attempts (int): failures after which the URL is given up.
+        Returns:
+            bool: True if the URL will be crawled again.
+        """
+        now = time.time()
+        host = self.host_of(url)
+
+        with self._lock, self._transaction():
+            row = self._conn.execute("SELECT state, attempts FROM urls WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return False
+
+            state, attempts = row[0], row[1] + 1
+            retried = attempts < max_attempts
+            if retried:
+                self._conn.execute("UPDATE urls SET state = 0, lease_owner = NULL, lease_expires = NULL, "
+                                   "attempts = ?, retry_at = ? WHERE url = ?",
+                                   (attempts, now + delay * 2 ** (attempts - 1), url))
+            else:
+                self._conn.execute("UPDATE urls SET state = 2, lease_owner = NULL, lease_expires = NULL, "
+                                   "attempts = ?, done_at = ? WHERE url = ?", (attempts, now, url))
+
+            # the failed request counts for the politeness of the host
+            self._conn.execute("UPDATE hosts SET leased = MAX(leased - ?, 0), ready_at = MAX(ready_at, ?) "
+                               "WHERE host = ?", (1 if state == LEASED else 0, now + self.min_delay, host))
+
+        return retried
+
+    def release(self, url: str, delay: float | None = None):
+        """
+        Function to give back a leased URL without crawling it.
+
+        Args:
+            url (str): leased URL.
+            delay (float, optional): seconds before the host can be leased again, e.g. its Retry-After.
+        """
+        host = self.host_of(url)
+
+        with self._lock, self._transaction():
+            released = self._conn.execute(
+                "UPDATE urls SET state = 0, lease_owner = NULL, lease_expires = NULL "
+                "WHERE url = ? AND state = 1", (url,)).rowcount
+
+            if released:
+                self._conn.execute("UPDATE hosts SET leased = MAX(leased - 1, 0) WHERE host = ?", (host,))
+
+            if delay:
+                self._conn.execute("UPDATE hosts SET ready_at = MAX(ready_at, ?) WHERE host = ?",
+                                   (time.time() + delay, host))
+
+    def leases(self) -> list:
+        """
+        Function to list the URLs currently leased, by any worker.
+
+        Returns:
+            list: (url, lease owner, lease expiry time) tuples.
+        """
+        with self._lock:
+            return self._conn.execute("SELECT url, lease_owner, lease_expires FROM urls WHERE state = 1").fetchall()
+
+    def get_meta(self, key: str, default: str | None = None) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key: str, value: str):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def stats(self) -> dict:
+        """
+        Function to count the URLs of the frontier by state.
+
+        Returns:
+            dict: number of queued, leased and done URLs and of known hosts.
+        """
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT state, COUNT(*) FROM urls GROUP BY state").fetchall())
+            hosts = self._conn.execute("SELECT COUNT(*) FROM hosts").fetchone()[0]
+
+        return {
+            'queued': counts.get(QUEUED, 0),
+            'leased': counts.get(LEASED, 0),
+            'done': counts.get(DONE, 0),
+            'hosts': hosts,
+        }
+
+    def __len__(self) -> int:
+        """
+        Number of URLs waiting to be crawled.
+        """
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM urls WHERE state = 0").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
@@ -0,0 +1,206 @@
+import json
+import time
+from datetime import timedelta
+
+from bson import ObjectId
+from pymongo.errors import PyMongoError
+
+from introlix_api.logger import logger
+from introlix_api.crawler.frontier import URLFrontier
+from introlix_api.crawler.metrics import metrics
+
+WATERMARK_KEY = "harvest_watermark"
+
+HARVESTED = metrics.counter("crawler_harvested_total", "Stored documents and links read by the link harvester",
+                            ("source", "event"))
+
+
+def encode_watermark(value) -> str:
+    if isinstance(value, ObjectId):
+        return json.dumps({'oid': str(value)})
+    return json.dumps({'value': value})
+
+
+def decode_watermark(text: str | None):
+    if not text:
+        return None
+    try:
+        data = json.loads(text)
+        return ObjectId(data['oid']) if 'oid' in data else data['value']
+    except (ValueError, KeyError, TypeError):
+        logger.info("Ignoring an unreadable link harvest watermark")
+        return None
+
+
+class LinkHarvester:
+    """
+    Incremental reader of the links of the stored articles.
+
+    Only the documents inserted since the last harvest are read: the `_id` of the
+    last document read is the watermark, and the next scan asks for the larger ones
+    in `_id` order, streaming them from the cursor. The watermark is kept in the
+    frontier's meta table so a restart carries on where the crawler stopped.
+
+    When the deployment supports change streams (replica sets), inserts are read
+    from a stream opened at the first harvest, after one scan from the watermark
+    catches up with what was inserted while the crawler was down. Otherwise, or if
+    the stream fails, every harvest scans from the watermark.
+
+    ObjectIds are created by the clients, so a document inserted by another process
+    may get an `_id` a little below one already read. Scans start `overlap_seconds`
+    before the watermark to pick those up; the links read again are duplicates the
+    frontier and the backlog drop.
+    """
+    def __init__(self, collection, frontier: URLFrontier, use_change_stream: bool = True,
+                 cursor_batch_size: int = 500, overlap_seconds: float = 30.0, save_interval: float = 5.0):
+        """
+        Initialize the LinkHarvester.
+
+        Args:
+            collection (pymongo.collection.Collection): collection of the stored articles.
+            frontier (URLFrontier): frontier of the crawl, the watermark is stored in its meta table.
+            use_change_stream (bool, optional): read inserts from a change stream when available. Defaults to True.
+            cursor_batch_size (int, optional): documents fetched per round trip of a scan. Defaults to 500.
+            overlap_seconds (float, optional): seconds of ObjectIds before the watermark scanned again.
+                Defaults to 30.
+            save_interval (float, optional): minimum seconds between two writes of the watermark
+                during a harvest. Defaults to 5.
+        """
+        self.collection = collection
+        self.frontier = frontier
+        self.use_change_stream = use_change_stream
+        self.cursor_batch_size = cursor_batch_size
+        self.overlap_seconds = overlap_seconds
+        self.save_interval = save_interval
+
+        self.watermark = decode_watermark(frontier.get_meta(WATERMARK_KEY))
+        self._saved_watermark = self.watermark
+        self._last_save = time.monotonic()
+        self._stream = None
+        self._stream_failed = not use_change_stream
+
+    def save(self):
+        """
+        Function to write the watermark to the frontier's meta table.
+        """
+        if self.watermark is not None and self.watermark != self._saved_watermark:
+            self.frontier.set_meta(WATERMARK_KEY, encode_watermark(self.watermark))
+            self._saved_watermark = self.watermark
+        self._last_save = time.monotonic()
+
+    def _advance(self, doc_id):
+        if self.watermark is None or doc_id > self.watermark:
+            self.watermark = doc_id
+        if time.monotonic() - self._last_save >= self.save_interval:
+            self.save()
+
+    def _scan_query(self) -> dict:
+        if self.watermark is None:
+            return {}
+        start = self.watermark
+        if isinstance(start, ObjectId) and self.overlap_seconds:
+            start = ObjectId.from_datetime(start.generation_time - timedelta(seconds=self.overlap_seconds))
+        return {"_id": {"$gt": start}}
+
+    def _batches(self, documents, batch_size: int, source: str):
+        """
+        Cut the links of documents into batches. The watermark passes a document
+        once all its links were handed out and the caller came back for more.
+        """
+        batch_urls = []
+        completed = None  # last document whose links are all in `batch_urls` or handed out
+        for doc in documents:
+            HARVESTED.inc(source=source, event='document')
+            for url in (doc.get("content") or {}).get("links") or []:
+                batch_urls.append(url)
+                if len(batch_urls) >= batch_size:
+                    HARVESTED.inc(len(batch_urls), source=source, event='link')
+                    yield batch_urls
+                    batch_urls = []
+                    if completed is not None:
+                        self._advance(completed)
+                        completed = None
+
+            completed = doc["_id"]
+            if not batch_urls:
+                self._advance(completed)
+                completed = None
+
+        if batch_urls:
+            HARVESTED.inc(len(batch_urls), source=source, event='link')
+            yield batch_urls
+        if completed is not None:
+            self._advance(completed)
+
+    def scan(self, batch_size: int):
+        """
+        Function to read the links of the documents above the watermark.
+
+        Args:
+            batch_size (int): links per batch.
+        Yields:
+            list: links of the new documents, `batch_size` at most.
+        """
+        cursor = (self.collection.find(self._scan_query(), {"content.links": 1})
+                  .sort("_id", 1)
+                  .batch_size(self.cursor_batch_size))
+        yield from self._batches(cursor, batch_size, 'scan')
+        self.save()
+
+    def _open_stream(self) -> bool:
+        try:
+            self._stream = self.collection.watch(
+                [{"$match": {"operationType": "insert"}},
+                 {"$project": {"fullDocument._id": 1, "fullDocument.content.links": 1}}],
+                max_await_time_ms=100)
+            logger.info("Harvesting links from the change stream of the stored articles")
+            return True
+        except PyMongoError as e:
+            # standalone servers have no change streams
+            logger.info(f"Change stream unavailable, harvesting links by _id scans: {e}")
+            self._stream = None
+            self._stream_failed = True
+            return False
+
+    def _stream_documents(self):
+        while True:
+            change = self._stream.try_next()
+            if change is None:
+                return
+            yield change["fullDocument"]
+
+    def harvest(self, batch_size: int):
+        """
+        Function to read the links of the documents inserted since the last harvest.
+
+        Args:
+            batch_size (int): links per batch.
+        Yields:
+            list: links of the new documents, `batch_size` at most.
+        """
+        if self._stream is None and not self._stream_failed:
+            # the stream is opened before the catch-up scan so no insert falls between them
+            if self._open_stream():
+                yield from self.scan(batch_size)
+                return
+
+        if self._stream is None:
+            yield from self.scan(batch_size)
+            return
+
+        try:
+            yield from self._batches(self._stream_documents(), batch_size, 'change_stream')
+            self.save()
+        except PyMongoError as e:
+            logger.info(f"Change stream failed, harvesting links by _id scans: {e}")
+            self.close()
+            self._stream_failed = True
+
+    def close(self):
+        if self._stream is not None:
+            try:
+                self._stream.close()
+            except PyMongoError:
+                pass
+            self._stream = None
+        self.save()
@@ -0,0 +1,251 @@
+import socket
+import threading
+import time
+
+import aiohttp
+import requests
+from aiohttp.abc import AbstractResolver
+from requests.adapters import HTTPAdapter
+
+from introlix_api.crawler.metrics import host_of, FETCH_PHASE_SECONDS
+
+
+class DNSCache:
+    """
+    Process wide cache of resolved host addresses with a TTL.
+
+    Shared by every connection pool of the process, so a host is resolved once per
+    TTL whatever the number of crawl sessions opened.
+    """
+    def __init__(self, ttl: float = 300.0):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or entry[0] <= time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, addresses):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, addresses)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+
+dns_cache = DNSCache()
+
+
+class CachingResolver(AbstractResolver):
+    """
+    aiohttp resolver answering from a shared `DNSCache`, falling back to the threaded resolver.
+    """
+    def __init__(self, cache: DNSCache = dns_cache):
+        self.cache = cache
+        self._resolver = aiohttp.ThreadedResolver()
+
+    async def resolve(self, host: str, port: int = 0, family: socket.AddressFamily = socket.AF_INET):
+        key = (host, port, family)
+        addresses = self.cache.get(key)
+
+        if addresses is None:
+            addresses = await self._resolver.resolve(host, port, family)
+            self.cache.set(key, addresses)
+
+        return addresses
+
+    async def close(self):
+        await self._resolver.close()
+
+
+class AsyncHTTPPool:
+    """
+    Keep-alive connection pool of one asyncio crawl worker.
+
+    Every request of the worker, robots.txt and pages alike, goes through the same
+    connector, so a host's connections are reused instead of reopened per request.
+    """
+    def __init__(self, max_connections: int = 100, connections_per_host: int = 4,
+                 keepalive_seconds: float = 30.0, cache: DNSCache = dns_cache):
+        """
+        Initialize the AsyncHTTPPool. Must be created inside the event loop it is used in.
+
+        Args:
+            max_connections (int, optional): maximum number of open connections. Defaults to 100.
+            connections_per_host (int, optional): maximum number of open connections to a host. Defaults to 4.
+            keepalive_seconds (float, optional): seconds an idle connection is kept open. Defaults to 30.
+            cache (DNSCache, optional): DNS cache. Defaults to the cache shared by the process.
+        """
+        self.dns_cache = cache
+        self.connector = aiohttp.TCPConnector(
+            limit=max_connections,
+            limit_per_host=connections_per_host,
+            keepalive_timeout=keepalive_seconds,
+            resolver=CachingResolver(cache),
+            use_dns_cache=False,  # the shared cache above replaces the per connector one
+        )
+
+        self.requests = 0
+        self.new_connections = 0
+        self.reused_connections = 0
+
+        self.trace_config = aiohttp.TraceConfig()
+        self.trace_config.on_request_start.append(self._on_request_start)
+        self.trace_config.on_dns_resolvehost_start.append(self._on_dns_resolvehost_start)
+        self.trace_config.on_dns_resolvehost_end.append(self._on_dns_resolvehost_end)
+        self.trace_config.on_connection_create_start.append(self._on_connection_create_start)
+        self.trace_config.on_connection_create_end.append(self._on_connection_create_end)
+        self.trace_config.on_connection_reuseconn.append(self._on_connection_reuseconn)
+
+    async def _on_request_start(self, session, context, params):
+        self.requests += 1
+        context.host = host_of(str(params.url))
+        context.dns_seconds = 0.0
+
+    async def _on_dns_resolvehost_start(self, session, context, params):
+        context.dns_start = time.perf_counter()
+
+    async def _on_dns_resolvehost_end(self, session, context, params):
+        context.dns_seconds = time.perf_counter() - context.dns_start
+        FETCH_PHASE_SECONDS.observe(context.dns_seconds, phase='dns', host=context.host)
+
+    async def _on_connection_create_start(self, session, context, params):
+        context.connect_start = time.perf_counter()
+
+    async def _on_connection_create_end(self, session, context, params):
+        self.new_connections += 1
+        # connection creation includes the host lookup, which is reported on its own
+        connect_seconds = time.perf_counter() - context.connect_start - context.dns_seconds
+        FETCH_PHASE_SECONDS.observe(max(connect_seconds, 0.0), phase='connect', host=context.host)
+
+    async def _on_connection_reuseconn(self, session, context, params):
+        self.reused_connections += 1
+
+    def session(self, **kwargs) -> aiohttp.ClientSession:
+        """
+        Function to open a client session on the pool.
+
+        Returns:
+            aiohttp.ClientSession: session sharing the pool's connections.
+        """
+        return aiohttp.ClientSession(connector=self.connector, connector_owner=False,
+                                     trace_configs=[self.trace_config], **kwargs)
+
+    def stats(self) -> dict:
+        """
+        Function to report connection reuse.
+
+        Returns:
+            dict: requests sent, connections opened and reused, reuse ratio and open sockets.
+        """
+        connections = self.new_connections + self.reused_connections
+        idle = sum(len(conns) for conns in getattr(self.connector, '_conns', {}).values())
+
+        return {
+            'requests': self.requests,
+            'new_connections': self.new_connections,
+            'reused_connections': self.reused_connections,
+            'reuse_ratio': self.reused_connections / connections if connections else 0.0,
+            'open_sockets': idle + len(getattr(self.connector, '_acquired', ())),
+            'dns': self.dns_cache.stats(),
+        }
+
+    async def close(self):
+        await self.connector.close()
+
+
+class SyncHTTPPool:
+    """
+    Keep-alive `requests` sessions, one per thread.
+    """
+    def __init__(self, max_hosts: int = 100, connections_per_host: int = 4):
+        """
+        Initialize the SyncHTTPPool.
+
+        Args:
+            max_hosts (int, optional): number of host pools kept per session. Defaults to 100.
+            connections_per_host (int, optional): connections kept open per host. Defaults to 4.
+        """
+        self.max_hosts = max_hosts
+        self.connections_per_host = connections_per_host
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    def session(self) -> requests.Session:
+        """
+        Function to get the session of the calling thread.
+
+        Returns:
+            requests.Session: pooled session.
+        """
+        session = getattr(self._local, 'session', None)
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.max_hosts, pool_maxsize=self.connections_per_host)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+
+        return session
+
+    def stats(self) -> dict:
+        """
+        Function to report connection reuse over the sessions of every thread.
+
+        Returns:
+            dict: requests sent, connections opened and reused, reuse ratio and idle open sockets.
+        """
+        requests_sent = new_connections = open_sockets = 0
+
+        with self._lock:
+            sessions = list(self._sessions)
+
+        for session in sessions:
+            for adapter in {id(a): a for a in session.adapters.values()}.values():
+                for key in list(adapter.poolmanager.pools.keys()):
+                    pool = adapter.poolmanager.pools.get(key)
+                    if pool is None:
+                        continue
+                    requests_sent += pool.num_requests
+                    new_connections += pool.num_connections
+                    open_sockets += sum(1 for conn in list(pool.pool.queue) if conn is not None and conn.sock)
+
+        reused = max(requests_sent - new_connections, 0)
+        return {
+            'requests': requests_sent,
+            'new_connections': new_connections,
+            'reused_connections': reused,
+            'reuse_ratio': reused / requests_sent if requests_sent else 0.0,
+            'open_sockets': open_sockets,
+        }
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions.clear()
+        self._local = threading.local()
+
+    def __getstate__(self):
+        # sessions and sockets can't cross a process boundary, a worker starts with an empty pool
+        return {'max_hosts': self.max_hosts, 'connections_per_host': self.connections_per_host}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
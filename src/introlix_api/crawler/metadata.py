@@ -0,0 +1,154 @@
+import re
+import json
+from dataclasses import dataclass, field
+from urllib.parse import urljoin
+
+# elements the extractor looks at, visited in one traversal of the document
+METADATA_TAGS = ('title', 'meta', 'link', 'img', 'script', 'time', 'span', 'a', 'p')
+
+# body text kept for fingerprinting, the start of an article is enough to tell copies apart
+MAX_TEXT_CHARS = 20_000
+
+DATE_PATTERNS = (re.compile(r"\d{4}-\d{2}-\d{2}"), re.compile(r"\d{2} \w{3}, \d{4}"))
+
+
+@dataclass
+class PageMetadata:
+    title: str = ""
+    desc: str = ""
+    image: str = ""
+    date: str = ""
+    links: list = field(default_factory=list)  # raw href of every <a>, in document order
+    canonical: str = ""  # raw href of <link rel="canonical">
+    text: str = ""  # text of the <p> elements, up to MAX_TEXT_CHARS
+
+
+def _first_text_node(element) -> str:
+    """
+    First text node child of an element, as XPath's `text()` sees it.
+    """
+    if element.text is not None:
+        return element.text
+
+    for child in element:
+        if child.tail is not None:
+            return child.tail
+    return ""
+
+
+def clean_date(date: str) -> str:
+    """
+    Keep only the YYYY-MM-DD (or "DD Mon, YYYY") part of a date string, if there is one.
+    """
+    if date:
+        for pattern in DATE_PATTERNS:
+            match = pattern.search(date)
+            if match:
+                return match.group(0)
+    return date
+
+
+def extract_metadata(dom, url: str) -> PageMetadata:
+    """
+    Function to extract the title, description, image, date, links, canonical link and body text of a page.
+
+    The document is walked once, in document order, and only the elements that can
+    hold metadata are handed to Python. The result is the same as running one XPath
+    query per field: the first `<title>`, the first description `<meta>`, `og:image`
+    with the first `<img>` as fallback, and a publication date taken from
+    `article:published_time`, JSON-LD `datePublished`, `<time datetime>` or a
+    "Last Updated" span, in that order of preference.
+
+    Args:
+        dom (lxml.html.HtmlElement): parsed page.
+        url (str): URL of the page, used to resolve the fallback image.
+    Returns:
+        PageMetadata: extracted metadata.
+    """
+    title = desc = og_image = first_img = canonical = None
+    published = ld_json = time_datetime = last_updated = None
+    links = []
+    paragraphs, text_size = [], 0
+
+    for element in dom.getroottree().getroot().iter(*METADATA_TAGS):
+        tag = element.tag
+
+        if tag == 'a':
+            href = element.get('href')
+            if href:
+                links.append(href)
+
+        elif tag == 'p':
+            if text_size < MAX_TEXT_CHARS:
+                paragraph = element.text_content().strip()
+                if paragraph:
+                    paragraphs.append(paragraph)
+                    text_size += len(paragraph) + 1
+
+        elif tag == 'meta':
+            name, prop = element.get('name'), element.get('property')
+
+            if name == 'description' and desc is None:
+                desc = (element.get('content') or "").strip()
+            if prop == 'og:image' and og_image is None:
+                og_image = element.get('content')
+            if prop == 'article:published_time' and published is None:
+                published = element.get('content')
+
+        elif tag == 'link':
+            if canonical is None and 'canonical' in (element.get('rel') or '').lower().split():
+                canonical = element.get('href')
+
+        elif tag == 'img':
+            if first_img is None and element.get('src'):
+                first_img = urljoin(url, element.get('src'))
+
+        elif tag == 'title':
+            if title is None:
+                title = (element.text or "").strip()
+
+        elif tag == 'script':
+            if ld_json is None and element.get('type') == 'application/ld+json':
+                ld_json = element.text_content()
+
+        elif tag == 'time':
+            if time_datetime is None:
+                time_datetime = element.get('datetime')
+
+        elif tag == 'span':
+            if last_updated is None and 'Last Updated' in _first_text_node(element):
+                last_updated = element.text_content()
+
+    if og_image is not None:
+        image = og_image
+    else:
+        image = first_img or ""
+
+    date = published or ""
+
+    # Fallback: Check JSON-LD for datePublished in <script>
+    if not date and ld_json:
+        try:
+            data = json.loads(ld_json)
+            if isinstance(data, dict):
+                date = str(data.get("datePublished", "")).split("T")[0]
+        except json.JSONDecodeError:
+            pass
+
+    # Fallback: Look for <time> tag with datetime attribute
+    if not date:
+        date = time_datetime or ""
+
+    # Fallback: Check for common patterns with 'Last Updated'
+    if not date:
+        date = last_updated or ""
+
+    return PageMetadata(
+        title=title or "",
+        desc=desc or "",
+        image=image,
+        date=clean_date(date),
+        links=links,
+        canonical=(canonical or "").strip(),
+        text="\n".join(paragraphs)[:MAX_TEXT_CHARS],
+    )
@@ -0,0 +1,345 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds, from a cached robots.txt lookup to a slow download
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+
+
+def host_of(url: str) -> str:
+    try:
+        return urlparse(url).netloc or "unknown"
+    except ValueError:
+        return "unknown"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Metric:
+    """
+    Base of the registry metrics: a value per combination of label values.
+    """
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: tuple) -> dict:
+        return dict(zip(self.labelnames, key))
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def drain(self) -> dict:
+        """
+        Function to take the values recorded since the last drain, to merge them in another process.
+
+        Returns:
+            dict: values by label values.
+        """
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        """
+        Function to increase the counter of a label combination.
+
+        Args:
+            amount (float, optional): increment. Defaults to 1.
+            **labels: value of every label of the counter.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def merge(self, values: dict):
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0.0) + value
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, self._labels(key), value
+
+    def summarize(self, keep: tuple) -> dict:
+        totals = {}
+        with self._lock:
+            values = dict(self._values)
+        for key, value in values.items():
+            group = _format_labels({k: v for k, v in self._labels(key).items() if k in keep}) or "all"
+            totals[group] = totals.get(group, 0.0) + value
+        return dict(sorted(totals.items()))
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        """
+        Function to set the gauge of a label combination.
+
+        Args:
+            value (float): current value.
+            **labels: value of every label of the gauge.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def merge(self, values: dict):
+        with self._lock:
+            self._values.update(values)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        if self.buckets[-1] != math.inf:
+            self.buckets += (math.inf,)
+
+    def observe(self, value: float, **labels):
+        """
+        Function to record one observation.
+
+        Args:
+            value (float): observed value, in seconds for latencies.
+            **labels: value of every label of the histogram.
+        """
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per bucket counts, sum, count
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def merge(self, values: dict):
+        with self._lock:
+            for key, (counts, total, count) in values.items():
+                state = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+                state[0] = [a + b for a, b in zip(state[0], counts)]
+                state[1] += total
+                state[2] += count
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Context manager observing the seconds spent in its block.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(state[0]), state[1], state[2]) for key, state in self._values.items()}
+
+        for key, (counts, total, count) in sorted(values.items()):
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", {**labels, 'le': _format_value(bound)}, cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+    def _quantile(self, counts: list, count: int, q: float) -> float:
+        """
+        Estimate a quantile from bucket counts, interpolating inside the bucket.
+        """
+        rank = q * count
+        cumulative = 0
+        lower = 0.0
+        for bound, bucket_count in zip(self.buckets, counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                if bound == math.inf:
+                    return lower
+                return lower + (bound - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+            if bound != math.inf:
+                lower = bound
+        return lower
+
+    def summarize(self, keep: tuple) -> dict:
+        groups = {}
+        with self._lock:
+            values = {key: (list(state[0]), state[1], state[2]) for key, state in self._values.items()}
+
+        for key, (counts, total, count) in values.items():
+            group = _format_labels({k: v for k, v in self._labels(key).items() if k in keep}) or "all"
+            merged = groups.setdefault(group, [[0] * len(self.buckets), 0.0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], counts)]
+            merged[1] += total
+            merged[2] += count
+
+        return {
+            group: {
+                'count': count,
+                'total_seconds': round(total, 4),
+                'mean': round(total / count, 5) if count else 0.0,
+                'p50': round(self._quantile(counts, count, 0.50), 5),
+                'p99': round(self._quantile(counts, count, 0.99), 5),
+            }
+            for group, (counts, total, count) in sorted(groups.items())
+        }
+
+
+class MetricsRegistry:
+    """
+    Counters and latency histograms of the crawler, thread safe.
+
+    Exported in the Prometheus text format by the `/metrics` route and summarized
+    in the logs at the end of every crawl session.
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, documentation: str, labelnames: tuple, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif type(metric) is not cls or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered with another type or labels")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (),
+                  buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        """
+        Function to export every metric in the Prometheus text format.
+
+        Returns:
+            str: metrics page.
+        """
+        with self._lock:
+            registered = list(self._metrics.values())
+
+        lines = []
+        for metric in registered:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, keep: tuple = ('phase', 'stage', 'store', 'operation', 'result', 'outcome', 'queue', 'event',
+                                      'location')) -> dict:
+        """
+        Function to summarize the metrics, aggregated over the labels not in `keep` (the host by default).
+
+        Args:
+            keep (tuple, optional): labels kept in the summary.
+        Returns:
+            dict: totals of the counters and count, mean, p50 and p99 of the histograms.
+        """
+        with self._lock:
+            registered = list(self._metrics.values())
+        return {metric.name: metric.summarize(keep) for metric in registered}
+
+    def reset(self):
+        with self._lock:
+            registered = list(self._metrics.values())
+        for metric in registered:
+            metric.reset()
+
+    def drain(self) -> dict:
+        """
+        Function to take the values recorded since the last drain, in a worker process.
+
+        Returns:
+            dict: values of the metrics that recorded any, by name. Picklable, see `merge`.
+        """
+        with self._lock:
+            registered = list(self._metrics.values())
+        drained = {metric.name: metric.drain() for metric in registered}
+        return {name: values for name, values in drained.items() if values}
+
+    def merge(self, drained: dict):
+        """
+        Function to add the values drained from the registry of another process.
+
+        Args:
+            drained (dict): result of `drain`.
+        """
+        with self._lock:
+            registered = dict(self._metrics)
+        for name, values in drained.items():
+            if name in registered:
+                registered[name].merge(values)
+
+
+metrics = MetricsRegistry()
+
+FETCH_PHASE_SECONDS = metrics.histogram(
+    "crawler_fetch_phase_seconds", "Time spent per HTTP phase (dns, connect, ttfb, download)", ("phase", "host"))
+FETCH_BYTES = metrics.counter("crawler_fetch_bytes_total", "Body bytes read", ("host",))
+PAGES = metrics.counter("crawler_pages_total", "Scraped pages by outcome", ("outcome", "host"))
+ROBOTS_SECONDS = metrics.histogram(
+    "crawler_robots_check_seconds", "Time to check a URL against robots.txt", ("result", "host"))
+PARSE_SECONDS = metrics.histogram(
+    "crawler_parse_stage_seconds", "Time spent per parse stage (dom, metadata, links, tags)", ("stage", "host"))
+WRITE_SECONDS = metrics.histogram(
+    "crawler_write_seconds", "Time of a write or lookup against a store", ("store", "operation"))
+WRITTEN_DOCUMENTS = metrics.counter("crawler_written_documents_total", "Documents written", ("store", "host"))
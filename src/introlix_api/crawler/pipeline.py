@@ -0,0 +1,269 @@
+import asyncio
+import multiprocessing
+import time
+from urllib.parse import urlparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from introlix_api.logger import logger
+from introlix_api.crawler.bot import IntrolixBot, BotArgs
+from introlix_api.crawler.fetch import FetchResult
+from introlix_api.crawler.archive import PageArchive, encode_record
+from introlix_api.crawler.http import AsyncHTTPPool
+from introlix_api.crawler.metrics import metrics, host_of, PARSE_SECONDS
+from introlix_api.crawler.throttle import HostController, host_controller
+
+QUEUE_DEPTH = metrics.gauge("crawler_pipeline_queue_depth", "Items waiting in a pipeline queue", ("queue",))
+BACKPRESSURE = metrics.counter("crawler_pipeline_backpressure_total",
+                               "Times a stage waited because the next queue was full", ("queue",))
+
+# parse-only bot of a parse worker process, built by `_init_parser`
+_parser = None
+
+
+def _init_parser(args, sites: list):
+    global _parser
+    _parser = IntrolixBot(urls=[], args=args)
+    # same root sites as the parent, the links of a page are filtered against them
+    _parser.root_sites = sites
+    _parser.root_sites_netlocs = {urlparse(root_url).netloc for root_url in sites}
+
+
+def _parse(fetched: FetchResult, js_timestamp: int, archive_compression: str = None) -> tuple:
+    """
+    Parse a fetched page in a worker process, and compress its archive record when pages are archived.
+    The metrics recorded by the worker (parse stages, page outcome) go back with the result.
+    """
+    start = time.perf_counter()
+    result = _parser.parse_page(fetched, js_timestamp)
+    parse_seconds = time.perf_counter() - start
+
+    record = None
+    if archive_compression is not None and fetched.status_code == 200 and fetched.content:
+        record = encode_record(fetched, js_timestamp, archive_compression)
+    return result, parse_seconds, record, metrics.drain()
+
+
+class CrawlPipeline:
+    """
+    Crawler split in three stages that scale independently.
+
+    - fetch: asyncio workers download pages (`MAX_CONCURRENCY` in flight)
+    - parse: a process pool runs `html_to_dom` and the extraction (`PARSE_WORKERS` processes)
+    - write: batches of results are handed to `write` in a thread, one batch at a time
+
+    Stages are connected by bounded queues, so a slow parse or write stage makes
+    the stages before it wait instead of piling up pages in memory. Queue depths
+    and waits are exported as metrics.
+
+    The event loop and the connection pool outlive a `run`: keep-alive connections
+    and resolved hosts are reused by the next batches, until `close`.
+    """
+    def __init__(self, write, args: BotArgs = BotArgs, batch_size: int = 10, seen=None, validators=None,
+                 hosts: HostController = host_controller, parse_workers: int = None, archive: PageArchive = None):
+        """
+        Initialize the CrawlPipeline.
+
+        Args:
+            write (callable): called with each batch of scraped data, from the writer thread.
+            args (BotArgs, optional): bot settings. Defaults to BotArgs.
+            batch_size (int, optional): number of results handed to `write` at once. Defaults to 10.
+            seen (SeenFilter, optional): URLs already crawled, left out of the extracted links.
+            validators (ValidatorStore, optional): ETag / Last-Modified of crawled pages.
+            hosts (HostController, optional): per-host concurrency and backoff.
+            parse_workers (int, optional): parse processes. Defaults to `BotArgs.PARSE_WORKERS`.
+            archive (PageArchive, optional): archive the fetched pages are written to, records are
+                compressed by the parse processes.
+        """
+        self.write = write
+        self.args = args
+        self.batch_size = batch_size
+        self.parse_workers = parse_workers or args.PARSE_WORKERS
+        self.bot = IntrolixBot(urls=[], args=args, seen=seen, validators=validators, hosts=hosts, archive=archive)
+
+        self._parse_pool = None
+        self._write_pool = None
+        self._loop = None
+
+    def _pools(self) -> tuple:
+        if self._parse_pool is None:
+            # spawn: the parent holds threads, SQLite connections and sockets a fork would copy.
+            # Spawned workers import the main script again (crawler.py), which only builds its
+            # state in `init`
+            self._parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers,
+                                                   mp_context=multiprocessing.get_context("spawn"),
+                                                   initializer=_init_parser,
+                                                   initargs=(self.args, self.bot.root_sites))
+            self._write_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="crawl-writer")
+        return self._parse_pool, self._write_pool
+
+    @staticmethod
+    async def _put(queue: asyncio.Queue, name: str, item):
+        if queue.full():
+            BACKPRESSURE.inc(queue=name)
+        await queue.put(item)
+        QUEUE_DEPTH.set(queue.qsize(), queue=name)
+
+    @staticmethod
+    async def _get(queue: asyncio.Queue, name: str):
+        item = await queue.get()
+        QUEUE_DEPTH.set(queue.qsize(), queue=name)
+        return item
+
+    async def _fetch_worker(self, session, url_iter, parse_queue: asyncio.Queue, write_queue: asyncio.Queue):
+        # every worker pulls from the same iterator, at most `MAX_CONCURRENCY` pages are in flight
+        for url in url_iter:
+            fetched, result, js_timestamp = await self.bot.fetch_page_async(session, url)
+            if fetched is not None:
+                result = self.bot.check_fetched(fetched, js_timestamp)
+
+            if result is not None:
+                await self._put(write_queue, 'write', result)
+            else:
+                await self._put(parse_queue, 'parse', (fetched, js_timestamp))
+            self.stats['fetched'] += 1
+
+    async def _parse_worker(self, pool: ProcessPoolExecutor, parse_queue: asyncio.Queue, write_queue: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            item = await self._get(parse_queue, 'parse')
+            if item is None:
+                return
+
+            fetched, js_timestamp = item
+            host = host_of(fetched.url)
+            try:
+                compression = self.bot.archive.compression if self.bot.archive is not None else None
+                result, parse_seconds, record, worker_metrics = await loop.run_in_executor(
+                    pool, _parse, fetched, js_timestamp, compression)
+            except BrokenProcessPool:
+                raise
+            except Exception as e:
+                logger.exception(f"Error parsing page: {fetched.url}")
+                result, parse_seconds, record = self.bot.error_result(fetched.url, fetched.status_code, js_timestamp,
+                                                                      e.__class__.__name__, str(e)), 0.0, None
+            else:
+                # stage timings and page outcome recorded by the worker
+                metrics.merge(worker_metrics)
+
+            PARSE_SECONDS.observe(parse_seconds, stage='process', host=host)
+
+            content = result.get('content')
+            if content is not None and self.bot.seen is not None:
+                # the workers have no seen filter, links to crawled pages are dropped here
+                content['links'] = sorted(self.bot.seen.filter_new(content['links']))
+
+            result = self.bot.finish_page(fetched, result, parse_seconds, js_timestamp, record)
+            await self._put(write_queue, 'write', result)
+            self.stats['parsed'] += 1
+
+    async def _write_worker(self, pool: ThreadPoolExecutor, write_queue: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        batch = []
+        flush_at = time.monotonic() + self.args.WRITE_FLUSH_SECONDS
+
+        while True:
+            try:
+                item = await asyncio.wait_for(self._get(write_queue, 'write'),
+                                              timeout=max(flush_at - time.monotonic(), 0.001))
+            except asyncio.TimeoutError:
+                item = ...
+
+            if item is not None and item is not ...:
+                batch.append(item)
+
+            # full batch, end of the crawl, or a partial batch waiting for too long
+            if batch and (len(batch) >= self.batch_size or item is None or time.monotonic() >= flush_at):
+                await loop.run_in_executor(pool, self.write, batch)
+                self.stats['written'] += len(batch)
+                self.stats['batches'] += 1
+                batch = []
+
+            if item is None:
+                return
+            if time.monotonic() >= flush_at:
+                flush_at = time.monotonic() + self.args.WRITE_FLUSH_SECONDS
+
+    async def run_async(self, urls: list) -> dict:
+        """
+        Crawl URLs through the fetch, parse and write stages. Every run must use the same event
+        loop, the connection pool is bound to the loop of the first one.
+
+        Args:
+            urls (list): URLs to crawl.
+        Returns:
+            dict: pages fetched, parsed and written, write batches and seconds taken.
+        """
+        self.stats = {'fetched': 0, 'parsed': 0, 'written': 0, 'batches': 0}
+        start = time.perf_counter()
+
+        if not urls:
+            return {**self.stats, 'seconds': 0.0}
+
+        parse_pool, write_pool = self._pools()
+        parse_queue = asyncio.Queue(maxsize=self.args.PARSE_QUEUE_SIZE)
+        write_queue = asyncio.Queue(maxsize=self.args.WRITE_QUEUE_SIZE)
+        url_iter = iter(urls)
+
+        if self.bot.async_http is None:
+            self.bot.async_http = AsyncHTTPPool(max_connections=self.args.POOL_MAX_CONNECTIONS,
+                                                connections_per_host=self.args.POOL_CONNECTIONS_PER_HOST,
+                                                keepalive_seconds=self.args.KEEPALIVE_SECONDS)
+
+        async with self.bot.async_http.session() as session:
+            fetchers = [asyncio.create_task(self._fetch_worker(session, url_iter, parse_queue, write_queue))
+                        for _ in range(max(1, min(self.args.MAX_CONCURRENCY, len(urls))))]
+            # two dispatchers per process keep every worker busy while results travel back
+            parsers = [asyncio.create_task(self._parse_worker(parse_pool, parse_queue, write_queue))
+                       for _ in range(self.parse_workers * 2)]
+            writer = asyncio.create_task(self._write_worker(write_pool, write_queue))
+
+            async def close_stages():
+                # each stage ends once the stage before it is done and its queue is drained
+                await asyncio.gather(*fetchers)
+                for _ in parsers:
+                    await self._put(parse_queue, 'parse', None)
+                await asyncio.gather(*parsers)
+                await self._put(write_queue, 'write', None)
+
+            tasks = [*fetchers, *parsers, writer, asyncio.create_task(close_stages())]
+            try:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+                for task in done:
+                    if task.exception() is not None:
+                        raise task.exception()
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        return {**self.stats, 'seconds': round(time.perf_counter() - start, 3)}
+
+    def run(self, urls: list) -> dict:
+        """
+        Function to crawl URLs through the pipeline, blocking until every result is written.
+
+        Args:
+            urls (list): URLs to crawl.
+        Returns:
+            dict: pages fetched, parsed and written, write batches and seconds taken.
+        """
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        try:
+            return self._loop.run_until_complete(self.run_async(urls))
+        finally:
+            logger.info(f"Connection pool stats: {self.bot.pool_stats()}")
+
+    def close(self):
+        if self._loop is not None:
+            if self.bot.async_http is not None:
+                self._loop.run_until_complete(self.bot.async_http.close())
+                self.bot.async_http = None
+            self._loop.close()
+            self._loop = None
+        if self._parse_pool is not None:
+            self._parse_pool.shutdown(cancel_futures=True)
+            self._write_pool.shutdown()
+            self._parse_pool = self._write_pool = None
@@ -0,0 +1,215 @@
+import math
+import threading
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING
+from pymongo.errors import PyMongoError
+
+from introlix_api.logger import logger
+from introlix_api.crawler.metrics import metrics, WRITE_SECONDS
+
+INSERTED_AT = "inserted_at"
+
+EVICTED = metrics.counter("crawler_retention_deleted_total", "Stored documents deleted by the retention policy",
+                          ("policy",))
+
+
+def inserted_now() -> datetime:
+    """
+    Function to get the insertion timestamp of a document, the field retention sorts on.
+    """
+    return datetime.now(timezone.utc)
+
+
+class RetentionManager:
+    """
+    Retention policy of the stored articles, enforced by a background thread.
+
+    Documents carry an indexed `inserted_at` timestamp, older documents get the
+    creation time of their ObjectId when the thread starts. Each check deletes the
+    documents older than `ttl_seconds`, then, when the collection is above
+    `max_bytes`, the oldest documents until it is back under `low_watermark` of
+    it, `delete_batch` documents at a time with a pause in between. Documents with
+    votes are never deleted when `protect_voted` is set.
+
+    The size comes from `collStats` once per check, off the write path. Between
+    checks writers report their inserts with `record_inserts`, which adds them to
+    the estimate and wakes the thread as soon as it passes `max_bytes`.
+    """
+    def __init__(self, collection, db, max_bytes: int | None = 500 * 1024 * 1024, ttl_seconds: float | None = None,
+                 delete_batch: int = 1000, check_seconds: float = 60.0, low_watermark: float = 0.9,
+                 protect_voted: bool = True, pause_seconds: float = 0.1):
+        """
+        Initialize the RetentionManager.
+
+        Args:
+            collection (pymongo.collection.Collection): collection of the stored articles.
+            db (pymongo.database.Database): database of the collection, for `collStats`.
+            max_bytes (int | None, optional): size above which the oldest documents are deleted, None for no
+                limit. Defaults to 500 MB.
+            ttl_seconds (float | None, optional): age after which documents are deleted, None to keep them.
+            delete_batch (int, optional): documents deleted per query. Defaults to 1000.
+            check_seconds (float, optional): seconds between two checks. Defaults to 60.
+            low_watermark (float, optional): share of `max_bytes` size eviction brings the collection down
+                to. Defaults to 0.9.
+            protect_voted (bool, optional): never delete documents with votes. Defaults to True.
+            pause_seconds (float, optional): pause between two delete batches. Defaults to 0.1.
+        """
+        self.collection = collection
+        self.db = db
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.delete_batch = delete_batch
+        self.check_seconds = check_seconds
+        self.low_watermark = low_watermark
+        self.protect_voted = protect_voted
+        self.pause_seconds = pause_seconds
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._size = 0
+        self._count = 0
+        self._pending = 0  # documents inserted since the last collStats
+
+    def _evictable(self, query: dict) -> dict:
+        if self.protect_voted:
+            # documents stored before votes existed have no vote field
+            return {**query, "content.vote": {"$in": [0, None]}}
+        return query
+
+    def ensure_indexes(self):
+        """
+        Function to create the index of the insertion timestamp.
+        """
+        self.collection.create_index([(INSERTED_AT, ASCENDING)])
+
+    def backfill(self):
+        """
+        Function to give an insertion timestamp to the documents stored before it, the
+        creation time of their ObjectId.
+        """
+        with WRITE_SECONDS.time(store='mongo', operation='retention_backfill'):
+            result = self.collection.update_many({INSERTED_AT: {"$exists": False}},
+                                                 [{"$set": {INSERTED_AT: {"$toDate": "$_id"}}}])
+        if result.modified_count:
+            logger.info(f"Gave an insertion time to {result.modified_count} stored documents")
+
+    def estimated_size(self) -> int:
+        """
+        Function to estimate the size of the collection, from the last `collStats` and the inserts since.
+
+        Returns:
+            int: bytes.
+        """
+        with self._lock:
+            if not self._count:
+                return self._size
+            return self._size + math.ceil(self._pending * self._size / self._count)
+
+    def record_inserts(self, count: int):
+        """
+        Function to account for documents just inserted, without a database call.
+
+        Args:
+            count (int): documents inserted.
+        """
+        with self._lock:
+            self._pending += count
+        if self.max_bytes is not None and self.estimated_size() >= self.max_bytes:
+            self._wake.set()
+
+    def refresh_size(self) -> int:
+        """
+        Function to read the size of the collection from `collStats`.
+
+        Returns:
+            int: bytes.
+        """
+        with WRITE_SECONDS.time(store='mongo', operation='collstats'):
+            stats = self.db.command("collStats", self.collection.name)
+        with self._lock:
+            self._size, self._count, self._pending = stats.get('size', 0), stats.get('count', 0), 0
+        return self._size
+
+    def _delete_oldest(self, query: dict, limit: int | None, policy: str) -> int:
+        """
+        Delete the oldest documents matching a query, a batch at a time.
+        """
+        deleted = 0
+        while not self._stop.is_set() and (limit is None or deleted < limit):
+            size = self.delete_batch if limit is None else min(self.delete_batch, limit - deleted)
+            with WRITE_SECONDS.time(store='mongo', operation='evict'):
+                ids = [doc["_id"] for doc in self.collection.find(query, {"_id": 1})
+                       .sort(INSERTED_AT, ASCENDING).limit(size)]
+                if not ids:
+                    break
+                deleted_count = self.collection.delete_many({"_id": {"$in": ids}}).deleted_count
+            deleted += deleted_count
+            EVICTED.inc(deleted_count, policy=policy)
+            if len(ids) < size:
+                break
+            self._stop.wait(self.pause_seconds)
+        return deleted
+
+    def enforce(self) -> dict:
+        """
+        Function to run one check of the policy now.
+
+        Returns:
+            dict: documents deleted for their age and for the size of the collection, size after the check.
+        """
+        deleted = {'ttl': 0, 'size': 0}
+
+        if self.ttl_seconds is not None:
+            cutoff = inserted_now() - timedelta(seconds=self.ttl_seconds)
+            deleted['ttl'] = self._delete_oldest(self._evictable({INSERTED_AT: {"$lt": cutoff}}), None, 'ttl')
+
+        size = self.refresh_size()
+        if self.max_bytes is not None and size >= self.max_bytes:
+            target = self.max_bytes * self.low_watermark
+            # the average document size is an estimate, check again until under the target
+            while size > target and self._count and not self._stop.is_set():
+                excess = size - target
+                count = self._delete_oldest(self._evictable({}), math.ceil(excess * self._count / size), 'size')
+                if not count:
+                    break
+                deleted['size'] += count
+                size = self.refresh_size()
+
+        if deleted['ttl'] or deleted['size']:
+            logger.info(f"Retention deleted {deleted['ttl']} expired and {deleted['size']} oldest documents, "
+                        f"{size} bytes stored")
+        return {**deleted, 'bytes': size}
+
+    def _run(self):
+        try:
+            self.backfill()
+        except PyMongoError as e:
+            logger.error(f"Retention backfill failed: {e}")
+
+        while not self._stop.is_set():
+            try:
+                self.enforce()
+            except PyMongoError as e:
+                logger.error(f"Retention check failed: {e}")
+            self._wake.wait(self.check_seconds)
+            self._wake.clear()
+
+    def start(self):
+        """
+        Function to start the background thread, once.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
@@ -0,0 +1,150 @@
+import time
+import threading
+from dataclasses import dataclass
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+
+
+@dataclass
+class RobotsEntry:
+    parser: RobotFileParser | None  # None for a negative entry (robots.txt could not be fetched)
+    expires_at: float
+
+
+class RobotsCache:
+    """
+    Cache of parsed robots.txt policies keyed by scheme and netloc.
+
+    One instance (`robots_cache`) is shared by every crawl worker in the process, so
+    robots.txt is downloaded once per host and TTL instead of once per URL.
+    """
+    def __init__(self, max_entries: int = 10000):
+        """
+        Initialize the RobotsCache.
+
+        Args:
+            max_entries (int, optional): maximum number of hosts kept. Defaults to 10000.
+        """
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key_for(url: str) -> str:
+        """
+        Function to get the cache key of a URL.
+
+        Args:
+            url (str): any URL on the site.
+        Returns:
+            str: scheme and netloc of the URL, e.g. `https://medium.com`.
+        """
+        parsed_url = urlparse(url)
+        return f"{parsed_url.scheme.lower()}://{parsed_url.netloc.lower()}"
+
+    def get(self, url: str) -> RobotsEntry | None:
+        """
+        Function to look up the robots policy for the site of a URL.
+
+        Args:
+            url (str): any URL on the site.
+        Returns:
+            RobotsEntry | None: cached entry, or None on a miss or an expired entry.
+        """
+        key = self.key_for(url)
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or entry.expires_at <= time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+
+            if entry.parser is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def set(self, url: str, parser: RobotFileParser | None, ttl: float) -> RobotsEntry:
+        """
+        Function to store the robots policy for the site of a URL.
+
+        Args:
+            url (str): any URL on the site.
+            parser (RobotFileParser | None): parsed robots.txt, None to store a failed fetch.
+            ttl (float): seconds the entry stays valid.
+        Returns:
+            RobotsEntry: stored entry.
+        """
+        key = self.key_for(url)
+        entry = RobotsEntry(parser=parser, expires_at=time.monotonic() + ttl)
+
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+
+            if len(self._entries) > self.max_entries:
+                self._evict()
+
+        return entry
+
+    def _evict(self):
+        """
+        Drop expired entries, then the oldest ones until the cache fits `max_entries`.
+        """
+        now = time.monotonic()
+        for key in [key for key, entry in self._entries.items() if entry.expires_at <= now]:
+            del self._entries[key]
+
+        while len(self._entries) > self.max_entries:
+            del self._entries[next(iter(self._entries))]
+
+    def crawl_delay(self, url: str, useragent: str) -> float | None:
+        """
+        Function to read the crawl-delay of a cached policy without counting a lookup.
+
+        Args:
+            url (str): any URL on the site.
+            useragent (str): user agent the delay applies to.
+        Returns:
+            float | None: crawl-delay in seconds, None if unknown.
+        """
+        with self._lock:
+            entry = self._entries.get(self.key_for(url))
+
+        if entry is None or entry.parser is None:
+            return None
+
+        delay = entry.parser.crawl_delay(useragent)
+        return float(delay) if delay is not None else None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.negative_hits = self.misses = 0
+
+    def stats(self) -> dict:
+        """
+        Function to report the cache hit and miss counts.
+
+        Returns:
+            dict: hits, negative hits, misses, hit ratio and number of cached hosts.
+        """
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'hit_ratio': (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+                'size': len(self._entries),
+            }
+
+
+robots_cache = RobotsCache()
@@ -0,0 +1,265 @@
+import os
+import math
+import struct
+import sqlite3
+import hashlib
+import threading
+import time
+
+from introlix_api.logger import logger
+from introlix_api.utils.canonical import canonicalize_url
+
+BLOOM_MAGIC = b"IXBLOOM1"
+BLOOM_HEADER = struct.Struct("<8sQIQQ")  # magic, bits, hashes, items, exact store rowid covered
+
+
+class BloomFilter:
+    """
+    Fixed size Bloom filter over strings or bytes.
+
+    Uses double hashing of one blake2b digest, so adding or checking an item costs
+    a single hash call whatever the number of hash functions.
+    """
+    def __init__(self, capacity: int, error_rate: float = 0.001, max_bytes: int | None = None):
+        """
+        Initialize the BloomFilter.
+
+        Args:
+            capacity (int): number of items the filter is sized for.
+            error_rate (float, optional): false positive rate at `capacity` items. Defaults to 0.001.
+            max_bytes (int, optional): upper bound on the memory of the bit array. The false positive
+                rate is higher than `error_rate` when the bound applies.
+        """
+        num_bits = math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        if max_bytes is not None:
+            num_bits = min(num_bits, max_bytes * 8)
+
+        self.num_bits = max(num_bits, 8)
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, item: str | bytes):
+        if isinstance(item, str):
+            item = item.encode("utf-8")
+        digest = hashlib.blake2b(item, digest_size=16).digest()
+        h1, h2 = struct.unpack("<QQ", digest)
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, item: str | bytes) -> bool:
+        """
+        Function to add an item.
+
+        Args:
+            item (str | bytes): item to add.
+        Returns:
+            bool: True if the item was not in the filter before.
+        """
+        new = False
+        for position in self._positions(item):
+            byte, bit = position >> 3, 1 << (position & 7)
+            if not self._bits[byte] & bit:
+                self._bits[byte] |= bit
+                new = True
+
+        if new:
+            self.count += 1
+        return new
+
+    def __contains__(self, item: str | bytes) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._bits)
+
+    def estimated_error_rate(self) -> float:
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+
+class SeenFilter:
+    """
+    Set of URLs the crawler has already fetched.
+
+    A Bloom filter answers most lookups from memory. Its positives are confirmed
+    against an exact store of URL digests in SQLite, so a false positive never drops
+    a new URL. The Bloom filter is saved next to the store; entries added after the
+    last save are replayed from the store on load.
+    """
+    def __init__(self, path: str, capacity: int = 5_000_000, error_rate: float = 0.001,
+                 max_bytes: int | None = 32 * 1024 * 1024, save_interval: float = 60.0):
+        """
+        Initialize the SeenFilter.
+
+        Args:
+            path (str): path prefix of the filter files (`<path>.bloom` and `<path>.sqlite3`).
+            capacity (int, optional): number of URLs the Bloom filter is sized for. Defaults to 5,000,000.
+            error_rate (float, optional): Bloom filter false positive rate at capacity. Defaults to 0.001.
+            max_bytes (int, optional): memory bound of the Bloom filter. Defaults to 32 MB.
+            save_interval (float, optional): minimum seconds between two saves by `maybe_save`. Defaults to 60.
+        """
+        self.bloom_path = f"{path}.bloom"
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.max_bytes = max_bytes
+        self.save_interval = save_interval
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(f"{path}.sqlite3", timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS seen (key BLOB PRIMARY KEY)")
+        self._conn.commit()
+
+        self.lookups = 0
+        self.bloom_negatives = 0
+        self.false_positives = 0
+        self._last_save = time.monotonic()
+
+        self.bloom, covered_rowid = self._load_bloom()
+        self._replay(covered_rowid)
+
+    @staticmethod
+    def key_for(url: str) -> str:
+        # variants of a URL are the same page
+        return canonicalize_url(url)
+
+    @staticmethod
+    def _digest(key: str) -> bytes:
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+    def _new_bloom(self) -> BloomFilter:
+        return BloomFilter(self.capacity, self.error_rate, self.max_bytes)
+
+    def _load_bloom(self) -> tuple[BloomFilter, int]:
+        bloom = self._new_bloom()
+
+        try:
+            with open(self.bloom_path, "rb") as f:
+                magic, num_bits, num_hashes, count, covered_rowid = BLOOM_HEADER.unpack(f.read(BLOOM_HEADER.size))
+                if magic != BLOOM_MAGIC or num_bits != bloom.num_bits or num_hashes != bloom.num_hashes:
+                    # sizing changed, rebuild from the exact store
+                    return bloom, 0
+
+                bits = f.read()
+                if len(bits) != bloom.nbytes:
+                    return bloom, 0
+        except (OSError, struct.error):
+            return bloom, 0
+
+        bloom._bits[:] = bits
+        bloom.count = count
+        return bloom, covered_rowid
+
+    def _replay(self, covered_rowid: int):
+        """
+        Add the store entries newer than the saved Bloom filter to it.
+        """
+        replayed = 0
+        cursor = self._conn.execute("SELECT rowid, key FROM seen WHERE rowid > ? ORDER BY rowid", (covered_rowid,))
+
+        for _, key in cursor:
+            self.bloom.add(key)
+            replayed += 1
+
+        if replayed:
+            logger.info(f"Seen filter replayed {replayed} URLs from {self.bloom_path}")
+
+    def seen(self, url: str) -> bool:
+        """
+        Function to check if a URL was already added.
+
+        Args:
+            url (str): URL to check.
+        Returns:
+            bool: True if the URL was added before.
+        """
+        digest = self._digest(self.key_for(url))
+
+        with self._lock:
+            self.lookups += 1
+
+            if digest not in self.bloom:
+                self.bloom_negatives += 1
+                return False
+
+            found = self._conn.execute("SELECT 1 FROM seen WHERE key = ?", (digest,)).fetchone() is not None
+            if not found:
+                self.false_positives += 1
+            return found
+
+    def filter_new(self, urls: list) -> list:
+        """
+        Function to drop the URLs that were already added.
+
+        Args:
+            urls (list): URLs to check.
+        Returns:
+            list: URLs not seen before, in the same order.
+        """
+        return [url for url in urls if not self.seen(url)]
+
+    def add(self, urls: list):
+        """
+        Function to add URLs to the filter.
+
+        Args:
+            urls (list): URLs to add.
+        """
+        digests = [self._digest(self.key_for(url)) for url in urls]
+
+        with self._lock:
+            self._conn.executemany("INSERT OR IGNORE INTO seen (key) VALUES (?)", [(d,) for d in digests])
+            self._conn.commit()
+
+            for digest in digests:
+                self.bloom.add(digest)
+
+    def save(self):
+        """
+        Function to write the Bloom filter to disk atomically.
+        """
+        with self._lock:
+            covered_rowid = self._conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM seen").fetchone()[0]
+            header = BLOOM_HEADER.pack(BLOOM_MAGIC, self.bloom.num_bits, self.bloom.num_hashes,
+                                       self.bloom.count, covered_rowid)
+
+            tmp_path = f"{self.bloom_path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(header)
+                f.write(self.bloom._bits)
+            os.replace(tmp_path, self.bloom_path)
+
+            self._last_save = time.monotonic()
+
+    def maybe_save(self):
+        """
+        Function to save the Bloom filter if `save_interval` passed since the last save.
+        """
+        if time.monotonic() - self._last_save >= self.save_interval:
+            self.save()
+
+    def stats(self) -> dict:
+        """
+        Function to report the filter size and lookup counts.
+
+        Returns:
+            dict: items, memory, estimated false positive rate and lookup counts.
+        """
+        with self._lock:
+            return {
+                'items': self.bloom.count,
+                'bloom_bytes': self.bloom.nbytes,
+                'estimated_error_rate': self.bloom.estimated_error_rate(),
+                'lookups': self.lookups,
+                'bloom_negatives': self.bloom_negatives,
+                'false_positives': self.false_positives,
+            }
+
+    def close(self):
+        self.save()
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,102 @@
+import os
+import json
+import time
+
+from introlix_api.logger import logger
+from introlix_api.crawler.metrics import MetricsRegistry, metrics
+from introlix_api.crawler.throttle import HostController, host_controller
+
+STATUS_FILE = "status.json"
+
+
+class CrawlStatus:
+    """
+    Host states and metrics of the crawler process, published for the web app.
+
+    `start.sh` runs the crawler apart from the API, so the routes can't read its
+    host controller and metrics registry. The crawler writes them to a JSON file of
+    its state directory, atomically, every `interval` seconds; the `/crawler/hosts`
+    and `/metrics` routes read that file.
+    """
+    def __init__(self, state_dir: str, interval: float = 10.0):
+        """
+        Initialize the CrawlStatus.
+
+        Args:
+            state_dir (str): state directory of the crawler, the status file is written in it.
+            interval (float, optional): minimum seconds between two writes by `maybe_publish`. Defaults to 10.
+        """
+        self.path = os.path.join(state_dir, STATUS_FILE)
+        self.interval = interval
+        self._last_publish = None
+
+    def publish(self, hosts: HostController = host_controller, registry: MetricsRegistry = metrics):
+        """
+        Function to write the current host states and metrics.
+
+        Args:
+            hosts (HostController, optional): host controller of the crawler.
+            registry (MetricsRegistry, optional): metrics of the crawler.
+        """
+        status = {
+            'published_at': time.time(),
+            'pid': os.getpid(),
+            'initial_limit': min(hosts.initial_limit, hosts.max_limit),
+            'hosts': hosts.snapshot(),
+            'metrics': registry.render(),
+            'summary': registry.summary(),
+        }
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(status, f)
+        os.replace(tmp_path, self.path)
+        self._last_publish = time.monotonic()
+
+    def maybe_publish(self, hosts: HostController = host_controller, registry: MetricsRegistry = metrics):
+        """
+        Function to publish if `interval` passed since the last write.
+        """
+        if self._last_publish is None or time.monotonic() - self._last_publish >= self.interval:
+            self.publish(hosts, registry)
+
+    def read(self) -> dict | None:
+        """
+        Function to read the last published status.
+
+        Returns:
+            dict | None: status, None if the crawler published none yet.
+        """
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.info(f"Ignoring an unreadable crawl status {self.path}: {e}")
+            return None
+
+    def hosts(self, throttled_only: bool = False) -> list | None:
+        """
+        Function to get the published host states, as `HostController.snapshot`.
+
+        Args:
+            throttled_only (bool, optional): only hosts set aside or below their initial limit.
+        Returns:
+            list | None: host states, with the seconds each host is still set aside for. None if the
+                crawler published none yet.
+        """
+        status = self.read()
+        if status is None:
+            return None
+
+        age = max(time.time() - status['published_at'], 0.0)
+        hosts = []
+        for state in status['hosts']:
+            state['blocked_for'] = round(max(state['blocked_for'] - age, 0.0), 1)
+            throttled = state['blocked_for'] > 0 or state['limit'] < status['initial_limit']
+            if throttled or not throttled_only:
+                hosts.append(state)
+
+        return sorted(hosts, key=lambda s: (-s['blocked_for'], s['limit'], s['host']))
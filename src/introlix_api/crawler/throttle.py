@@ -0,0 +1,314 @@
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, asdict
+from email.utils import parsedate_to_datetime
+
+from introlix_api.logger import logger
+from introlix_api.crawler.metrics import metrics
+
+HOST_EVENTS = metrics.counter("crawler_host_events_total", "Concurrency and backoff changes of a host",
+                              ("event", "host"))
+
+THROTTLE_STATUSES = (429, 503)
+
+
+class HostBlocked(Exception):
+    """
+    Raised when a host is set aside and must not be requested before `until`.
+    """
+    def __init__(self, host: str, until: float, reason: str):
+        super().__init__(f"Host {host} is set aside for {max(until - time.time(), 0):.0f}s: {reason}")
+        self.host = host
+        self.until = until
+        self.reason = reason
+
+
+@dataclass
+class HostState:
+    host: str
+    limit: float
+    in_flight: int = 0
+    latency: float | None = None     # moving average of the time to first byte
+    error_rate: float = 0.0          # moving average of failed requests
+    consecutive_failures: int = 0
+    backoffs: int = 0                # backoffs in a row, grows the next backoff
+    blocked_until: float = 0.0
+    block_reason: str = ""
+    requests: int = 0
+    failures: int = 0
+    throttled: int = 0
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Function to read a `Retry-After` header, in seconds or as an HTTP date.
+
+    Args:
+        value (str | None): header value.
+    Returns:
+        float | None: seconds to wait, None if the header is missing or invalid.
+    """
+    if not value:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class HostController:
+    """
+    Adaptive per-host concurrency, timeouts and backoff (AIMD).
+
+    Each host starts with `initial_limit` requests in flight. Fast answers raise the
+    limit additively, by about one request per `limit` answers, up to `max_limit`.
+    Slow answers, errors and 429/503 answers cut it by `decrease_factor`. A 429/503
+    sets the host aside for its `Retry-After`, and `failure_threshold` failures in a
+    row set it aside for an exponential backoff.
+
+    The controller is shared by the bots of a process, like the robots cache, and
+    its state is served by the `/crawler/hosts` route.
+    """
+    def __init__(self, initial_limit: int = 2, max_limit: int = 4, latency_target: float = 1.0,
+                 decrease_factor: float = 0.5, failure_threshold: int = 5, backoff_seconds: float = 30.0,
+                 max_backoff_seconds: float = 3600.0, timeout_factor: float = 4.0, min_timeout: float = 1.0,
+                 poll_interval: float = 0.05):
+        """
+        Initialize the HostController.
+
+        Args:
+            initial_limit (int, optional): requests in flight allowed to a new host. Defaults to 2.
+            max_limit (int, optional): upper bound of a host's limit. Defaults to 4.
+            latency_target (float, optional): time to first byte above which a host is slowed down. Defaults to 1.0.
+            decrease_factor (float, optional): multiplier applied to the limit on congestion. Defaults to 0.5.
+            failure_threshold (int, optional): failures in a row that set a host aside. Defaults to 5.
+            backoff_seconds (float, optional): first backoff after repeated failures, doubled each time. Defaults to 30.
+            max_backoff_seconds (float, optional): upper bound of a backoff or Retry-After. Defaults to 3600.
+            timeout_factor (float, optional): request timeout as a multiple of the host latency. Defaults to 4.0.
+            min_timeout (float, optional): lower bound of the adaptive timeout. Defaults to 1.0.
+            poll_interval (float, optional): seconds between two checks for a free slot. Defaults to 0.05.
+        """
+        self.initial_limit = initial_limit
+        self.max_limit = max(max_limit, 1)
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.failure_threshold = failure_threshold
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.timeout_factor = timeout_factor
+        self.min_timeout = min_timeout
+        self.poll_interval = poll_interval
+
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _state(self, host: str) -> HostState:
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = HostState(host=host, limit=float(min(self.initial_limit, self.max_limit)))
+        return state
+
+    def _decrease(self, state: HostState):
+        limit = max(1.0, state.limit * self.decrease_factor)
+        if int(limit) < int(state.limit):
+            HOST_EVENTS.inc(event='decrease', host=state.host)
+        state.limit = limit
+
+    def _block(self, state: HostState, seconds: float, reason: str):
+        seconds = min(seconds, self.max_backoff_seconds)
+        state.blocked_until = max(state.blocked_until, time.time() + seconds)
+        state.block_reason = reason
+        HOST_EVENTS.inc(event='backoff', host=state.host)
+        logger.info(f"Host {state.host} set aside for {seconds:.0f}s: {reason}")
+
+    def blocked_for(self, host: str) -> float:
+        """
+        Function to get the seconds a host is still set aside for.
+
+        Args:
+            host (str): host, as in the URL netloc.
+        Returns:
+            float: seconds left, 0 if the host can be requested.
+        """
+        with self._lock:
+            state = self._hosts.get(host)
+            return max(state.blocked_until - time.time(), 0.0) if state is not None else 0.0
+
+    def limit(self, host: str) -> int:
+        """
+        Function to get the requests a host can have in flight now.
+
+        Args:
+            host (str): host, as in the URL netloc.
+        Returns:
+            int: concurrency limit of the host, 0 while it is set aside.
+        """
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None:
+                return min(self.initial_limit, self.max_limit)
+            if state.blocked_until > time.time():
+                return 0
+            return int(state.limit)
+
+    def check(self, host: str):
+        """
+        Function to raise `HostBlocked` if a host is set aside.
+        """
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is not None and state.blocked_until > time.time():
+                raise HostBlocked(host, state.blocked_until, state.block_reason)
+
+    def timeout(self, host: str, max_timeout: float) -> float:
+        """
+        Function to get the request timeout of a host, a multiple of its latency.
+
+        Args:
+            host (str): host, as in the URL netloc.
+            max_timeout (float): timeout of a host without latency measure, and upper bound.
+        Returns:
+            float: timeout in seconds.
+        """
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None or state.latency is None:
+                return max_timeout
+            return min(max_timeout, max(self.min_timeout, state.latency * self.timeout_factor))
+
+    def _try_acquire(self, host: str) -> bool:
+        with self._lock:
+            state = self._state(host)
+            if state.blocked_until > time.time():
+                raise HostBlocked(host, state.blocked_until, state.block_reason)
+
+            if state.in_flight < int(state.limit):
+                state.in_flight += 1
+                return True
+            return False
+
+    def _release(self, host: str):
+        with self._lock:
+            state = self._state(host)
+            state.in_flight = max(state.in_flight - 1, 0)
+
+    @asynccontextmanager
+    async def slot(self, host: str):
+        """
+        Async context manager holding one of the host's request slots.
+
+        Waits while the host is at its limit. Raises `HostBlocked` if the host is,
+        or gets, set aside while waiting.
+        """
+        while not self._try_acquire(host):
+            await asyncio.sleep(self.poll_interval)
+        try:
+            yield
+        finally:
+            self._release(host)
+
+    def record_response(self, host: str, status_code: int, latency: float, retry_after: str | None = None):
+        """
+        Function to adjust a host's limit from an HTTP answer.
+
+        Args:
+            host (str): host, as in the URL netloc.
+            status_code (int): HTTP status of the answer.
+            latency (float): time to first byte, in seconds.
+            retry_after (str, optional): `Retry-After` header of the answer.
+        """
+        with self._lock:
+            state = self._state(host)
+            state.requests += 1
+
+            if status_code in THROTTLE_STATUSES:
+                state.throttled += 1
+                state.error_rate = 0.8 * state.error_rate + 0.2
+                self._decrease(state)
+                wait = parse_retry_after(retry_after)
+                if wait is None:
+                    wait = self.backoff_seconds * 2 ** state.backoffs
+                    state.backoffs += 1
+                self._block(state, wait, f"HTTP {status_code}")
+                return
+
+            if status_code >= 500:
+                self._failure(state, f"HTTP {status_code}")
+                return
+
+            state.latency = latency if state.latency is None else 0.7 * state.latency + 0.3 * latency
+            state.error_rate *= 0.8
+            state.consecutive_failures = 0
+            state.backoffs = 0
+
+            if latency > self.latency_target:
+                self._decrease(state)
+            else:
+                limit = min(float(self.max_limit), state.limit + 1.0 / state.limit)
+                if int(limit) > int(state.limit):
+                    HOST_EVENTS.inc(event='increase', host=host)
+                state.limit = limit
+
+    def record_failure(self, host: str, reason: str):
+        """
+        Function to count a request to a host that failed without an answer (timeout, connection error).
+
+        Args:
+            host (str): host, as in the URL netloc.
+            reason (str): error name, shown in the host state.
+        """
+        with self._lock:
+            state = self._state(host)
+            state.requests += 1
+            self._failure(state, reason)
+
+    def _failure(self, state: HostState, reason: str):
+        state.failures += 1
+        state.consecutive_failures += 1
+        state.error_rate = 0.8 * state.error_rate + 0.2
+        self._decrease(state)
+
+        if state.consecutive_failures >= self.failure_threshold:
+            self._block(state, self.backoff_seconds * 2 ** state.backoffs,
+                        f"{state.consecutive_failures} failures in a row, last: {reason}")
+            state.backoffs += 1
+            state.consecutive_failures = 0
+
+    def snapshot(self, throttled_only: bool = False) -> list:
+        """
+        Function to get the state of every host, throttled hosts first.
+
+        Args:
+            throttled_only (bool, optional): only hosts set aside or below their initial limit.
+        Returns:
+            list: host states, with the seconds each host is still set aside for.
+        """
+        now = time.time()
+        with self._lock:
+            states = [asdict(state) for state in self._hosts.values()]
+
+        hosts = []
+        for state in states:
+            state['limit'] = int(state['limit'])
+            state['blocked_for'] = round(max(state.pop('blocked_until') - now, 0.0), 1)
+            state['latency'] = round(state['latency'], 4) if state['latency'] is not None else None
+            state['error_rate'] = round(state['error_rate'], 3)
+            throttled = state['blocked_for'] > 0 or state['limit'] < min(self.initial_limit, self.max_limit)
+            if throttled or not throttled_only:
+                hosts.append(state)
+
+        return sorted(hosts, key=lambda s: (-s['blocked_for'], s['limit'], s['host']))
+
+    def clear(self):
+        with self._lock:
+            self._hosts.clear()
+
+
+host_controller = HostController()
@@ -0,0 +1,205 @@
+import re
+from urllib.parse import urlparse
+
+from introlix_api.utils.canonical import strip_tracking
+
+# a URL holding any of these is never an article
+NON_ARTICLE_KEYWORDS = (
+    "/product", "/products", "/home", "/item", "/items", "/category", "/categories",
+    "/login", "/signin", "/logout", "/signup", "/register", "/account", "/user",
+    "/profile", "/dashboard", "/settings", "/preferences", "/order", "/orders",
+    "/cart", "/checkout", "/payment", "/subscribe", "/subscription",
+    "/contact", "/support", "/help", "/faq", "/about", "/privacy", "/terms",
+    "/policy", "/conditions", "/legal", "/service", "/services", "/guide",
+    "/how-to", "/pricing", "/price", "fees", "/plans", "/features", "/partners",
+    "/team", "/careers", "/jobs", "/join", "/apply", "/training", "/demo",
+    "/trial", "/download", "/install", "/app", "/apps", "/software", "/portal",
+    "/index", "/main", "/video", "/videos", "/photo", "/photos",
+    "/image", "/images", "/gallery", "/portfolio", "/showcase", "/testimonials",
+    "/reviews", "/search", "/find", "/browse", "/list", "/tags", "/explore",
+    "/new", "/trending", "/latest", "/promotions", "/offers", "/deals", "/discount",
+    "/coupon", "/coupons", "/gift", "/store", "/stores", "/locator", "/locations",
+    "/branches", "/events", "/webinar", "/calendar", "/schedule",
+    "/class", "/classes", "/lesson", "/lessons", "/training", "/activity",
+    "/activities", "/workshop", "/exhibit", "/performance", "/map", "/directions",
+    "/weather", "/traffic", "/rates", "/auction", "/bid", "/tender", "/investment",
+    "/loan", "/mortgage", "/property", "/real-estate", "/construction", "/project",
+    "/client", "/clients", "/partner", "/sponsor", "/media", "/press", "/releases",
+    "/announcements", "/newsroom", "/resources", "courses", "collections", "/u/", "/members/",
+    "/@", "/shop", "/wiki", "/author", "/dynamic", "/image", "/submit"  # TODO: need to add more
+)
+
+# a URL holding any of these is an article, unless it only matched a pattern
+ARTICLE_KEYWORDS = (
+    "/blog/", "post", "article", "insights", "guide", "tutorial",
+    "how-to", "what", "how", "introduction", "/news/"
+)
+
+ARTICLE_PATTERNS = (
+    r'/(/blog/|article|articles|post|posts|blogs|news|)/\d{4}/\d{2}/+[a-z0-9-]+/?',
+    r'/(/blog/|article|articles|post|posts|blogs|news|)/[a-z0-9-]+/[a-z0-9-]+',
+    r'(?<!\/\/www)(/blog/|article|articles|post|posts|blogs|news|)/[a-z0-9-]+',
+    r'^(?!.*\/category\/).*\/[a-z0-9-]+\/[a-z0-9-]+(-[a-z0-9-]+)+$',
+    r'/[^/]+/\d{4}/\d{2}/\d{2}/+[a-z0-9]+/?',
+    r'/[^/]+/\d{4}/\d{2}/+[a-z0-9]+/?',
+    r'/[a-z0-9-]+/\d{4}/\d{2}/+/?',
+    r'/[a-z0-9-]+/\d{4}/\d{2}/\d{2}/+/?',
+)
+
+# rules of GenericSpider.is_this_article, run on the raw hrefs of a page
+SPIDER_NON_ARTICLE_KEYWORDS = (
+    "category", "signup", "login", "about", "contact",  # Add more non-article keywords...
+)
+
+SPIDER_ARTICLE_PATTERNS = (
+    r'/(blog|article|articles|post|blog|posts|blogs|)/\d{4}/\d{2}/+[a-z0-9-]+/?',
+    r'/(blog|article|articles|post|blog|posts|blogs|)/[a-z0-9-]+/[a-z0-9-]+',
+    r'(?<!\/\/www)(blog|article|articles|post|posts|blogs)/[a-z0-9-]+',
+    r'^(?!.*\/category\/).*\/[a-z0-9-]+\/[a-z0-9-]+(-[a-z0-9-]+)+$',
+    r'/[^/]+/\d{4}/\d{2}/\d{2}/+[a-z0-9]+/?',
+    r'/[^/]+/\d{4}/\d{2}/+[a-z0-9]+/?',
+    r'/[a-z0-9-]+/\d{4}/\d{2}/+/?',
+    r'/[a-z0-9-]+/\d{4}/\d{2}/\d{2}/+/?',
+)
+
+
+# path of a URL without ;params, the only part urlparse parses differently from urlsplit
+URL_PATH_PATTERN = re.compile(r"[a-zA-Z][a-zA-Z0-9+.-]*://[^/?#;\t\r\n]*([^?#;\t\r\n]*)(?:[?#]|$)")
+
+
+def _trie_regex(node: dict) -> str:
+    if '' in node:
+        return ''  # a keyword ends here, longer ones holding it match anyway
+    branches = [re.escape(char) + _trie_regex(child) for char, child in sorted(node.items())]
+    if len(branches) == 1:
+        return branches[0]
+    return "(?:" + "|".join(branches) + ")"
+
+
+def compile_keywords(keywords) -> re.Pattern | None:
+    """
+    Function to compile substrings into one regex, a search matches when the text holds any of them.
+
+    The keywords are merged into a trie, so at each position of the text the regex
+    follows one branch per character instead of trying every keyword in turn.
+
+    Args:
+        keywords (iterable): substrings to find.
+    Returns:
+        re.Pattern | None: compiled regex, None when there is no keyword.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+    if not trie:
+        return None
+    return re.compile(_trie_regex(trie))
+
+
+def url_path(url: str) -> str:
+    """
+    Function to get the path of a URL, as `urlparse(url).path`.
+    """
+    match = URL_PATH_PATTERN.match(url)
+    if match is None:
+        return urlparse(url).path
+    return match.group(1)
+
+
+def compile_patterns(patterns) -> re.Pattern | None:
+    """
+    Function to compile regexes into one alternation, a search matches when any of them matches.
+    """
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{pattern})" for pattern in patterns))
+
+
+class UrlClassifier:
+    """
+    Article URL classifier, its rules compiled once.
+
+    A URL is an article when it matches an article pattern and holds no non-article
+    keyword, or when it holds an article keyword, or when its last path segment is a
+    slug of at least `slug_words` words. The patterns are one alternation and each
+    keyword set one trie-shaped regex, so a URL is scanned once per set instead of
+    once per pattern and keyword.
+    """
+    def __init__(self, article_patterns=ARTICLE_PATTERNS, non_article_keywords=NON_ARTICLE_KEYWORDS,
+                 article_keywords=ARTICLE_KEYWORDS, slug_words: int = 3, ignore_tracking: bool = True):
+        """
+        Initialize the UrlClassifier.
+
+        Args:
+            article_patterns (tuple, optional): regexes of article URLs.
+            non_article_keywords (tuple, optional): substrings of URLs that are never articles.
+            article_keywords (tuple, optional): substrings of article URLs.
+            slug_words (int, optional): words of a last path segment that make an article, None to
+                disable the rule. Defaults to 3.
+            ignore_tracking (bool, optional): classify the URLs without their fragment and tracking
+                parameters, and reject the root pages of sites. Defaults to True.
+        """
+        self.article_patterns = compile_patterns(article_patterns)
+        self.non_article_keywords = compile_keywords(non_article_keywords)
+        self.article_keywords = compile_keywords(article_keywords)
+        self.slug_words = slug_words
+        self.ignore_tracking = ignore_tracking
+
+    def is_article(self, url: str) -> bool:
+        """
+        Function to check if a URL is an article URL.
+
+        Args:
+            url (str): URL to classify.
+        Returns:
+            bool: True if the URL is an article URL else False.
+        """
+        path = None
+        if self.ignore_tracking:
+            # tracking parameters and fragments must not decide if a page is an article. The URL
+            # is not canonicalized: the rules match trailing slashes and case, canonical URLs
+            # are only dedup keys
+            url = strip_tracking(url)
+            path = url_path(url)
+            if path in ('', '/'):
+                return False
+
+        if self.article_patterns is not None and self.article_patterns.search(url):
+            if self.non_article_keywords is None or not self.non_article_keywords.search(url):
+                return True
+
+        if self.article_keywords is not None and self.article_keywords.search(url):
+            return True
+
+        if self.slug_words is not None:
+            if path is None:
+                path = url_path(url)
+            last_segment = path.strip('/').split('/')[-1]
+            if '-' in last_segment and len(last_segment.split('-')) >= self.slug_words:
+                return True
+
+        return False
+
+    def classify(self, urls: list) -> list:
+        """
+        Function to classify a batch of URLs.
+
+        Args:
+            urls (list): URLs to classify.
+        Returns:
+            list: True for every article URL, in the order of `urls`.
+        """
+        is_article = self.is_article
+        return [is_article(url) for url in urls]
+
+
+# rules of the crawler, shared by `filter_urls` and the sitemap discovery
+url_classifier = UrlClassifier()
+
+# rules of GenericSpider, run on links before they are resolved
+spider_url_classifier = UrlClassifier(article_patterns=SPIDER_ARTICLE_PATTERNS,
+                                      non_article_keywords=SPIDER_NON_ARTICLE_KEYWORDS,
+                                      article_keywords=(), slug_words=None, ignore_tracking=False)
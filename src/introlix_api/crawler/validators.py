@@ -0,0 +1,128 @@
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS validators (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    content_bytes INTEGER NOT NULL DEFAULT 0,
+    parse_seconds REAL NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class ValidatorStore:
+    """
+    `ETag` / `Last-Modified` validators of crawled pages.
+
+    Revisits send them back as `If-None-Match` / `If-Modified-Since`, and a 304
+    answer lets the crawler skip downloading, parsing and saving the page. The
+    size and parse time of the last full fetch are kept to report what each 304
+    saved.
+    """
+    def __init__(self, path: str):
+        """
+        Initialize the ValidatorStore.
+
+        Args:
+            path (str): SQLite file of the store. Created if missing.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+        self.reset_summary()
+
+    def conditional_headers(self, url: str) -> dict:
+        """
+        Function to build the conditional request headers of a URL.
+
+        Args:
+            url (str): URL about to be fetched.
+        Returns:
+            dict: `If-None-Match` / `If-Modified-Since` headers, empty if the URL has no validators.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT etag, last_modified FROM validators WHERE url = ?", (url,)).fetchone()
+
+        headers = {}
+        if row is not None:
+            etag, last_modified = row
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def record(self, url: str, headers: dict, content_bytes: int, parse_seconds: float):
+        """
+        Function to store the validators of a fully fetched page.
+
+        Args:
+            url (str): fetched URL.
+            headers (dict): response headers, lower-cased names.
+            content_bytes (int): size of the body read.
+            parse_seconds (float): seconds spent extracting the page.
+        """
+        etag, last_modified = headers.get('etag'), headers.get('last-modified')
+
+        with self._lock:
+            self.full_fetches += 1
+
+            if not etag and not last_modified:
+                # nothing to revalidate with next time
+                self._conn.execute("DELETE FROM validators WHERE url = ?", (url,))
+            else:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO validators "
+                    "(url, etag, last_modified, content_bytes, parse_seconds, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (url, etag, last_modified, content_bytes, parse_seconds, time.time()),
+                )
+            self._conn.commit()
+
+    def record_not_modified(self, url: str):
+        """
+        Function to count a 304 answer and what it saved.
+
+        Args:
+            url (str): revisited URL.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT content_bytes, parse_seconds FROM validators WHERE url = ?",
+                                     (url,)).fetchone()
+            self.not_modified += 1
+            if row is not None:
+                self.bytes_saved += row[0]
+                self.parse_seconds_saved += row[1]
+
+    def reset_summary(self):
+        self.full_fetches = 0
+        self.not_modified = 0
+        self.bytes_saved = 0
+        self.parse_seconds_saved = 0.0
+
+    def summary(self) -> dict:
+        """
+        Function to report the revalidations since the last `reset_summary`.
+
+        Returns:
+            dict: full fetches, 304 answers, and the bytes and parse time they saved.
+        """
+        return {
+            'full_fetches': self.full_fetches,
+            'not_modified': self.not_modified,
+            'bytes_saved': self.bytes_saved,
+            'parse_seconds_saved': round(self.parse_seconds_saved, 3),
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
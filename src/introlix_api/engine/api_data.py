@@ -1,7 +1,13 @@
 from introlix_api.engine.third_party_apis import get_devDotTo_data
 from introlix_api.engine.graphql import fetch_hashnode_posts
 from introlix_api.app.database import search_data
+from introlix_api.crawler.retention import INSERTED_AT, inserted_now
+from introlix_api.crawler.bulk_writer import BulkWriter
 from introlix_api.logger import logger
+from introlix_api.utils.fingerprint import fingerprint, to_int64, drop_near_duplicates, SKIP
+
+NEAR_DUPLICATE_DISTANCE = 3
+NEAR_DUPLICATE_MODE = SKIP
 
 def fetch_data(page: int = 1, per_page: int = 10, tag = ''):
     """
@@ -85,17 +91,23 @@ def batch_converter(lst: list, batch_size: int):
         yield lst[i:i + batch_size]
 
 if __name__ == '__main__':
-            
+    # near-duplicate lookups go through the fingerprint bands
+    search_data.create_index("simhash_bands")
+    writer = BulkWriter(search_data)
+    writer.ensure_indexes()
+
     for page_no in range(1, 1001):
         data = fetch_data(page=page_no)
         if data:
             for batch in batch_converter(data, batch_size=100):
-                urls = [d["url"] for d in data]
-
-                existing_urls = {doc["url"] for doc in search_data.find({"url": {"$in": urls}})}
-
+                # the same post syndicated on several platforms only keeps its first copy
                 for d in batch:
-                    if d["url"] not in existing_urls:
-                        search_data.insert_one(d)
+                    d["simhash"] = to_int64(fingerprint(d["content"]["title"], d["content"]["desc"]))
+                    d[INSERTED_AT] = inserted_now()
+
+                # posts already stored are skipped by the upserts
+                report = writer.write(drop_near_duplicates(search_data, batch, max_distance=NEAR_DUPLICATE_DISTANCE,
+                                                           mode=NEAR_DUPLICATE_MODE))
+                logger.info(f"Page {page_no}: {report.inserted} posts inserted, {report.duplicates} already stored")
         else:
             logger.debug("No data to save")
\ No newline at end of file
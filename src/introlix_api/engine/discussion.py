@@ -2,6 +2,8 @@ from introlix_api.engine.third_party_apis import get_stack_overflow_data
 from introlix_api.utils.tags import fetch_tags
 from introlix_api.logger import logger
 from introlix_api.app.database import search_data
+from introlix_api.crawler.retention import INSERTED_AT, inserted_now
+from introlix_api.crawler.bulk_writer import BulkWriter
 
 def fetch_discussion(page: int = 1, per_page: int = 10, tag: str = ''):
     """
@@ -27,15 +29,17 @@ def fetch_discussion(page: int = 1, per_page: int = 10, tag: str = ''):
     return data
 
 if __name__ == '__main__':
+    writer = BulkWriter(search_data)
+    writer.ensure_indexes()
+
     for tag in fetch_tags():
         data = fetch_discussion(page=1, per_page=10, tag=tag)
         if data:
-            urls = [d["url"] for d in data]
-
-            existing_urls = {doc["url"] for doc in search_data.find({"url": {"$in": urls}})}
-
             for d in data:
-                if d["url"] not in existing_urls:
-                    search_data.insert_one(d)
+                d[INSERTED_AT] = inserted_now()
+
+            # discussions already stored are skipped by the upserts
+            report = writer.write(data)
+            logger.debug(f"{tag}: {report.inserted} discussions inserted, {report.duplicates} already stored")
         else:
             logger.debug("No data to save")
\ No newline at end of file
@@ -0,0 +1,182 @@
+import re
+from urllib.parse import urlsplit, urlunsplit, urljoin, parse_qsl, urlencode, quote
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# query parameters that only track the visit, they never change the page
+TRACKING_PARAMS = {
+    'fbclid', 'gclid', 'dclid', 'gbraid', 'wbraid', 'msclkid', 'yclid', 'twclid', 'igshid',
+    'mc_cid', 'mc_eid', '_hsenc', '_hsmi', 'mkt_tok', 'ref_src', 'ref_url', 'spm', 'si',
+}
+TRACKING_PREFIXES = ('utm_',)
+
+PERCENT_ESCAPE_PATTERN = re.compile(r"%([0-9A-Fa-f]{2})")
+UNRESERVED = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~")
+PATH_SAFE = "/%:@!$&'()*+,;=-._~"
+
+# second-level labels country domains register names under (`example.co.uk`, `example.com.au`)
+COUNTRY_SECOND_LEVELS = {'co', 'com', 'net', 'org', 'gov', 'edu', 'ac', 'or', 'ne', 'go'}
+
+
+def is_tracking_param(name: str) -> bool:
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def _normalize_escapes(value: str) -> str:
+    """
+    Decode the percent escapes of unreserved characters and upper-case the others.
+    """
+    def replace(match):
+        char = chr(int(match.group(1), 16))
+        return char if char in UNRESERVED else f"%{match.group(1).upper()}"
+
+    return PERCENT_ESCAPE_PATTERN.sub(replace, value)
+
+
+def remove_dot_segments(path: str) -> str:
+    """
+    Resolve the `.` and `..` segments of a path (RFC 3986, section 5.2.4).
+    """
+    segments = []
+    for segment in path.split('/'):
+        if segment == '..':
+            if len(segments) > 1:
+                segments.pop()
+        elif segment != '.':
+            segments.append(segment)
+
+    if path.endswith(('/.', '/..')):
+        segments.append('')
+    return '/'.join(segments)
+
+
+def strip_tracking(url: str) -> str:
+    """
+    Function to drop the fragment and tracking parameters of a URL, leaving the rest as is.
+
+    Unlike `canonicalize_url` the result is always safe to fetch: host, path and the
+    order of the other parameters are not touched.
+
+    Args:
+        url (str): URL to clean.
+    Returns:
+        str: URL without fragment and tracking parameters.
+    """
+    url = url.strip()
+
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return url
+
+    query = parts.query
+    if query:
+        params = query.split('&')
+        kept = [param for param in params if not is_tracking_param(param.split('=', 1)[0])]
+        if len(kept) != len(params):
+            query = '&'.join(kept)
+
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, query, ''))
+
+
+def canonicalize_url(url: str, base: str = None) -> str:
+    """
+    Function to get the canonical form of a URL, used as the dedup key of crawled pages.
+
+    Variants of a page map to the same key: the fragment and tracking parameters
+    (`utm_*`, `fbclid`, `gclid`, ...) are dropped, scheme and host are lower-cased,
+    `www.` and default ports are removed, percent-encoding and dot segments are
+    normalized, a trailing slash is removed and query parameters are sorted. The
+    key is not always a URL the site answers on, fetch `strip_tracking(url)` instead.
+
+    Args:
+        url (str): URL to canonicalize.
+        base (str, optional): URL relative links are resolved against.
+    Returns:
+        str: canonical URL. URLs that are not http(s) are returned stripped, unchanged otherwise.
+    """
+    url = url.strip()
+    if base:
+        url = urljoin(base, url)
+
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return url
+
+    host = parts.hostname.rstrip('.')
+    if host.startswith('www.'):
+        host = host[4:]
+    if ':' in host:
+        host = f"[{host}]"  # IPv6 literal
+    if port is not None and port != DEFAULT_PORTS[scheme]:
+        host = f"{host}:{port}"
+
+    path = quote(_normalize_escapes(parts.path), safe=PATH_SAFE)
+    path = remove_dot_segments(path) or '/'
+    if len(path) > 1:
+        path = path.rstrip('/') or '/'
+
+    query = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+             if not is_tracking_param(name)]
+    query = urlencode(sorted(query), quote_via=quote)
+
+    return urlunsplit((scheme, host, path, query, ''))
+
+
+def registrable_host(host: str) -> str:
+    """
+    Function to get the name a host is registered under, `blog.example.co.uk` -> `example.co.uk`.
+
+    Without a public suffix list the suffix is taken as the last label, or the last two when
+    a country domain registers names under a generic second level (`co.uk`, `com.au`, ...).
+
+    Args:
+        host (str): host name, port excluded.
+    Returns:
+        str: registrable host, the host itself for IP addresses.
+    """
+    host = host.lower().rstrip('.')
+    labels = host.split('.')
+    if ':' in host or labels[-1].isdigit():
+        return host  # IP address
+
+    size = 2
+    if len(labels) > 2 and len(labels[-1]) == 2 and labels[-2] in COUNTRY_SECOND_LEVELS:
+        size = 3
+    return '.'.join(labels[-size:])
+
+
+def canonical_link(href: str | None, url: str) -> str:
+    """
+    Function to get the canonical key of a page from its `<link rel="canonical">`.
+
+    The link is only trusted on the page's own registrable host and off the site root:
+    sites that point every page at their homepage, or at another domain, would otherwise
+    collapse distinct articles into one key.
+
+    Args:
+        href (str | None): `href` of the page's canonical link, if any.
+        url (str): URL the page was fetched from.
+    Returns:
+        str: canonical form of the declared canonical URL, or of `url` when the page declares
+            none or an unusable one.
+    """
+    if href:
+        canonical = canonicalize_url(href, base=url)
+        try:
+            parts, page = urlsplit(canonical), urlsplit(url)
+        except ValueError:
+            return canonicalize_url(url)
+
+        if (parts.scheme in DEFAULT_PORTS and parts.hostname and page.hostname
+                and registrable_host(parts.hostname) == registrable_host(page.hostname)
+                and parts.path not in ('', '/')):
+            return canonical
+    return canonicalize_url(url)
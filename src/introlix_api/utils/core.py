@@ -1,4 +1,6 @@
 import re
+import codecs
+from collections import OrderedDict
 from contextlib import contextmanager
 
 import lxml.html
@@ -10,6 +12,17 @@ unicode = str
 DEFAULT_ENCODING = 'utf8'
 DEFAULT_ENC_ERRORS = 'replace'
 CHARSET_META_TAG_PATTERN = re.compile(br"""<meta[^>]+charset=["']?([^'"/>\s]+)""", re.IGNORECASE)
+CHARSET_HEADER_PATTERN = re.compile(r"""charset\s*=\s*["']?([^"';\s]+)""", re.IGNORECASE)
+# bytes searched for <meta charset>, the declaration has to come early in <head>
+CHARSET_SNIFF_BYTES = 4096
+# byte order marks, UTF-32 before UTF-16 as its little-endian mark starts with UTF-16's
+BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
 
 class JustextError(Exception):
     "Base class for jusText exceptions."
@@ -21,15 +34,80 @@ def ignored(*exceptions):
     except tuple(exceptions):
         pass
 
-def html_to_dom(html, default_encoding=DEFAULT_ENCODING, encoding=None, errors=DEFAULT_ENC_ERRORS):
-    """Converts HTML to DOM."""
+class CharsetCache:
+    """
+    Encoding last declared by every host, used for its pages that declare none.
+
+    A site rarely changes encoding, so a page without charset is decoded with the
+    encoding of the site's other pages instead of guessing it. Least recently used
+    hosts are dropped past `max_hosts`.
+    """
+    def __init__(self, max_hosts=10000):
+        self.max_hosts = max_hosts
+        self._encodings = OrderedDict()
+
+    def get(self, host):
+        encoding = self._encodings.get(host)
+        if encoding is not None:
+            self._encodings.move_to_end(host)
+        return encoding
+
+    def set(self, host, encoding):
+        self._encodings[host] = encoding
+        self._encodings.move_to_end(host)
+        if len(self._encodings) > self.max_hosts:
+            self._encodings.popitem(last=False)
+
+charset_cache = CharsetCache()
+
+def normalize_encoding(name):
+    """
+    Returns the Python codec name of a declared charset, None if it is unknown.
+    """
+    if isinstance(name, bytes):
+        name = name.decode("ASCII", "ignore")
+    try:
+        return codecs.lookup(name.strip()).name
+    except (LookupError, ValueError):
+        return None
+
+def sniff_encoding(html, content_type=None):
+    """
+    Finds the declared encoding of a page: byte order mark, then the charset of the
+    HTTP `Content-Type` header, then a <meta> charset in the first CHARSET_SNIFF_BYTES.
+
+    Returns a (encoding, source) tuple, (None, None) if the page declares nothing usable.
+    """
+    for bom, encoding in BOMS:
+        if html.startswith(bom):
+            return encoding, 'bom'
+
+    if content_type:
+        match = CHARSET_HEADER_PATTERN.search(content_type)
+        encoding = normalize_encoding(match.group(1)) if match else None
+        if encoding:
+            return encoding, 'header'
+
+    match = CHARSET_META_TAG_PATTERN.search(html, 0, CHARSET_SNIFF_BYTES)
+    encoding = normalize_encoding(match.group(1)) if match else None
+    if encoding:
+        return encoding, 'meta'
+
+    return None, None
+
+def html_to_dom(html, default_encoding=DEFAULT_ENCODING, encoding=None, errors=DEFAULT_ENC_ERRORS,
+                content_type=None, host=None):
+    """
+    Converts HTML to DOM.
+    `content_type` and `host` are passed to `decode_html` to find the encoding of bytes.
+    """
     if isinstance(html, unicode):
         decoded_html = html
         # encode HTML for case it's XML with encoding declaration
         forced_encoding = encoding if encoding else default_encoding
         html = html.encode(forced_encoding, errors)
     else:
-        decoded_html = decode_html(html, default_encoding, encoding, errors)
+        decoded_html = decode_html(html, default_encoding, encoding, errors, content_type, host)
 
     try:
         dom = lxml.html.fromstring(decoded_html, parser=lxml.html.HTMLParser())
@@ -41,10 +119,16 @@ def html_to_dom(html, default_encoding=DEFAULT_ENCODING, encoding=None, errors=D
     return dom
 
 
-def decode_html(html, default_encoding=DEFAULT_ENCODING, encoding=None, errors=DEFAULT_ENC_ERRORS):
+def decode_html(html, default_encoding=DEFAULT_ENCODING, encoding=None, errors=DEFAULT_ENC_ERRORS,
+                content_type=None, host=None, cache=charset_cache):
     """
-    Converts a `html` containing an HTML page into Unicode.
-    Tries to guess character encoding from meta tag.
+    Converts a `html` containing an HTML page into Unicode, decoding it once.
+
+    The encoding is `encoding` when given, else the declared one (byte order mark,
+    charset of the HTTP `content_type`, <meta> charset near the top of the page),
+    else the encoding `host` declared on its other pages, else UTF-8 with
+    `default_encoding` as fallback. Only the first CHARSET_SNIFF_BYTES are searched
+    for <meta>, never the whole page.
     """
     if isinstance(html, unicode):
         return html
@@ -52,22 +136,27 @@ def decode_html(html, default_encoding=DEFAULT_ENCODING, encoding=None, errors=D
     if encoding:
         return html.decode(encoding, errors)
 
-    match = CHARSET_META_TAG_PATTERN.search(html)
-    if match:
-        declared_encoding = match.group(1).decode("ASCII")
-        # proceed unknown encoding as if it wasn't found at all
-        with ignored(LookupError):
-            return html.decode(declared_encoding, errors)
-
-    # unknown encoding
+    declared_encoding, source = sniff_encoding(html, content_type)
+    if declared_encoding:
+        if host and source != 'bom':
+            cache.set(host, declared_encoding)
+        return html.decode(declared_encoding, errors)
+
+    cached_encoding = cache.get(host) if host else None
+    if cached_encoding:
+        return html.decode(cached_encoding, errors)
+
+    # unknown encoding: UTF-8 first, then lucky with default encoding; both are
+    # the same decode when the default is UTF-8
+    fallback_encoding = normalize_encoding(default_encoding)
+    if fallback_encoding == 'utf-8':
+        return html.decode('utf-8', errors)
     try:
-        # try UTF-8 first
-        return html.decode("utf8")
+        return html.decode('utf-8')
     except UnicodeDecodeError:
-        # try lucky with default encoding
         try:
             return html.decode(default_encoding, errors)
-        except UnicodeDecodeError as e:
+        except (UnicodeDecodeError, LookupError) as e:
             raise JustextError("Unable to decode the HTML to Unicode: " + unicode(e))
 
 # def html_to_dom(html, encoding=None):
@@ -0,0 +1,221 @@
+import re
+from hashlib import blake2b
+from collections import Counter
+
+from introlix_api.logger import logger
+
+FINGERPRINT_BITS = 64
+SHINGLE_SIZE = 3
+MAX_DISTANCE = 3  # Hamming distance up to which two fingerprints are the same article
+
+SKIP = 'skip'    # near-duplicates are not stored
+MERGE = 'merge'  # near-duplicates are not stored, their URL is added to the stored article
+
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> list:
+    return WORD_PATTERN.findall(text.lower())
+
+
+def simhash(text: str, shingle_size: int = SHINGLE_SIZE) -> int | None:
+    """
+    Function to compute the SimHash of a text, over its word shingles.
+
+    Texts that share most of their shingles get fingerprints that differ in few bits,
+    so near-duplicates are found by Hamming distance.
+
+    Args:
+        text (str): text to fingerprint.
+        shingle_size (int, optional): words per shingle. Defaults to 3.
+    Returns:
+        int | None: 64-bit fingerprint, None for a text without words: texts without words
+            have nothing in common, they must not be near-duplicates of each other.
+    """
+    tokens = tokenize(text)
+    if len(tokens) >= shingle_size:
+        features = Counter(" ".join(tokens[i:i + shingle_size]) for i in range(len(tokens) - shingle_size + 1))
+    else:
+        features = Counter(tokens)
+    if not features:
+        return None
+
+    # one counter per bit, kept bit-sliced: planes[k] holds bit k of all 64 counters,
+    # so adding a feature hash costs a few big-int operations instead of 64 additions
+    planes, total = [], 0
+    for feature, count in features.items():
+        h = int.from_bytes(blake2b(feature.encode(), digest_size=FINGERPRINT_BITS // 8).digest(), 'big')
+        for _ in range(count):
+            carry = h
+            for k, plane in enumerate(planes):
+                planes[k], carry = plane ^ carry, plane & carry
+                if not carry:
+                    break
+            if carry:
+                planes.append(carry)
+        total += count
+
+    # a bit is set when more than half of the weighted features have it set
+    value = 0
+    for bit in range(FINGERPRINT_BITS):
+        ones = sum((plane >> bit & 1) << k for k, plane in enumerate(planes))
+        if 2 * ones > total:
+            value |= 1 << bit
+    return value
+
+
+def fingerprint(title: str, desc: str = "", text: str = "") -> int | None:
+    """
+    Function to fingerprint an article from its title, description and body text, None without words.
+    """
+    return simhash("\n".join(part for part in (title, desc, text) if part))
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def to_int64(value: int | None) -> int | None:
+    """
+    Function to store an unsigned 64-bit fingerprint in a signed 64-bit field (MongoDB integers).
+    """
+    if value is None:
+        return None
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def from_int64(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+def band_keys(value: int, max_distance: int = MAX_DISTANCE) -> list:
+    """
+    Function to split a fingerprint into the bands of its LSH index.
+
+    The fingerprint is cut in `max_distance + 1` bands: two fingerprints at most
+    `max_distance` bits apart have at least one identical band, so they are always
+    found as candidates of each other.
+
+    Args:
+        value (int): unsigned fingerprint.
+        max_distance (int, optional): largest Hamming distance that must be found. Defaults to 3.
+    Returns:
+        list: one `"<band>:<bits>"` key per band.
+    """
+    bands = max_distance + 1
+    width = -(-FINGERPRINT_BITS // bands)
+    mask = (1 << width) - 1
+    return [f"{band}:{value >> (band * width) & mask:x}" for band in range(bands)]
+
+
+class SimHashIndex:
+    """
+    Banded LSH index of SimHash fingerprints.
+
+    A lookup only compares the fingerprints that share a band with the query,
+    instead of every fingerprint of the index.
+    """
+    def __init__(self, max_distance: int = MAX_DISTANCE):
+        """
+        Initialize the SimHashIndex.
+
+        Args:
+            max_distance (int, optional): Hamming distance up to which fingerprints match. Defaults to 3.
+        """
+        self.max_distance = max_distance
+        self._fingerprints = {}
+        self._buckets = {}
+
+    def __len__(self) -> int:
+        return len(self._fingerprints)
+
+    def add(self, key, value: int):
+        """
+        Function to index a fingerprint.
+
+        Args:
+            key: identifier returned by `query`, e.g. a URL or a document id.
+            value (int): unsigned fingerprint.
+        """
+        self._fingerprints[key] = value
+        for band in band_keys(value, self.max_distance):
+            self._buckets.setdefault(band, set()).add(key)
+
+    def query(self, value: int) -> list:
+        """
+        Function to find the indexed fingerprints close to a fingerprint.
+
+        Args:
+            value (int): unsigned fingerprint.
+        Returns:
+            list: (key, distance) of every match, closest first.
+        """
+        candidates = set()
+        for band in band_keys(value, self.max_distance):
+            candidates.update(self._buckets.get(band, ()))
+
+        matches = []
+        for key in candidates:
+            distance = hamming_distance(value, self._fingerprints[key])
+            if distance <= self.max_distance:
+                matches.append((key, distance))
+        return sorted(matches, key=lambda match: match[1])
+
+
+def drop_near_duplicates(collection, documents: list, max_distance: int = MAX_DISTANCE, mode: str = SKIP) -> list:
+    """
+    Function to drop the documents that are near-duplicates of a stored document or of an earlier one of the batch.
+
+    Documents need a `simhash` field (signed, see `to_int64`), those without one (None,
+    pages without words) are kept and get no bands. The stored candidates
+    are found with one query on the indexed `simhash_bands` field, and `simhash_bands`
+    is set on the documents kept so later batches find them the same way.
+
+    Args:
+        collection (pymongo.collection.Collection): collection the documents go to.
+        documents (list): documents about to be inserted.
+        max_distance (int, optional): Hamming distance up to which documents are duplicates. Defaults to 3.
+        mode (str, optional): `SKIP` to drop duplicates, `MERGE` to also add their URL to the
+            `duplicate_urls` of the article they copy. Defaults to `SKIP`.
+    Returns:
+        list: documents to insert.
+    """
+    for d in documents:
+        if d.get("simhash") is not None:
+            d["simhash_bands"] = band_keys(from_int64(d["simhash"]), max_distance)
+
+    bands = list({band for d in documents for band in d.get("simhash_bands", ())})
+    if not bands:
+        return documents
+
+    index = SimHashIndex(max_distance)
+    stored = {}
+    for doc in collection.find({"simhash_bands": {"$in": bands}}, {"_id": 1, "url": 1, "simhash": 1}):
+        stored[doc["_id"]] = doc
+        index.add(doc["_id"], from_int64(doc["simhash"]))
+
+    kept, batch = [], {}
+    for d in documents:
+        if d.get("simhash") is None:
+            kept.append(d)
+            continue
+
+        value = from_int64(d["simhash"])
+        matches = index.query(value)
+        if not matches:
+            key = ('batch', len(kept))
+            batch[key] = d
+            index.add(key, value)
+            kept.append(d)
+            continue
+
+        key, distance = matches[0]
+        original = batch[key] if key in batch else stored[key]
+        logger.debug(f"{d['url']} is a near-duplicate of {original['url']} (distance {distance})")
+        if mode == MERGE and original["url"] != d["url"]:
+            if key in stored:
+                collection.update_one({"_id": key}, {"$addToSet": {"duplicate_urls": d["url"]}})
+            else:
+                original.setdefault("duplicate_urls", []).append(d["url"])
+
+    return kept
@@ -1,3 +1,5 @@
+import re
+
 def fetch_tags():
     tags = {'.net', 'dotnet', 'web3d','ai', 'aiops', 'algolia', 'amazon', 'alibaba', 'amd', 'android',
                           'angular', 'apache', 'airflow', 'apollo', 'apple', 'appwrite', 'arm', 'assembly', 'auth0',
@@ -24,4 +26,86 @@ def fetch_tags():
                           'video-generation', 'vim', 'visual-studio', 'vscode', 'vuejs', 'vue', 'web3', 'webassembly', 'web3', 'whisper', 'xbox',
                           'yarn', 'zoom'}  # TODO: need to add more
     
-    return tags
\ No newline at end of file
+    return tags
+
+# every character that is not part of a word separates two tokens
+TOKEN_SEPARATOR_PATTERN = re.compile(r"[^a-z0-9#+.]+")
+
+
+def normalize_token(token: str) -> str:
+    """
+    Normalize one token of a title or tag.
+
+    Dots are dropped (`node.js` -> `nodejs`) except a leading one (`.net`), so both
+    sides of the match are normalized the same way.
+    """
+    token = token.rstrip(".")
+    if token.startswith("."):
+        return "." + token[1:].replace(".", "")
+    return token.replace(".", "")
+
+
+def tokenize(text: str) -> list:
+    """
+    Split a text into normalized tokens.
+    """
+    tokens = (normalize_token(token) for token in TOKEN_SEPARATOR_PATTERN.split(text.lower()))
+    return [token for token in tokens if token and token != "."]
+
+
+class TagMatcher:
+    """
+    Precompiled matcher of single and multi-token tags.
+
+    Tags are split on hyphens into token sequences and stored in a token trie, so
+    `machine-learning` matches "Machine Learning" as well as "machine-learning".
+    A text is tokenized once and every tag is found in one pass over its tokens.
+    """
+    def __init__(self, tags=None):
+        """
+        Initialize the TagMatcher.
+
+        Args:
+            tags (iterable, optional): tags to match. Defaults to `fetch_tags()`.
+        """
+        self.trie = {}
+        self.max_depth = 1
+
+        for tag in (tags if tags is not None else fetch_tags()):
+            tokens = [normalize_token(token) for token in tag.lower().split("-")]
+            if not all(tokens):
+                continue
+
+            node = self.trie
+            for token in tokens:
+                node = node.setdefault(token, {})
+            node[None] = tag  # None marks the end of a tag
+            self.max_depth = max(self.max_depth, len(tokens))
+
+    def match(self, *texts: str) -> list:
+        """
+        Function to find the tags in texts.
+
+        Args:
+            texts (str): texts to search, e.g. a title and a description.
+        Returns:
+            list: matched tags in order of first appearance, without duplicates.
+        """
+        found = {}
+
+        for text in texts:
+            if not text:
+                continue
+
+            tokens = tokenize(text)
+            for start in range(len(tokens)):
+                node = self.trie
+                for token in tokens[start:start + self.max_depth]:
+                    node = node.get(token)
+                    if node is None:
+                        break
+                    tag = node.get(None)
+                    if tag is not None:
+                        found.setdefault(tag, None)
+
+        return list(found)
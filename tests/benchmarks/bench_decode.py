@@ -0,0 +1,87 @@
+"""
+Benchmark of the page decoding: the legacy `decode_html`, which searched the whole
+page for <meta charset> and decoded pages without one twice, against the current
+one (byte order mark, Content-Type charset, <meta> in the first KB, host cache).
+
+Pages are large (about 1 MB) with the charset declared in <meta>, in the header,
+or nowhere. Both must give the same text except where the host cache recovers
+the encoding of a page that declares none.
+
+Run with `python -m tests.benchmarks.bench_decode`.
+"""
+import re
+import timeit
+
+from introlix_api.utils.core import decode_html, CharsetCache, ignored
+
+LEGACY_META_PATTERN = re.compile(br"""<meta[^>]+charset=["']?([^'"/>\s]+)""", re.IGNORECASE)
+PAGE_BYTES = 1024 * 1024
+HOST = "example.com"
+
+
+def legacy_decode_html(html, default_encoding="utf8", errors="replace"):
+    match = LEGACY_META_PATTERN.search(html)
+    if match:
+        with ignored(LookupError):
+            return html.decode(match.group(1).decode("ASCII"), errors)
+    try:
+        return html.decode("utf8")
+    except UnicodeDecodeError:
+        return html.decode(default_encoding, errors)
+
+
+def make_page(head: str, text: str, encoding: str) -> bytes:
+    paragraph = f"<p>{text}</p>\n<meta name=\"x\" content=\"y\">\n"
+    body = paragraph * (PAGE_BYTES // len(paragraph.encode(encoding)))
+    return f"<html><head>{head}<title>page</title></head><body>{body}</body></html>".encode(encoding)
+
+
+def make_cases() -> list:
+    utf8_text = "Ünïcödé text — with “quotes” and 日本語 " * 4
+    latin_text = "Café déjà vu, naïve façade " * 4
+    return [
+        # name, page, Content-Type header, text of the page
+        ("utf-8, <meta charset>", make_page('<meta charset="utf-8">', utf8_text, "utf-8"), None),
+        ("utf-8, header charset", make_page("", utf8_text, "utf-8"), "text/html; charset=utf-8"),
+        ("utf-8, no charset", make_page("", utf8_text, "utf-8"), None),
+        ("latin-1, <meta charset>", make_page('<meta charset="iso-8859-1">', latin_text, "latin-1"), None),
+        ("latin-1, no charset", make_page("", latin_text, "latin-1"), None),
+        ("ascii, no charset", make_page("", "plain ascii text " * 4, "ascii"), None),
+    ]
+
+
+def main(number=20, repeat=5):
+    cases = make_cases()
+
+    print(f"{len(cases)} pages of ~{PAGE_BYTES // 1024} KB")
+    print(f"{'page':28} {'legacy':>10} {'current':>10} {'speedup':>8}")
+    for name, page, content_type in cases:
+        legacy_text = legacy_decode_html(page)
+        text = decode_html(page, content_type=content_type, host=HOST, cache=CharsetCache())
+        assert text == legacy_text, f"{name}: decoded text differs"
+
+        legacy = min(timeit.repeat(lambda: legacy_decode_html(page), number=number, repeat=repeat))
+        current = min(timeit.repeat(lambda: decode_html(page, content_type=content_type, host=HOST,
+                                                        cache=CharsetCache()),
+                                    number=number, repeat=repeat))
+        print(f"{name:28} {legacy * 1e3 / number:8.2f}ms {current * 1e3 / number:8.2f}ms "
+              f"{legacy / current:7.1f}x")
+
+    # a host that declared latin-1 on an earlier page: its pages without charset are
+    # decoded as latin-1 once, instead of failing UTF-8 and being decoded again with
+    # replacement characters
+    cache = CharsetCache()
+    cache.set(HOST, "iso8859-1")
+    name, page, _ = cases[4]
+    text = decode_html(page, host=HOST, cache=cache)
+    assert "�" not in text and "Café" in text
+    assert "�" in legacy_decode_html(page)
+
+    legacy = min(timeit.repeat(lambda: legacy_decode_html(page), number=number, repeat=repeat))
+    current = min(timeit.repeat(lambda: decode_html(page, host=HOST, cache=cache), number=number, repeat=repeat))
+    print(f"{name + ', cached':28} {legacy * 1e3 / number:8.2f}ms {current * 1e3 / number:8.2f}ms "
+          f"{legacy / current:7.1f}x (no replacement characters)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark of the page metadata extraction: the per-field XPath queries scrape()
+used to run against the single walk of `extract_metadata`, over the saved HTML
+pages of `fixtures/`. Both must give the same result on every page.
+
+Run with `python -m tests.benchmarks.bench_metadata`.
+"""
+import os
+import re
+import json
+import timeit
+from urllib.parse import urljoin
+
+from introlix_api.utils.core import html_to_dom
+from introlix_api.crawler.metadata import extract_metadata
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+FIXTURE_URL = "https://example.com/posts/fixture"
+
+
+def legacy_metadata(dom, url):
+    title_element = dom.xpath("//title")
+    title = ""
+    if len(title_element) > 0 and title_element[0].text is not None:
+        title = title_element[0].text.strip()
+
+    desc_element = dom.xpath("//meta[@name='description']")
+    desc = ""
+    if len(desc_element) > 0 and desc_element[0].get('content') is not None:
+        desc = desc_element[0].get('content').strip()
+
+    og_image_element = dom.xpath("//meta[@property='og:image']/@content")
+    if og_image_element:
+        image = og_image_element[0]
+    else:
+        image_urls = [urljoin(url, img.get("src")) for img in dom.xpath("//img") if img.get("src")]
+        image = image_urls[0] if image_urls else ""
+
+    links = [href for element, attribute, href, _ in dom.iterlinks()
+             if element.tag == 'a' and attribute == 'href' and href]
+
+    date = dom.xpath("string(//meta[@property='article:published_time']/@content)")
+    if not date:
+        json_ld_date = dom.xpath("string(//script[@type='application/ld+json'])")
+        if json_ld_date:
+            try:
+                date = json.loads(json_ld_date).get("datePublished", "").split("T")[0]
+            except json.JSONDecodeError:
+                pass
+    if not date:
+        date = dom.xpath("string(//time/@datetime)")
+    if not date:
+        date = dom.xpath("string(//span[contains(text(), 'Last Updated')])")
+    if date:
+        match = re.search(r"\d{4}-\d{2}-\d{2}", date) or re.search(r"\d{2} \w{3}, \d{4}", date)
+        date = match.group(0) if match else date
+
+    return {'title': title, 'desc': desc, 'image': image, 'date': date, 'links': links}
+
+
+def single_pass_metadata(dom, url):
+    metadata = extract_metadata(dom, url)
+    return {'title': metadata.title, 'desc': metadata.desc, 'image': metadata.image,
+            'date': metadata.date, 'links': metadata.links}
+
+
+def load_fixtures():
+    pages = {}
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        if name.endswith(".html"):
+            with open(os.path.join(FIXTURES_DIR, name), "rb") as f:
+                pages[name] = html_to_dom(f.read(), "utf-8", None, "replace")
+    return pages
+
+
+def main(number=50, repeat=5):
+    pages = load_fixtures()
+
+    for name, dom in pages.items():
+        legacy, single_pass = legacy_metadata(dom, FIXTURE_URL), single_pass_metadata(dom, FIXTURE_URL)
+        assert legacy == single_pass, f"{name}: {legacy} != {single_pass}"
+
+    doms = list(pages.values())
+    legacy = min(timeit.repeat(lambda: [legacy_metadata(d, FIXTURE_URL) for d in doms], number=number, repeat=repeat))
+    single_pass = min(timeit.repeat(lambda: [single_pass_metadata(d, FIXTURE_URL) for d in doms],
+                                    number=number, repeat=repeat))
+    per_page = number * len(doms)
+
+    print(f"{len(doms)} fixture pages, identical output")
+    print(f"legacy XPath queries: {legacy * 1e6 / per_page:8.1f} us/page")
+    print(f"extract_metadata:     {single_pass * 1e6 / per_page:8.1f} us/page ({legacy / single_pass:.1f}x)")
+
+    for name, dom in pages.items():
+        metadata = single_pass_metadata(dom, FIXTURE_URL)
+        print(f"  {name}: title={metadata['title']!r} date={metadata['date']!r} "
+              f"image={metadata['image']!r} links={len(metadata['links'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Benchmark of the crawler tag matching: the old list comprehension over good_tags
+against the precompiled TagMatcher.
+
+Run with `python -m tests.benchmarks.bench_tags`.
+"""
+import re
+import string
+import random
+import timeit
+
+from introlix_api.utils.tags import fetch_tags, TagMatcher
+
+TITLES = [
+    "Make Your Own AI Image Generator with Bria 2.3 Model",
+    "GPT-4 vs. Llama 3.1 – Which Model is Better?",
+    "How to learn coding faster?",
+    "Keyword Extraction Methods from Documents in NLP",
+    "Best machine learning model for text generation",
+    "Creating a Simple Web Scraper with Python (BeautifulSoup) 🕷️📊 - DEV Community",
+    "Deploying FastAPI on AWS EC2 with Docker and GitHub Actions",
+    "C# and .NET 8: What's New for Backend Developers",
+    "Fine-tuning BERT with Hugging Face Transformers and PyTorch",
+    "React Native vs Flutter in 2024",
+    "Building a RAG pipeline with LangChain, Ollama and Redis vector search",
+    "Computer Vision basics: object detection with OpenCV",
+]
+
+
+def legacy_tags(good_tags, title):
+    normalized_title = re.split(r'[\s-]+', title.lower().translate(str.maketrans('', '', string.punctuation)))
+    return [tag for tag in good_tags if tag in normalized_title]
+
+
+def corpus(size, seed=0):
+    rng = random.Random(seed)
+    words = " ".join(TITLES).split()
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(6, 14))) for _ in range(size)] + TITLES
+
+
+def main(size=5000, repeat=5):
+    good_tags = fetch_tags()
+    matcher = TagMatcher(good_tags)
+    titles = corpus(size)
+
+    legacy = min(timeit.repeat(lambda: [legacy_tags(good_tags, t) for t in titles], number=1, repeat=repeat))
+    compiled = min(timeit.repeat(lambda: [matcher.match(t) for t in titles], number=1, repeat=repeat))
+
+    print(f"{len(titles)} titles, {len(good_tags)} tags")
+    print(f"legacy list comprehension: {legacy * 1e6 / len(titles):8.2f} us/title")
+    print(f"TagMatcher:                {compiled * 1e6 / len(titles):8.2f} us/title ({legacy / compiled:.1f}x)")
+
+    print("\nTags of the sample titles (legacy -> TagMatcher):")
+    for title in TITLES:
+        print(f"  {title}\n    {sorted(legacy_tags(good_tags, title))} -> {matcher.match(title)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmark of the article URL classification: the legacy `filter_urls`, which
+rebuilt its keyword lists on every call and ran every pattern and keyword on its
+own, against `UrlClassifier.is_article`, over a generated corpus of URLs. Both must
+classify every URL the same way, for the crawler and for the spider rules, once the
+missing comma that joined the last two patterns is fixed and the fragment and
+tracking parameters are dropped; the URLs these two changes decide are counted apart.
+
+Run with `python -m tests.benchmarks.bench_url_classifier`.
+"""
+import re
+import random
+import timeit
+from urllib.parse import urlparse
+
+from introlix_api.utils.canonical import strip_tracking
+from introlix_api.crawler.url_classifier import (url_classifier, spider_url_classifier, ARTICLE_PATTERNS,
+                                                 NON_ARTICLE_KEYWORDS, ARTICLE_KEYWORDS, SPIDER_ARTICLE_PATTERNS,
+                                                 SPIDER_NON_ARTICLE_KEYWORDS)
+
+# the patterns as they were, with the missing comma joining the last two
+LEGACY_ARTICLE_PATTERNS = [
+    r'/(/blog/|article|articles|post|posts|blogs|news|)/\d{4}/\d{2}/+[a-z0-9-]+/?',
+    r'/(/blog/|article|articles|post|posts|blogs|news|)/[a-z0-9-]+/[a-z0-9-]+',
+    r'(?<!\/\/www)(/blog/|article|articles|post|posts|blogs|news|)/[a-z0-9-]+',
+    r'^(?!.*\/category\/).*\/[a-z0-9-]+\/[a-z0-9-]+(-[a-z0-9-]+)+$',
+    r'/[^/]+/\d{4}/\d{2}/\d{2}/+[a-z0-9]+/?',
+    r'/[^/]+/\d{4}/\d{2}/+[a-z0-9]+/?'
+    r'/[a-z0-9-]+/\d{4}/\d{2}/+/?',
+    r'/[a-z0-9-]+/\d{4}/\d{2}/\d{2}/+/?'
+]
+
+LEGACY_SPIDER_PATTERNS = [
+    r'/(blog|article|articles|post|blog|posts|blogs|)/\d{4}/\d{2}/+[a-z0-9-]+/?',
+    r'/(blog|article|articles|post|blog|posts|blogs|)/[a-z0-9-]+/[a-z0-9-]+',
+    r'(?<!\/\/www)(blog|article|articles|post|posts|blogs)/[a-z0-9-]+',
+    r'^(?!.*\/category\/).*\/[a-z0-9-]+\/[a-z0-9-]+(-[a-z0-9-]+)+$',
+    r'/[^/]+/\d{4}/\d{2}/\d{2}/+[a-z0-9]+/?',
+    r'/[^/]+/\d{4}/\d{2}/+[a-z0-9]+/?'
+    r'/[a-z0-9-]+/\d{4}/\d{2}/+/?',
+    r'/[a-z0-9-]+/\d{4}/\d{2}/\d{2}/+/?'
+]
+
+HOSTS = ["https://example.com", "https://www.blog.example.org", "http://news.site.io:8080", "https://dev.to"]
+SEGMENTS = ["blog", "posts", "article", "news", "category", "tags", "about", "products", "docs", "2024", "06",
+            "15", "u", "@someone", "how-to", "learn", "guide", "Python", "async-io", "release-notes"]
+SLUGS = ["intro", "what-is-rust", "a-deep-dive-into-async-python", "pricing", "faq", "index.html", "page-2",
+         "how-we-scaled-postgres-to-1m-qps", "Top-10-Tips", "login", "v2", "", "tutorial-part-1"]
+QUERIES = ["", "", "?utm_source=x", "?page=2", "#comments", "?ref=home&utm_medium=social", "#how-it-works",
+           "?utm_campaign=new-post"]
+
+
+def legacy_filter_urls(url, article_pattern=ARTICLE_PATTERNS):
+    parsed_url = urlparse(url)
+
+    if parsed_url.path in ('', '/'):
+        return False
+
+    non_article_keywords = list(NON_ARTICLE_KEYWORDS)
+    article_keywords = list(ARTICLE_KEYWORDS)
+
+    for pattern in article_pattern:
+        if re.search(pattern, url):
+            if not any(keyword in url for keyword in non_article_keywords):
+                return True
+
+    if any(keyword in url for keyword in article_keywords):
+        return True
+
+    last_segment = parsed_url.path.strip('/').split('/')[-1]
+    if '-' in last_segment and len(last_segment.split('-')) > 2:
+        return True
+
+    return False
+
+
+def legacy_is_this_article(url, article_pattern=SPIDER_ARTICLE_PATTERNS):
+    non_article_words = list(SPIDER_NON_ARTICLE_KEYWORDS)
+    for pattern in article_pattern:
+        if re.search(pattern, url):
+            if not any(word in url for word in non_article_words):
+                return True
+    return False
+
+
+def make_corpus(size: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    urls = []
+    for _ in range(size):
+        path = "/".join(rng.choice(SEGMENTS) for _ in range(rng.randint(0, 3)))
+        slug = rng.choice(SLUGS)
+        path = "/".join(part for part in (path, slug) if part)
+        url = f"{rng.choice(HOSTS)}/{path}{rng.choice(['', '/'])}{rng.choice(QUERIES)}"
+        # the spider sees relative links too
+        urls.append(url if rng.random() < 0.8 else "/" + path)
+    return urls
+
+
+def main(size=20000, repeat=5):
+    urls = make_corpus(size)
+
+    legacy = [legacy_filter_urls(strip_tracking(url)) for url in urls]
+    assert legacy == url_classifier.classify(urls), "crawler rules classify differently"
+    legacy_spider = [legacy_is_this_article(url) for url in urls]
+    assert legacy_spider == spider_url_classifier.classify(urls), "spider rules classify differently"
+
+    suffix = sum(legacy_filter_urls(url) != article for url, article in zip(urls, legacy))
+
+    comma_fix = sum(legacy_filter_urls(strip_tracking(url), LEGACY_ARTICLE_PATTERNS) != article
+                    for url, article in zip(urls, legacy))
+    spider_comma_fix = sum(legacy_is_this_article(url, LEGACY_SPIDER_PATTERNS) != article
+                           for url, article in zip(urls, legacy_spider))
+
+    # dropping the tracking parameters is the same work in both, timed apart
+    stripping = min(timeit.repeat(lambda: [strip_tracking(url) for url in urls], number=1, repeat=repeat))
+    legacy_time = min(timeit.repeat(lambda: [legacy_filter_urls(strip_tracking(url)) for url in urls],
+                                    number=1, repeat=repeat))
+    current_time = min(timeit.repeat(lambda: url_classifier.classify(urls), number=1, repeat=repeat))
+    legacy_spider_time = min(timeit.repeat(lambda: [legacy_is_this_article(url) for url in urls],
+                                           number=1, repeat=repeat))
+    spider_time = min(timeit.repeat(lambda: spider_url_classifier.classify(urls), number=1, repeat=repeat))
+
+    print(f"{len(urls)} URLs, {sum(legacy)} articles, {sum(legacy_spider)} spider articles, identical output")
+    print(f"classified differently by the joined patterns: {comma_fix} crawler, {spider_comma_fix} spider")
+    print(f"decided by a fragment or tracking parameter: {suffix} crawler")
+    print(f"strip_tracking only:    {len(urls) / stripping:10.0f} URLs/s")
+    print(f"legacy filter_urls:     {len(urls) / legacy_time:10.0f} URLs/s")
+    print(f"UrlClassifier:          {len(urls) / current_time:10.0f} URLs/s ({legacy_time / current_time:.1f}x)")
+    print(f"legacy is_this_article: {len(urls) / legacy_spider_time:10.0f} URLs/s")
+    print(f"spider classify:        {len(urls) / spider_time:10.0f} URLs/s "
+          f"({legacy_spider_time / spider_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Offline crawler benchmark.
+
+Starts a `FixtureServer` and crawls it with `IntrolixBot.scrape_parallel` and with
+`crawler.crawler()` writing to an in-memory Mongo stand-in. Each scenario runs in
+its own process so that CPU time and peak RSS are its own. The report is JSON,
+compare two of them with `--compare`.
+
+    python -m tests.benchmarks.crawl_bench --pages 300 --output bench.json
+    python -m tests.benchmarks.crawl_bench --compare before.json bench.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+from dataclasses import asdict, fields
+
+from tests.memory_store import MemoryCollection, MemoryDatabase
+from tests.benchmarks.fixture_server import FixtureServer, SiteConfig
+
+SCENARIOS = ("scrape_parallel", "crawler")
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def page_latency(result: dict) -> float | None:
+    fetch = result.get("fetch")
+    if not fetch:
+        return None
+    return fetch.get("elapsed", 0.0) + fetch.get("parse_seconds", 0.0)
+
+
+def report(urls: list, results: list, wall: float, usage_before, extra: dict = None) -> dict:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    latencies = [latency for latency in map(page_latency, results) if latency is not None]
+
+    outcomes = {}
+    for result in results:
+        outcome = result["error"]["name"] if result.get("error") else "ok"
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    return {
+        "urls": len(urls),
+        "results": len(results),
+        "outcomes": dict(sorted(outcomes.items())),
+        "wall_seconds": round(wall, 3),
+        "pages_per_second": round(len(results) / wall, 2) if wall else 0.0,
+        "latency_p50": round(percentile(latencies, 0.50), 4),
+        "latency_p99": round(percentile(latencies, 0.99), 4),
+        "cpu_seconds": round(usage.ru_utime + usage.ru_stime - usage_before.ru_utime - usage_before.ru_stime, 3),
+        # kilobytes on Linux, bytes on macOS
+        "peak_rss_mb": round(usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1),
+        **(extra or {}),
+    }
+
+
+def run_scenario(name: str, base_url: str, urls: list, batch_size: int) -> dict:
+    """
+    Run one scenario in the current process against a running fixture server.
+    """
+    from introlix_api.crawler import bot as bot_module
+
+    # state files of this run only, and the fixture server as the only root site
+    state_dir = tempfile.mkdtemp(prefix="introlix-bench-")
+    bot_module.BotArgs.STATE_DIR = state_dir
+    bot_module.root_sites = lambda: [base_url]
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+
+    if name == "scrape_parallel":
+        bot = bot_module.IntrolixBot(urls=urls, args=bot_module.BotArgs)
+
+        start = time.perf_counter()
+        results = [result for batch in bot.scrape_parallel(batch_size=batch_size) for result in batch]
+        wall = time.perf_counter() - start
+
+        return report(urls, results, wall, usage_before, {"pool": bot.pool_stats()["async"]})
+
+    if name == "crawler":
+        import crawler
+
+        collection = MemoryCollection()
+        crawler.init(collection, MemoryDatabase(collection))
+        crawler.save_urls = lambda urls_batch: None
+
+        # keep every scraped result, as save_to_db sees them
+        results = []
+        save_to_db = crawler.save_to_db
+
+        def recording_save_to_db(data):
+            results.extend(data)
+            save_to_db(data)
+
+        crawler.save_to_db = recording_save_to_db
+
+        start = time.perf_counter()
+        crawler.crawler(urls)
+        wall = time.perf_counter() - start
+
+        return report(urls, results, wall, usage_before, {"documents_written": len(collection.documents)})
+
+    raise ValueError(f"Unknown scenario {name}")
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(before_path: str, after_path: str):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    print(f"{before.get('commit')} -> {after.get('commit')}")
+    for scenario, new in after["scenarios"].items():
+        old = before["scenarios"].get(scenario)
+        if old is None:
+            continue
+        print(f"{scenario}:")
+        for key in ("pages_per_second", "latency_p50", "latency_p99", "cpu_seconds", "peak_rss_mb"):
+            change = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            print(f"  {key:18} {old[key]:>10} -> {new[key]:>10} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    for field in fields(SiteConfig):
+        if field.type in ("int", "float", int, float):
+            parser.add_argument(f"--{field.name.replace('_', '-')}", type=type(field.default), default=field.default)
+    parser.add_argument("--scenario", choices=SCENARIOS, action="append",
+                        help="scenario to run, can be repeated. Defaults to all.")
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two JSON reports")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        return compare(*args.compare)
+
+    if args.child:
+        # scenario process: {"scenario", "base_url", "urls"} on stdin, report on stdout
+        job = json.load(sys.stdin)
+        print(json.dumps(run_scenario(args.child, job["base_url"], job["urls"], args.batch_size)))
+        return
+
+    config = SiteConfig(**{f.name: getattr(args, f.name) for f in fields(SiteConfig) if hasattr(args, f.name)})
+    results = {}
+
+    with FixtureServer(config) as server:
+        urls = server.urls()
+        for scenario in args.scenario or SCENARIOS:
+            child = subprocess.run(
+                [sys.executable, "-m", "tests.benchmarks.crawl_bench", "--child", scenario,
+                 "--batch-size", str(args.batch_size)],
+                input=json.dumps({"base_url": server.base_url, "urls": urls}),
+                capture_output=True, text=True,
+                env={**os.environ, "PYTHONWARNINGS": "ignore"},
+            )
+            if child.returncode != 0:
+                raise RuntimeError(f"Scenario {scenario} failed:\n{child.stderr}")
+            results[scenario] = json.loads(child.stdout.strip().splitlines()[-1])
+
+    output = json.dumps({
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": asdict(config),
+        "scenarios": results,
+    }, indent=2)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Local HTTP server serving a synthetic site graph for the crawler benchmarks.
+
+Every page links to a few other pages of the graph. Some pages are behind a
+robots.txt rule, answer slowly, or are larger than the crawler fetch limit.
+All of it is deterministic for a given `SiteConfig`.
+"""
+import sys
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("python", "machine", "learning", "rust", "javascript", "react", "docker", "kubernetes", "data",
+         "science", "api", "database", "cloud", "security", "testing", "performance", "async", "crawler")
+
+
+@dataclass
+class SiteConfig:
+    pages: int = 500
+    links_per_page: int = 8
+    page_bytes: int = 30 * 1024
+    latency: float = 0.005            # seconds added to every answer
+    latency_jitter: float = 0.005     # up to this many more seconds, per page
+    robots_disallow: tuple = ("/private/",)
+    private_every: int = 20           # every n-th page is under the first disallowed prefix
+    slow_every: int = 50              # every n-th page answers after `slow_seconds`
+    slow_seconds: float = 1.0
+    huge_every: int = 100             # every n-th page streams `huge_bytes` without a Content-Length
+    huge_bytes: int = 4 * 1024 * 1024
+    seed: int = 0
+
+
+class SiteGraph:
+    """
+    Pages of the synthetic site, generated once from a `SiteConfig`.
+    """
+    def __init__(self, config: SiteConfig):
+        self.config = config
+        rng = random.Random(config.seed)
+
+        self.paths = []
+        for i in range(config.pages):
+            slug = "-".join(rng.choice(WORDS) for _ in range(4))
+            prefix = config.robots_disallow[0] if config.robots_disallow and config.private_every and \
+                i % config.private_every == config.private_every - 1 else "/posts/"
+            self.paths.append(f"{prefix}{i}/{slug}-article")
+
+        self.index = {path: i for i, path in enumerate(self.paths)}
+        self.links = [[self.paths[rng.randrange(config.pages)] for _ in range(config.links_per_page)]
+                      for _ in range(config.pages)]
+        self.delays = [config.latency + rng.random() * config.latency_jitter for _ in range(config.pages)]
+
+        self.robots_txt = ("User-agent: *\n" + "".join(f"Disallow: {p}\n" for p in config.robots_disallow)).encode()
+
+    def is_slow(self, i: int) -> bool:
+        return bool(self.config.slow_every) and i % self.config.slow_every == self.config.slow_every - 1
+
+    def is_huge(self, i: int) -> bool:
+        return bool(self.config.huge_every) and i % self.config.huge_every == self.config.huge_every // 2
+
+    def render(self, i: int) -> bytes:
+        rng = random.Random(self.config.seed * 1_000_003 + i)
+        title = " ".join(rng.choice(WORDS).capitalize() for _ in range(6))
+        links = "".join(f'<li><a href="{href}">{href.rsplit("/", 1)[-1]}</a></li>' for href in self.links[i])
+        head = (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{title}</title>'
+                f'<meta name="description" content="{title.lower()} explained">'
+                f'<meta property="og:image" content="/img/{i}.png">'
+                f'<meta property="article:published_time" content="2024-01-{i % 28 + 1:02d}T10:00:00Z">'
+                f'</head><body><article><h1>{title}</h1><ul>{links}</ul>')
+
+        paragraphs = []
+        size = len(head)
+        while size < self.config.page_bytes:
+            paragraph = "<p>" + " ".join(rng.choice(WORDS) for _ in range(80)) + "</p>"
+            paragraphs.append(paragraph)
+            size += len(paragraph)
+
+        return (head + "".join(paragraphs) + "</article></body></html>").encode()
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the sites the crawler visits
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "text/html; charset=utf-8"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        graph = self.server.graph
+        path = self.path.split("?", 1)[0]
+
+        if path == "/robots.txt":
+            return self._send(200, graph.robots_txt, "text/plain")
+
+        i = graph.index.get(path)
+        if i is None:
+            return self._send(404, b"<html><body>not found</body></html>")
+
+        time.sleep(graph.delays[i] + (graph.config.slow_seconds if graph.is_slow(i) else 0.0))
+
+        if graph.is_huge(i):
+            # no Content-Length: the crawler has to stop reading on its own
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            chunk = graph.render(i)
+            try:
+                for _ in range(graph.config.huge_bytes // len(chunk) + 1):
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True
+            return
+
+        self._send(200, graph.render(i))
+
+
+class FixtureHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # the crawler drops keep-alive connections and cuts huge bodies short, that is expected
+        if not isinstance(sys.exc_info()[1], (ConnectionError, TimeoutError)):
+            super().handle_error(request, client_address)
+
+
+class FixtureServer:
+    """
+    Threaded HTTP server of a `SiteGraph` on a free localhost port.
+
+    Use as a context manager:
+
+        with FixtureServer(SiteConfig(pages=100)) as server:
+            urls = server.urls()
+    """
+    def __init__(self, config: SiteConfig = None, host: str = "127.0.0.1", port: int = 0):
+        self.graph = SiteGraph(config or SiteConfig())
+        self.httpd = FixtureHTTPServer((host, port), FixtureHandler)
+        self.httpd.graph = self.graph
+        self._thread = None
+
+    @property
+    def netloc(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"{host}:{port}"
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.netloc}"
+
+    def urls(self) -> list:
+        return [self.base_url + path for path in self.graph.paths]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    with FixtureServer(port=8800) as server:
+        print(f"Serving {len(server.graph.paths)} pages on {server.base_url}, e.g. {server.urls()[0]}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,130 @@
+"""
+In-memory stand-ins of the pymongo collection and database the crawler writes to.
+"""
+import json
+from types import SimpleNamespace
+
+
+class MemoryCursor:
+    def __init__(self, documents: list):
+        self._documents = documents
+
+    def sort(self, key: str, direction: int = 1):
+        self._documents = sorted(self._documents, key=lambda d: d.get(key) or 0, reverse=direction < 0)
+        return self
+
+    def batch_size(self, count: int):
+        return self
+
+    def limit(self, count: int):
+        if count:
+            self._documents = self._documents[:count]
+        return self
+
+    def distinct(self, key: str) -> list:
+        return list(dict.fromkeys(d[key] for d in self._documents if key in d))
+
+    def __iter__(self):
+        return iter(self._documents)
+
+
+class MemoryCollection:
+    """
+    The part of a pymongo collection the crawler uses, kept in a list.
+    """
+    name = "search_data"
+
+    def __init__(self):
+        self.documents = []
+        self._next_id = 0
+
+    @staticmethod
+    def _get(document: dict, key: str):
+        value = document
+        for part in key.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        return value
+
+    @classmethod
+    def _matches(cls, document: dict, query: dict) -> bool:
+        for key, condition in query.items():
+            if key == "$or":
+                if not any(cls._matches(document, alternative) for alternative in condition):
+                    return False
+                continue
+            value = cls._get(document, key)
+            if isinstance(condition, dict) and "$in" in condition:
+                values = value if isinstance(value, list) else [value]
+                if not any(v in condition["$in"] for v in values):
+                    return False
+            elif isinstance(condition, dict) and "$gt" in condition:
+                if value is None or not value > condition["$gt"]:
+                    return False
+            elif isinstance(condition, dict) and "$lt" in condition:
+                if value is None or not value < condition["$lt"]:
+                    return False
+            elif value != condition:
+                return False
+        return True
+
+    def find(self, query: dict = None, projection: dict = None) -> MemoryCursor:
+        return MemoryCursor([d for d in self.documents if self._matches(d, query or {})])
+
+    def insert_many(self, documents: list):
+        for document in documents:
+            self._next_id += 1
+            document.setdefault("_id", self._next_id)
+            self.documents.append(document)
+
+    def update_one(self, query: dict, update: dict):
+        for document in self.documents:
+            if self._matches(document, query):
+                for key, value in update.get("$addToSet", {}).items():
+                    if value not in document.setdefault(key, []):
+                        document[key].append(value)
+                return
+
+    @classmethod
+    def _set(cls, document: dict, key: str, value) -> bool:
+        *parents, name = key.split(".")
+        for part in parents:
+            document = document.setdefault(part, {})
+        changed = document.get(name) != value
+        document[name] = value
+        return changed
+
+    def bulk_write(self, requests: list, ordered: bool = True):
+        # pymongo UpdateOne requests with $set and $setOnInsert, upserts or not
+        upserted, matched, modified = [], 0, 0
+        for index, request in enumerate(requests):
+            update = request._doc
+            document = next((d for d in self.documents if self._matches(d, request._filter)), None)
+            if document is None:
+                if request._upsert:
+                    document = {**update.get("$setOnInsert", {}), **update.get("$set", {})}
+                    self.insert_many([document])
+                    upserted.append({"index": index, "_id": document["_id"]})
+                continue
+            matched += 1
+            changes = [self._set(document, key, value) for key, value in update.get("$set", {}).items()]
+            modified += any(changes)
+        return SimpleNamespace(bulk_api_result={"nUpserted": len(upserted), "nMatched": matched,
+                                                "nModified": modified, "upserted": upserted, "writeErrors": []})
+
+    def create_index(self, keys, **kwargs):
+        pass
+
+    def delete_many(self, query: dict):
+        kept = [d for d in self.documents if not self._matches(d, query)]
+        deleted, self.documents = len(self.documents) - len(kept), kept
+        return SimpleNamespace(deleted_count=deleted)
+
+
+class MemoryDatabase:
+    def __init__(self, collection: MemoryCollection):
+        self.collection = collection
+
+    def command(self, name: str, collection: str) -> dict:
+        if name != "collStats":
+            raise NotImplementedError(name)
+        return {"size": len(json.dumps(self.collection.documents, default=str)), "count": len(self.collection.documents)}
@@ -0,0 +1,1183 @@
+"""Unit tests of the crawler components, against local fixtures instead of the network and MongoDB."""
+import os
+import sys
+import math
+import codecs
+import gzip
+import json
+import time
+import subprocess
+from datetime import timedelta
+from email.utils import formatdate
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+from introlix_api.crawler.backlog import UrlBacklog
+from introlix_api.crawler.robots import RobotsCache
+from introlix_api.crawler.bot import IntrolixBot, BotArgs
+from introlix_api.crawler.fetch import BodyBuffer, FetchResult, INITIAL_BODY_SIZE
+from introlix_api.crawler.http import AsyncHTTPPool
+from introlix_api.crawler.discovery import FeedParser, FeedEntry, SitemapStore, SiteDiscovery
+from introlix_api.crawler.bulk_writer import BulkWriter, content_update
+from introlix_api.crawler.frontier import URLFrontier
+from introlix_api.crawler.seen import BloomFilter, SeenFilter
+from introlix_api.crawler.validators import ValidatorStore
+from introlix_api.crawler.archive import (PageArchive, GZIP, ZSTD, zstandard, encode_record, decode_record,
+                                         reextract)
+from introlix_api.crawler.status import CrawlStatus, STATUS_FILE
+from introlix_api.crawler.throttle import HostController, HostBlocked, parse_retry_after
+from introlix_api.crawler.metrics import MetricsRegistry
+from introlix_api.crawler.harvest import LinkHarvester, encode_watermark, decode_watermark
+from introlix_api.crawler.retention import RetentionManager, INSERTED_AT, inserted_now
+from introlix_api.utils.core import CharsetCache, CHARSET_SNIFF_BYTES, decode_html, sniff_encoding
+from introlix_api.utils.tags import TagMatcher
+from introlix_api.utils.canonical import canonicalize_url, canonical_link, registrable_host, strip_tracking
+from introlix_api.utils.fingerprint import fingerprint, to_int64, drop_near_duplicates
+from introlix_api.crawler.url_classifier import (UrlClassifier, url_classifier, spider_url_classifier,
+                                                 compile_keywords, url_path, NON_ARTICLE_KEYWORDS)
+from tests.benchmarks.bench_metadata import FIXTURE_URL, load_fixtures, legacy_metadata, single_pass_metadata
+from tests.memory_store import MemoryCollection, MemoryDatabase
+
+CRAWLER_CORPUS = [
+    # root pages are never articles
+    ("https://example.com/", False),
+    ("https://www.example.com", False),
+    # dated and slugged posts
+    ("https://example.com/blog/2024/06/async-python-in-practice", True),
+    ("https://example.com/2024/06/15/release", True),
+    ("https://example.com/2023/11/", True),
+    ("https://example.com/archive/2021/05/17/x", True),
+    ("https://medium.com/@someone/why-rust-is-fast-3f2a", True),
+    ("https://dev.to/someone/understanding-the-event-loop-4k2j", True),
+    ("https://example.com/news/markets-rally", True),
+    ("https://example.com/posts/what-is-a-monad#comments", True),
+    ("https://example.com/Blog/Post-Title", True),
+    ("https://example.com/p/12345", True),
+    # article keywords
+    ("https://example.com/how-to-train-your-model", True),
+    ("https://example.com/Introduction-To-Graphs", True),
+    ("https://example.com/insights/state-of-ai", True),
+    ("https://example.com/docs/getting-started-guide?utm_source=twitter", True),
+    ("https://example.com/login?next=/blog/post", True),
+    # slugs of three words or more
+    ("https://example.com/products/widget-pro-max", True),
+    ("https://example.com/video/keynote-2024-highlights-full", True),
+    ("https://example.com/fees-and-charges", True),
+    ("https://example.com/a-b", True),
+    # site pages
+    ("https://example.com/category/python", False),
+    ("https://example.com/about", False),
+    ("https://example.com/tags/python", False),
+    ("https://example.com/pricing", False),
+    ("https://shop.example.com/cart", False),
+    ("https://example.com/u/alice", False),
+    ("https://example.com/wiki/Python", False),
+    ("https://example.com/index.html", False),
+    # the rules see the trailing slash and the query, only tracking parameters and fragments are dropped
+    ("https://site.com/u/", False),
+    ("https://site.com/members/", False),
+    ("https://www.example.com/u/alice/", False),
+    ("https://example.com/wiki/Python/", False),
+    ("https://example.com/category/python/", False),
+    ("https://example.com/@alice/", False),
+    ("https://example.com/blog/", True),
+    ("https://example.com/news/", True),
+    ("https://example.com/Blog/Post-Title/", True),
+    ("https://example.com/p/12345/", True),
+    ("https://example.com/2024/06/", True),
+    ("https://example.com/search?ref=/blog/", True),
+    ("https://example.com/about?ref=/blog/", True),
+    ("https://example.com/news?id=how", True),
+    ("https://example.com/about/?q=what", True),
+    ("https://example.com/pricing/?plan=pro", False),
+    ("https://example.com/store/?ref=home", False),
+    ("https://example.com/tags?utm_source=newsletter", False),
+    ("https://example.com/?utm_source=x", False),
+    ("https://example.com/about#section", False),
+    ("https://example.com/my-first-post/#comments", True),
+]
+
+# articles for the baseline only because of their fragment or tracking parameters
+IGNORED_SUFFIX_CORPUS = [
+    "https://example.com/category/python#how-to-x",
+    "https://example.com/tags/python?utm_campaign=what-is-new",
+]
+
+SPIDER_CORPUS = [
+    ("/blog/2024/06/async-python", True),
+    ("/posts/what-is-a-monad", True),
+    ("/news/2024/06/rally", True),
+    ("https://example.com/blog/first-post", True),
+    ("/some/long-article-title-here", True),
+    ("/article/12", True),
+    ("/articles/abc", True),
+    ("https://example.com/2024/06/15/release", True),
+    # matched by a date pattern that a missing comma used to join with the next one
+    ("https://example.com/2024/06/page-2", True),
+    ("/category/posts/python", False),
+    ("/contact/blog/x", False),
+    ("/about", False),
+    ("/2024/06/15/release", False),
+    ("/team", False),
+]
+
+
+@pytest.mark.parametrize("url,is_article", CRAWLER_CORPUS)
+def test_crawler_rules(url, is_article):
+    assert url_classifier.is_article(url) is is_article
+
+
+@pytest.mark.parametrize("url,is_article", SPIDER_CORPUS)
+def test_spider_rules(url, is_article):
+    assert spider_url_classifier.is_article(url) is is_article
+
+
+def test_batch_classification_matches_the_corpus():
+    assert url_classifier.classify([url for url, _ in CRAWLER_CORPUS]) == [article for _, article in CRAWLER_CORPUS]
+    assert spider_url_classifier.classify([url for url, _ in SPIDER_CORPUS]) == [article for _, article in SPIDER_CORPUS]
+    assert url_classifier.classify([]) == []
+
+
+@pytest.mark.parametrize("url", IGNORED_SUFFIX_CORPUS)
+def test_fragments_and_tracking_parameters_are_ignored(url):
+    assert url_classifier.is_article(url) is False
+    assert UrlClassifier(ignore_tracking=False).is_article(url) is True
+
+
+def test_keyword_regex_matches_any_substring():
+    keywords = compile_keywords(NON_ARTICLE_KEYWORDS)
+    for url, _ in CRAWLER_CORPUS + SPIDER_CORPUS:
+        assert bool(keywords.search(url)) == any(keyword in url for keyword in NON_ARTICLE_KEYWORDS), url
+    assert compile_keywords([]) is None
+
+
+@pytest.mark.parametrize("url", [url for url, _ in CRAWLER_CORPUS + SPIDER_CORPUS] + [
+    "https://example.com/a;params/b;last?q=1", "https://example.com?x=/y", "mailto:someone@example.com",
+    "HTTP://Example.com/Path", "//example.com/path", "https://example.com#/fragment",
+])
+def test_url_path_matches_urlparse(url):
+    assert url_path(url) == urlparse(url).path
+
+
+def test_backlog_spills_to_disk_in_order(tmp_path):
+    backlog = UrlBacklog(str(tmp_path / "backlog.sqlite3"), max_memory=100)
+    urls = [f"https://example.com/posts/{i}" for i in range(1000)]
+
+    assert backlog.push(urls) == 1000
+    assert backlog.stats()["memory"] == 100 and backlog.stats()["disk"] == 900
+    assert len(backlog) == 1000
+
+    popped = backlog.pop(250)
+    backlog.push(["https://example.com/late"])
+    popped += backlog.pop(2000)
+    assert popped == urls + ["https://example.com/late"]
+    assert len(backlog) == 0
+
+
+def test_backlog_drops_duplicates(tmp_path):
+    backlog = UrlBacklog(str(tmp_path / "backlog.sqlite3"), max_memory=10)
+    urls = [f"https://example.com/posts/{i}" for i in range(50)]
+
+    backlog.push(urls)
+    # tracking parameters and fragments make no new URL
+    assert backlog.push(urls[:20] + ["https://example.com/posts/3?utm_source=x#top"]) == 0
+    assert backlog.stats()["duplicates"] == 21
+    assert backlog.pop(100) == urls
+
+
+def test_backlog_keeps_urls_across_restarts(tmp_path):
+    path = str(tmp_path / "backlog.sqlite3")
+    backlog = UrlBacklog(path, max_memory=10)
+    urls = [f"https://example.com/posts/{i}" for i in range(30)]
+    backlog.push(urls)
+    backlog.pop(5)
+    backlog.close()
+
+    assert UrlBacklog(path, max_memory=10).pop(100) == urls[5:]
+
+
+def store_articles(collection, first: int, count: int, links: int = 3):
+    collection.insert_many([{"url": f"https://example.com/{i}",
+                             "content": {"links": [f"https://example.com/{i}/link-{j}" for j in range(links)]}}
+                            for i in range(first, first + count)])
+
+
+def harvest_all(harvester, batch_size=4) -> list:
+    return [url for batch in harvester.harvest(batch_size) for url in batch]
+
+
+def test_harvester_reads_new_articles_only(tmp_path):
+    collection = MemoryCollection()
+    frontier = URLFrontier(str(tmp_path / "frontier.sqlite3"))
+    harvester = LinkHarvester(collection, frontier, use_change_stream=False)
+
+    store_articles(collection, 0, 5)
+    assert len(harvest_all(harvester)) == 15
+    assert harvest_all(harvester) == []
+
+    store_articles(collection, 5, 2)
+    assert harvest_all(harvester) == [f"https://example.com/{i}/link-{j}" for i in (5, 6) for j in range(3)]
+    harvester.close()
+
+    # a restart carries on from the saved watermark
+    store_articles(collection, 7, 1)
+    restarted = LinkHarvester(collection, URLFrontier(str(tmp_path / "frontier.sqlite3")), use_change_stream=False)
+    assert harvest_all(restarted) == [f"https://example.com/7/link-{j}" for j in range(3)]
+
+
+def test_harvester_does_not_pass_unread_links(tmp_path):
+    collection = MemoryCollection()
+    harvester = LinkHarvester(collection, URLFrontier(str(tmp_path / "frontier.sqlite3")), use_change_stream=False)
+    store_articles(collection, 0, 4)
+
+    # the caller stops during the first batch, it is handed out again
+    batches = harvester.harvest(4)
+    assert len(next(batches)) == 4
+    batches.close()
+    assert harvester.watermark is None
+
+    # the caller came back after the first batch, the first article is passed but not the second
+    batches = harvester.harvest(4)
+    next(batches)
+    second = next(batches)
+    batches.close()
+    assert harvester.watermark == collection.documents[0]["_id"]
+    assert second == ["https://example.com/1/link-1", "https://example.com/1/link-2",
+                      "https://example.com/2/link-0", "https://example.com/2/link-1"]
+
+    assert harvest_all(harvester)[:3] == [f"https://example.com/1/link-{j}" for j in range(3)]
+
+
+def test_watermark_round_trip():
+    from bson import ObjectId
+
+    oid = ObjectId()
+    assert decode_watermark(encode_watermark(oid)) == oid
+    assert decode_watermark(encode_watermark(42)) == 42
+    assert decode_watermark("not json") is None
+
+
+def store_aged_articles(collection, ages_days: list, votes: dict = None):
+    now = inserted_now()
+    collection.insert_many([{"url": f"https://example.com/{i}",
+                             "content": {"title": "x" * 200, "vote": (votes or {}).get(i, 0)},
+                             INSERTED_AT: now - timedelta(days=age)} for i, age in enumerate(ages_days)])
+
+
+def test_retention_expires_old_unvoted_documents():
+    collection = MemoryCollection()
+    store_aged_articles(collection, [40, 35, 31, 5, 1], votes={1: 3})
+    retention = RetentionManager(collection, MemoryDatabase(collection), max_bytes=None, ttl_seconds=30 * 86400,
+                                 delete_batch=1, pause_seconds=0)
+
+    deleted = retention.enforce()
+    assert deleted["ttl"] == 2
+    assert [d["url"] for d in collection.documents] == [f"https://example.com/{i}" for i in (1, 3, 4)]
+
+
+def test_retention_evicts_oldest_down_to_the_low_watermark():
+    collection = MemoryCollection()
+    store_aged_articles(collection, list(range(20, 0, -1)), votes={0: -1})
+    database = MemoryDatabase(collection)
+    size = database.command("collStats", collection.name)["size"]
+
+    retention = RetentionManager(collection, database, max_bytes=size // 2, delete_batch=3, pause_seconds=0)
+    result = retention.enforce()
+
+    assert result["bytes"] <= size // 2 * retention.low_watermark
+    remaining = [d["url"] for d in collection.documents]
+    # the voted oldest document stays, the next oldest go first
+    assert remaining[0] == "https://example.com/0"
+    assert remaining[1:] == [f"https://example.com/{i}" for i in range(20 - len(remaining) + 1, 20)]
+
+
+def test_retention_estimate_follows_inserts():
+    collection = MemoryCollection()
+    store_aged_articles(collection, [1] * 10)
+    retention = RetentionManager(collection, MemoryDatabase(collection), max_bytes=10 ** 9)
+    size = retention.refresh_size()
+
+    retention.record_inserts(10)
+    assert retention.estimated_size() == size * 2
+
+
+def test_bulk_writer_upserts_new_documents_only():
+    collection = MemoryCollection()
+    collection.insert_many([{"url": "https://example.com/legacy", "content": {"vote": 2}}])
+    writer = BulkWriter(collection)
+
+    report = writer.write([{"url": "https://example.com/a", "content": {"title": "a"}},
+                           {"url": "https://example.com/a?utm_source=x", "content": {"title": "copy"}},
+                           {"url": "https://example.com/b", "content": {"title": "b"}}])
+    assert (report.inserted, report.updated, report.duplicates) == (2, 0, 1)
+    assert report.inserted_urls == ["https://example.com/a", "https://example.com/b"]
+
+    report = writer.write([{"url": "https://example.com/a", "content": {"title": "again"}},
+                           {"url": "https://example.com/legacy", "content": {"vote": 0}},
+                           {"url": "https://example.com/c", "content": {"title": "c"}}])
+    assert (report.inserted, report.updated, report.duplicates) == (1, 1, 1)
+
+    # stored documents keep their content, documents stored before canonical URLs get one
+    stored = {d["url"]: d for d in collection.documents}
+    assert stored["https://example.com/a"]["content"] == {"title": "a"}
+    assert stored["https://example.com/legacy"] == {"url": "https://example.com/legacy", "content": {"vote": 2},
+                                                    "_id": 1, "canonical_url": "https://example.com/legacy"}
+    assert len(collection.documents) == 4
+
+
+class RacingCollection(MemoryCollection):
+    def __init__(self, details: dict):
+        super().__init__()
+        self.details = details
+
+    def bulk_write(self, requests: list, ordered: bool = True):
+        raise BulkWriteError(self.details)
+
+
+def test_bulk_writer_counts_duplicate_key_errors():
+    # another writer inserted the first page between the two upserts
+    writer = BulkWriter(RacingCollection({"writeErrors": [{"index": 0, "code": 11000}], "nModified": 0,
+                                          "upserted": [{"index": 1, "_id": 7}]}))
+    report = writer.write([{"url": "https://example.com/a"}, {"url": "https://example.com/b"}])
+    assert (report.inserted, report.updated, report.duplicates) == (1, 0, 1)
+    assert report.inserted_urls == ["https://example.com/b"]
+
+    writer = BulkWriter(RacingCollection({"writeErrors": [{"index": 0, "code": 2}], "upserted": []}))
+    with pytest.raises(BulkWriteError):
+        writer.write([{"url": "https://example.com/a"}])
+
+
+def test_importing_the_crawler_builds_no_state(tmp_path):
+    pytest.importorskip("fastapi")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    check = ("import sys, threading, crawler; "
+             "print('introlix_api.app.database' in sys.modules, threading.active_count(), crawler.frontier)")
+    output = subprocess.run([sys.executable, "-c", check], cwd=tmp_path, capture_output=True, text=True, check=True,
+                            env={**os.environ, "PYTHONPATH": root}).stdout.split()
+
+    assert output == ["False", "1", "None"]
+    assert not (tmp_path / "crawl_state").exists()
+
+
+def test_worker_metrics_merge_into_the_parent():
+    worker, parent = MetricsRegistry(), MetricsRegistry()
+    parent.histogram("parse_seconds", "", ("stage",))
+    parent.counter("pages", "", ("outcome",)).inc(outcome="ok")
+
+    worker.histogram("parse_seconds", "", ("stage",)).observe(0.002, stage="dom")
+    worker.counter("pages", "", ("outcome",)).inc(outcome="ok")
+    parent.merge(worker.drain())
+
+    assert worker.drain() == {}
+    summary = parent.summary(keep=("stage", "outcome"))
+    assert summary["pages"] == {'{outcome="ok"}': 2.0}
+    assert summary["parse_seconds"]['{stage="dom"}']["count"] == 1
+
+
+def test_metrics_render_in_the_prometheus_text_format():
+    registry = MetricsRegistry()
+    pages = registry.counter("pages_total", "Scraped pages", ("outcome", "host"))
+    pages.inc(outcome="ok", host="a.com")
+    pages.inc(2, outcome="ok", host='b"c.com')
+    pages.inc(outcome="error", host="a.com")
+    registry.gauge("queue_size", "Items waiting", ("queue",)).set(3, queue="write")
+    fetch_seconds = registry.histogram("fetch_seconds", "Fetch time", ("host",), buckets=(0.1, 1.0, math.inf))
+    for value, host in [(0.05, "a.com"), (0.5, "a.com"), (0.5, "b.com"), (2.5, "b.com")]:
+        fetch_seconds.observe(value, host=host)
+
+    assert registry.render() == (
+        '# HELP pages_total Scraped pages\n'
+        '# TYPE pages_total counter\n'
+        'pages_total{outcome="error",host="a.com"} 1\n'
+        'pages_total{outcome="ok",host="a.com"} 1\n'
+        'pages_total{outcome="ok",host="b\\"c.com"} 2\n'
+        '# HELP queue_size Items waiting\n'
+        '# TYPE queue_size gauge\n'
+        'queue_size{queue="write"} 3\n'
+        '# HELP fetch_seconds Fetch time\n'
+        '# TYPE fetch_seconds histogram\n'
+        'fetch_seconds_bucket{host="a.com",le="0.1"} 1\n'
+        'fetch_seconds_bucket{host="a.com",le="1"} 2\n'
+        'fetch_seconds_bucket{host="a.com",le="+Inf"} 2\n'
+        'fetch_seconds_sum{host="a.com"} 0.55\n'
+        'fetch_seconds_count{host="a.com"} 2\n'
+        'fetch_seconds_bucket{host="b.com",le="0.1"} 0\n'
+        'fetch_seconds_bucket{host="b.com",le="1"} 1\n'
+        'fetch_seconds_bucket{host="b.com",le="+Inf"} 2\n'
+        'fetch_seconds_sum{host="b.com"} 3\n'
+        'fetch_seconds_count{host="b.com"} 2\n'
+    )
+
+    # hosts are summed up, p50 is interpolated inside its bucket
+    assert registry.summary() == {
+        'pages_total': {'{outcome="error"}': 1.0, '{outcome="ok"}': 3.0},
+        'queue_size': {'{queue="write"}': 3.0},
+        'fetch_seconds': {'all': {'count': 4, 'total_seconds': 3.55, 'mean': 0.8875, 'p50': 0.55, 'p99': 1.0}},
+    }
+
+
+def test_metrics_summary_route(tmp_path, monkeypatch):
+    pytest.importorskip("fastapi")
+    from introlix_api.app.routes.metrics import get_metrics_summary
+    from introlix_api.crawler.metrics import metrics
+
+    # nothing published by the crawler yet: the registry of this process
+    monkeypatch.setattr(BotArgs, "STATE_DIR", str(tmp_path))
+    assert get_metrics_summary() == metrics.summary()
+
+    registry = MetricsRegistry()
+    registry.counter("crawler_pages_total", "Scraped pages", ("outcome", "host")).inc(outcome="ok", host="a.com")
+    CrawlStatus(str(tmp_path)).publish(HostController(), registry)
+    assert get_metrics_summary() == {'crawler_pages_total': {'{outcome="ok"}': 1.0}}
+
+
+def test_pages_without_words_have_no_fingerprint():
+    assert fingerprint("", "", "") is None
+    assert fingerprint("!!", "--") is None
+    assert to_int64(None) is None
+
+    collection = MemoryCollection()
+    pages = [{"url": f"https://example.com/{i}", "simhash": to_int64(fingerprint(""))} for i in range(3)]
+    kept = drop_near_duplicates(collection, pages)
+    assert kept == pages
+    assert all("simhash_bands" not in d for d in kept)
+
+    article = "the same article syndicated on two sites keeps a close fingerprint across both copies"
+    copies = [{"url": f"https://example.com/copy-{i}", "simhash": to_int64(fingerprint("title", article))}
+              for i in range(2)]
+    assert [d["url"] for d in drop_near_duplicates(collection, copies)] == ["https://example.com/copy-0"]
+
+
+def test_body_buffer_truncates_at_the_limit():
+    body = BodyBuffer(limit=10, expected_size=100)
+    assert body.write(b"12345")
+    assert not body.write(b"6789012")
+    assert body.truncated and body.getvalue() == b"1234567890"
+
+
+def test_body_buffer_allocates_from_the_announced_length():
+    assert len(BodyBuffer(limit=10 ** 7, expected_size=0)._buffer) == 0
+    assert len(BodyBuffer(limit=10 ** 7, expected_size=300)._buffer) == 300
+    assert len(BodyBuffer(limit=10 ** 7)._buffer) == INITIAL_BODY_SIZE
+
+    # more than announced, or no length at all: the buffer grows up to the limit
+    body = BodyBuffer(limit=10 ** 7, expected_size=4)
+    chunks = [bytes([i % 256]) * 1000 for i in range(200)]
+    for chunk in chunks:
+        assert body.write(chunk)
+    assert body.getvalue() == b"".join(chunks) and not body.truncated
+    assert len(body._buffer) <= 2 * 200_000
+
+    body = BodyBuffer(limit=1500)
+    assert not body.write(b"x" * 1000 + b"y" * 1000)
+    assert body.getvalue() == b"x" * 1000 + b"y" * 500 and len(body._buffer) == 1500
+
+
+def test_bulk_writer_refreshes_changed_pages_in_place():
+    collection = MemoryCollection()
+    writer = BulkWriter(collection)
+    writer.write([{"url": "https://example.com/a", "content": {"title": "old", "vote": 0}, "simhash": 1}])
+    collection.documents[0]["content"]["vote"] = 5
+
+    page = {"url": "https://example.com/a?utm_source=x", "content": {"title": "new", "vote": 0}, "simhash": None}
+    report = writer.refresh([page, {"url": "https://example.com/not-stored", "content": {"title": "x"}}])
+
+    assert report.updated == 1 and report.inserted == 0
+    stored, = collection.documents
+    # the votes of the stored article are kept
+    assert stored["content"] == {"title": "new", "vote": 5}
+    assert stored["simhash"] is None and stored["simhash_bands"] == []
+    assert writer.refresh([page]).updated == 0
+    assert "content.vote" not in content_update(page)
+
+
+def test_robots_cache_serves_entries_until_their_ttl():
+    cache = RobotsCache()
+    parser = RobotFileParser()
+    parser.parse(["User-agent: *", "Crawl-delay: 3", "Disallow: /private"])
+
+    cache.set("https://Example.com/robots.txt", parser, ttl=60)
+    # one entry per scheme and host
+    assert cache.get("https://example.com/blog/post").parser is parser
+    assert cache.get("http://example.com/blog/post") is None
+    assert cache.crawl_delay("https://example.com/", "IntrolixBot") == 3.0
+
+    cache.set("https://down.example.com/", None, ttl=60)
+    assert cache.get("https://down.example.com/a").parser is None
+    assert cache.crawl_delay("https://down.example.com/a", "IntrolixBot") is None
+
+    cache.set("https://expired.example.com/", parser, ttl=0)
+    assert cache.get("https://expired.example.com/a") is None
+    assert cache.stats() == {'hits': 1, 'negative_hits': 1, 'misses': 2, 'hit_ratio': 0.5, 'size': 2}
+
+
+def test_robots_cache_evicts_the_oldest_hosts():
+    cache = RobotsCache(max_entries=2)
+    for host in ("a", "b", "c"):
+        cache.set(f"https://{host}.example.com/", None, ttl=60)
+
+    assert cache.get("https://a.example.com/") is None
+    assert cache.get("https://b.example.com/") is not None and cache.get("https://c.example.com/") is not None
+
+
+def test_frontier_leases_one_url_per_host(tmp_path):
+    frontier = URLFrontier(str(tmp_path / "frontier.sqlite3"), min_delay=0)
+    assert frontier.add(["https://a.com/1", "https://a.com/2", "https://b.com/1", "https://a.com/1"]) == 3
+    assert frontier.add(["https://a.com/urgent"], priority=5) == 1
+
+    leased = frontier.lease(10)
+    assert leased == ["https://a.com/urgent", "https://b.com/1"]
+    # both hosts have a leased URL
+    assert frontier.lease(10) == []
+    assert frontier.stats() == {'queued': 2, 'leased': 2, 'done': 0, 'hosts': 2}
+
+    frontier.ack("https://a.com/urgent")
+    frontier.release("https://b.com/1")
+    assert sorted(frontier.lease(10)) == ["https://a.com/1", "https://b.com/1"]
+    assert frontier.stats()['done'] == 1
+
+
+def test_frontier_gives_expired_leases_to_another_worker(tmp_path):
+    path = str(tmp_path / "frontier.sqlite3")
+    crashed = URLFrontier(path, min_delay=0, lease_seconds=0)
+    crashed.add(["https://a.com/1"])
+    assert crashed.lease(1) == ["https://a.com/1"]
+    assert len(crashed.leases()) == 1
+
+    worker = URLFrontier(path, min_delay=0)
+    assert worker.lease(1) == ["https://a.com/1"]
+    assert worker.leases()[0][1] == worker.owner
+
+
+def test_frontier_waits_for_the_host_delay(tmp_path):
+    frontier = URLFrontier(str(tmp_path / "frontier.sqlite3"), min_delay=0, latency_factor=2.0)
+    frontier.add(["https://a.com/1", "https://a.com/2", "https://b.com/1", "https://b.com/2"])
+    frontier.lease(10)
+
+    frontier.ack("https://a.com/1", latency=30.0)
+    frontier.ack("https://b.com/1", crawl_delay=0)
+    assert frontier.lease(10) == ["https://b.com/2"]
+
+    # a release with a Retry-After pushes the host back too
+    frontier.release("https://b.com/2", delay=60)
+    assert frontier.lease(10) == []
+    assert len(frontier) == 2
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    assert all(bloom.add(f"https://example.com/{i}") for i in range(1000))
+    assert not bloom.add("https://example.com/0")
+    assert all(f"https://example.com/{i}" in bloom for i in range(1000))
+    assert sum(f"https://other.com/{i}" in bloom for i in range(1000)) < 50
+
+
+def test_seen_filter_confirms_bloom_positives(tmp_path):
+    # a full 8 bit filter answers yes to everything, the exact store decides
+    seen = SeenFilter(str(tmp_path / "seen"), capacity=10, max_bytes=1)
+    seen.add([f"https://example.com/{i}" for i in range(50)])
+
+    assert seen.seen("https://www.example.com/3/?utm_source=x")
+    assert seen.filter_new(["https://example.com/7", "https://example.com/new"]) == ["https://example.com/new"]
+    assert seen.stats()['false_positives'] == 1
+
+
+def test_seen_filter_replays_urls_added_after_the_last_save(tmp_path):
+    path = str(tmp_path / "seen")
+    seen = SeenFilter(path)
+    seen.add(["https://example.com/saved"])
+    seen.save()
+    seen.add(["https://example.com/unsaved"])
+    # crash: the Bloom filter on disk misses the last URL
+    seen._conn.close()
+
+    reopened = SeenFilter(path)
+    assert reopened.seen("https://example.com/saved") and reopened.seen("https://example.com/unsaved")
+    assert reopened.stats()['items'] == 2
+    reopened.close()
+
+    # another sizing rebuilds the Bloom filter from the store
+    resized = SeenFilter(path, capacity=1000)
+    assert resized.filter_new(["https://example.com/saved", "https://example.com/unsaved"]) == []
+
+
+def test_validators_build_conditional_requests(tmp_path):
+    validators = ValidatorStore(str(tmp_path / "validators.sqlite3"))
+    url = "https://example.com/post"
+    assert validators.conditional_headers(url) == {}
+
+    validators.record(url, {'etag': '"v1"', 'last-modified': 'Tue, 01 Oct 2024 10:00:00 GMT'}, 2048, 0.25)
+    assert validators.conditional_headers(url) == {'If-None-Match': '"v1"',
+                                                   'If-Modified-Since': 'Tue, 01 Oct 2024 10:00:00 GMT'}
+
+    # a page without validators now can't be revalidated
+    validators.record(url, {'content-type': 'text/html'}, 2048, 0.25)
+    assert validators.conditional_headers(url) == {}
+
+
+def test_not_modified_pages_are_not_parsed(tmp_path):
+    validators = ValidatorStore(str(tmp_path / "validators.sqlite3"))
+    bot = IntrolixBot(urls=[], args=BotArgs, validators=validators)
+    url = "https://example.com/post"
+    validators.record(url, {'etag': '"v1"'}, 2048, 0.25)
+    assert bot.revisit_headers(url) == {'If-None-Match': '"v1"'}
+
+    result = bot.check_fetched(FetchResult(url, 304, headers={'etag': '"v1"'}), 0)
+    assert result['content'] is None and result['error']['name'] == 'NotModified'
+    assert bot.check_fetched(FetchResult(url, 200, b"<html></html>"), 0) is None
+    assert validators.summary() == {'full_fetches': 1, 'not_modified': 1, 'bytes_saved': 2048,
+                                    'parse_seconds_saved': 0.25}
+
+
+def archived_page(url: str, title: str) -> FetchResult:
+    body = f"<html><head><title>{title}</title></head><body><p>{title} body</p></body></html>".encode()
+    return FetchResult(url, 200, body, headers={'content-type': 'text/html; charset=utf-8'})
+
+
+@pytest.mark.parametrize("compression", [GZIP, ZSTD])
+def test_archive_records_round_trip(compression):
+    if compression == ZSTD and zstandard is None:
+        pytest.skip("zstandard is not installed")
+    fetched = FetchResult("https://example.com/a", 200, b"\x00binary\nbody", headers={'etag': '"v1"'}, truncated=True)
+
+    decoded, timestamp = decode_record(encode_record(fetched, 1234, compression), compression)
+    assert timestamp == 1234
+    assert (decoded.url, decoded.status_code, decoded.content, decoded.headers, decoded.truncated) == \
+        (fetched.url, 200, b"\x00binary\nbody", {'etag': '"v1"'}, True)
+
+
+def test_archive_rolls_segments_over_and_serves_the_latest_records(tmp_path):
+    archive = PageArchive(str(tmp_path / "archive"), segment_bytes=200)
+    for i in range(6):
+        archive.append(archived_page(f"https://example.com/{i % 3}", f"Version {i}"), i)
+
+    # every record is over 100 bytes, a segment holds two of them
+    stats = archive.stats()
+    assert (stats['records'], stats['pages'], stats['segments']) == (6, 3, 3)
+
+    fetched, timestamp = archive.get("https://example.com/1")
+    assert timestamp == 4 and b"Version 4" in fetched.content
+    assert archive.get("https://example.com/missing") is None
+
+    latest = archive.latest()
+    assert sum(len(spans) for spans in latest.values()) == 3
+    # versions 3, 4 and 5, the last two segments
+    assert sorted(latest) == ["000002.warc.gz", "000003.warc.gz"]
+    archive.close()
+
+
+def test_archive_deletes_the_oldest_segments_over_its_size(tmp_path):
+    archive = PageArchive(str(tmp_path / "archive"), segment_bytes=200, max_bytes=500)
+    for i in range(10):
+        archive.append(archived_page(f"https://example.com/{i}", f"Page {i}"), i)
+
+    stats = archive.stats()
+    # checked when a segment starts, the current one may take the archive over by a segment
+    assert (stats['records'], stats['segments']) == (4, 2) and stats['bytes'] <= 500 + 200
+    assert archive.get("https://example.com/0") is None
+    assert archive.get("https://example.com/9") is not None
+    assert stats['records'] == sum(len(spans) for spans in archive.latest().values())
+    archive.close()
+
+
+def test_reextract_parses_the_latest_archived_pages(tmp_path):
+    archive = PageArchive(str(tmp_path / "archive"), segment_bytes=300)
+    archive.append(archived_page("https://example.com/post", "Old title"), 1)
+    archive.append(archived_page("https://example.com/other", "Other post"), 2)
+    archive.append(archived_page("https://example.com/post", "New title"), 3)
+
+    results = [d for batch in reextract(archive, workers=1, chunk_size=1) for d in batch]
+    titles = {d['url']: d['content']['title'] for d in results}
+    assert titles == {"https://example.com/post": "New title", "https://example.com/other": "Other post"}
+    archive.close()
+
+
+def test_scrape_fetches_and_parses_a_page_once(monkeypatch):
+    import introlix_api.crawler.bot as bot_module
+
+    url = "https://jvns.ca/blog/2024/01/01/a-post/"
+    page = (b'<html><head><title>A post about git</title></head><body>'
+            b'<a href="/blog/2024/02/02/next-post/">next</a>'
+            b'<a href="https://jvns.ca/blog/2024/02/02/next-post?utm_source=feed#comments">again</a>'
+            b'<a href="https://www.jvns.ca/about">about</a>'
+            b'<a href="https://unknown-site.com/post">elsewhere</a></body></html>')
+    bot = IntrolixBot(urls=[], args=BotArgs, obey_robots_txt=False, hosts=HostController())
+
+    fetches, parses = [], []
+    monkeypatch.setattr(bot, "fetch", lambda url, **kwargs: fetches.append(url) or
+                        FetchResult(url, 200, page, headers={'content-type': 'text/html; charset=utf-8'}))
+    html_to_dom = bot_module.html_to_dom
+    monkeypatch.setattr(bot_module, "html_to_dom", lambda *args, **kwargs: parses.append(args) or html_to_dom(*args, **kwargs))
+    monkeypatch.setattr(bot, "get_urls_from_page", lambda *args, **kwargs: pytest.fail("the page is fetched again"))
+
+    result = bot.scrape(url)
+    assert fetches == [url] and len(parses) == 1
+    assert result['content']['title'] == "A post about git"
+    # links of the parsed page, on the root sites and once per canonical URL
+    assert result['content']['links'] == ["https://jvns.ca/blog/2024/02/02/next-post/"]
+
+
+def test_tag_matcher_finds_multi_token_and_dotted_tags():
+    matcher = TagMatcher({'machine', 'machine-learning', 'deep-learning', 'nodejs', 'c', 'c++', 'c#', '.net', 'go'})
+
+    # hyphen or space, dotted names and symbols; C++ is not C
+    assert matcher.match("Node.js and C++ for Machine Learning") == ['nodejs', 'c++', 'machine', 'machine-learning']
+    # ordered by first appearance over title then description, each tag once
+    assert matcher.match("Deep-learning in C#", ".NET, deep learning and C, written in Go.") == \
+        ['deep-learning', 'c#', '.net', 'c', 'go']
+    # whole tokens only
+    assert matcher.match("Machines going deeper", None, "") == []
+    assert TagMatcher().match("Node.js and C++ for Machine Learning") == ['nodejs', 'c++', 'machine-learning']
+
+
+METADATA_FIXTURE_DATES = {
+    # every fallback of the publication date
+    "og_published.html": "2024-05-01",
+    "jsonld_date.html": "2023-11-20",
+    "time_element.html": "2022-02-03",
+    "last_updated.html": "14 Jun, 2024",
+    "img_fallback.html": "",
+    "no_title_svg.html": "2021-01-02",
+}
+
+
+def test_metadata_fixtures_are_all_covered():
+    assert sorted(METADATA_FIXTURE_DATES) == sorted(load_fixtures())
+
+
+@pytest.mark.parametrize("name, date", sorted(METADATA_FIXTURE_DATES.items()))
+def test_extract_metadata_matches_the_xpath_extractor(name, date):
+    dom = load_fixtures()[name]
+    metadata = single_pass_metadata(dom, FIXTURE_URL)
+    assert metadata == legacy_metadata(dom, FIXTURE_URL)
+    assert metadata['date'] == date and metadata['links']
+
+
+def test_sniff_encoding_prefers_bom_then_header_then_meta():
+    meta = b'<html><head><meta charset="windows-1252"><title>t</title></head></html>'
+    assert sniff_encoding(codecs.BOM_UTF8 + meta, "text/html; charset=iso-8859-2") == ('utf-8-sig', 'bom')
+    assert sniff_encoding(codecs.BOM_UTF16_LE + "<html>".encode("utf-16-le")) == ('utf-16', 'bom')
+    assert sniff_encoding(meta, "text/html; charset=ISO-8859-2") == ('iso8859-2', 'header')
+    # unknown charsets are skipped
+    assert sniff_encoding(meta, 'text/html; charset="no-such-charset"') == ('cp1252', 'meta')
+    assert sniff_encoding(meta, "text/html") == ('cp1252', 'meta')
+    # <meta> is only searched near the top of the page
+    late = b"<html><head>" + b" " * CHARSET_SNIFF_BYTES + b'<meta charset="windows-1252"></head></html>'
+    assert sniff_encoding(late) == (None, None)
+
+
+def test_charset_cache_decodes_the_pages_of_a_host_that_declare_none():
+    cache = CharsetCache(max_hosts=2)
+    text = "Café crème"
+    declared = f'<html><head><meta charset="latin-1"></head><body>{text}</body></html>'.encode("latin-1")
+    bare = f"<html><body>{text}</body></html>".encode("latin-1")
+
+    assert text not in decode_html(bare, host="a.com", cache=cache)
+    assert text in decode_html(declared, host="a.com", cache=cache)
+    assert text in decode_html(bare, host="a.com", cache=cache)
+
+    # least recently used hosts are dropped
+    cache.set("b.com", "utf-8")
+    cache.get("a.com")
+    cache.set("c.com", "utf-8")
+    assert (cache.get("a.com"), cache.get("b.com"), cache.get("c.com")) == ("iso8859-1", None, "utf-8")
+
+
+CANONICAL_CASES = [
+    # case, www, default port, trailing slash, fragment, tracking parameters and parameter order
+    ("HTTPS://WWW.Example.COM:443/Blog/Post/?b=2&a=1&utm_source=x#top", "https://example.com/Blog/Post?a=1&b=2"),
+    ("https://example.com/a?UTM_Medium=x&fbclid=1&Ref=y", "https://example.com/a?Ref=y"),
+    ("https://example.com./a?q=a+b", "https://example.com/a?q=a%20b"),
+    ("https://example.com", "https://example.com/"),
+    ("https://example.com/?", "https://example.com/"),
+    # dot segments and percent-encoding
+    ("http://example.com:8080/a/./b/../c/", "http://example.com:8080/a/c"),
+    ("https://example.com/%7euser/caf%c3%a9%2f", "https://example.com/~user/caf%C3%A9%2F"),
+    ("https://[::1]:8443/x", "https://[::1]:8443/x"),
+    # not http(s), left alone
+    ("mailto:x@example.com", "mailto:x@example.com"),
+    ("ftp://Example.com/x", "ftp://Example.com/x"),
+]
+
+
+@pytest.mark.parametrize("url, canonical", CANONICAL_CASES)
+def test_canonicalize_url(url, canonical):
+    assert canonicalize_url(url) == canonical
+    assert canonicalize_url(canonical) == canonical
+
+
+def test_canonicalize_url_resolves_relative_links():
+    assert canonicalize_url("../b?x=1#c", base="https://www.example.com/a/c") == "https://example.com/b?x=1"
+    assert canonical_link("/canonical-post", "https://m.example.com/post") == "https://m.example.com/canonical-post"
+    # no usable canonical link: the page URL is the key
+    assert canonical_link("javascript:void(0)", "https://example.com/p?utm_source=1") == "https://example.com/p"
+    assert canonical_link(None, "https://www.example.com/p/") == "https://example.com/p"
+
+
+def test_canonical_link_only_trusts_the_same_site():
+    page = "https://www.example.com/blog/post-1?utm_source=x"
+    # another host of the same site
+    assert canonical_link("https://m.example.com/blog/post-1", page) == "https://m.example.com/blog/post-1"
+    assert canonical_link("https://blog.example.co.uk/a", "https://example.co.uk/b") == "https://blog.example.co.uk/a"
+    # every page pointing at the homepage would collapse into one key
+    assert canonical_link("https://www.example.com/", page) == "https://example.com/blog/post-1"
+    assert canonical_link("/", page) == "https://example.com/blog/post-1"
+    # a canonical on another domain, even one sharing the country suffix
+    assert canonical_link("https://spam.example/blog/post-1", page) == "https://example.com/blog/post-1"
+    assert canonical_link("https://other.co.uk/a", "https://example.co.uk/b") == "https://example.co.uk/b"
+    assert registrable_host("a.b.Example.COM.") == "example.com"
+    assert registrable_host("127.0.0.1") == "127.0.0.1"
+
+
+def test_strip_tracking_keeps_a_fetchable_url():
+    url = "https://WWW.Example.COM:443/Blog/Post/?b=2&utm_source=x&a=1#top"
+    assert strip_tracking(url) == "https://WWW.Example.COM:443/Blog/Post/?b=2&a=1"
+    assert strip_tracking("http://example.com/a/./b/%7e?gclid=1") == "http://example.com/a/./b/%7e"
+    assert strip_tracking("https://example.com/a?q=1&q=2") == "https://example.com/a?q=1&q=2"
+
+
+def test_host_limit_grows_additively_and_drops_by_half():
+    hosts = HostController(initial_limit=2, max_limit=4, latency_target=1.0)
+    # about one more request per `limit` fast answers
+    for _ in range(3):
+        hosts.record_response("a.com", 200, 0.1)
+    assert hosts.snapshot()[0]['limit'] == 3
+
+    for _ in range(20):
+        hosts.record_response("a.com", 200, 0.1)
+    assert hosts.snapshot()[0]['limit'] == 4
+
+    hosts.record_response("a.com", 200, 2.5)
+    assert hosts.snapshot()[0]['limit'] == 2
+    # the timeout follows the latency, bounded by the caller's
+    assert hosts.timeout("a.com", 30.0) == pytest.approx(4 * (0.7 * 0.1 + 0.3 * 2.5))
+    assert hosts.timeout("new.com", 30.0) == 30.0
+
+
+def test_host_is_set_aside_for_its_retry_after():
+    hosts = HostController(max_backoff_seconds=600)
+    hosts.record_response("a.com", 429, 0.1, retry_after="120")
+    assert 119 < hosts.blocked_for("a.com") <= 120
+    with pytest.raises(HostBlocked):
+        hosts.check("a.com")
+    assert hosts.snapshot(throttled_only=True)[0]['host'] == "a.com"
+
+    # capped by the longest backoff
+    hosts.record_response("b.com", 503, 0.1, retry_after="86400")
+    assert hosts.blocked_for("b.com") <= 600
+
+    assert parse_retry_after(" 30 ") == 30.0
+    assert 50 < parse_retry_after(formatdate(time.time() + 60, usegmt=True)) <= 60
+    assert parse_retry_after("soon") is None and parse_retry_after(None) is None
+
+
+def test_host_backs_off_after_repeated_failures():
+    hosts = HostController(failure_threshold=3, backoff_seconds=10)
+    for _ in range(2):
+        hosts.record_failure("a.com", "ConnectTimeout")
+    hosts.check("a.com")
+
+    hosts.record_response("a.com", 502, 0.1)
+    assert 9 < hosts.blocked_for("a.com") <= 10
+    state, = hosts.snapshot()
+    assert (state['limit'], state['failures'], state['backoffs']) == (1, 3, 1)
+    assert hosts.blocked_for("b.com") == 0.0
+
+
+SITEMAP = b"""<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <url><loc>https://example.com/blog/first-post</loc><lastmod>2024-06-01</lastmod></url>
+  <url><loc> https://example.com/blog/second-post </loc></url>
+  <url><lastmod>2024-06-01</lastmod></url>
+</urlset>"""
+
+SITEMAP_INDEX = b"""<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap><loc>https://example.com/sitemap-posts.xml</loc><lastmod>2024-06-02</lastmod></sitemap>
+</sitemapindex>"""
+
+RSS = b"""<rss version="2.0"><channel><title>Blog</title>
+  <image><url>https://example.com/logo.png</url></image>
+  <item><title>A</title><link>https://example.com/a</link><pubDate>Sat, 01 Jun 2024 10:00:00 GMT</pubDate></item>
+  <item><title>B</title><guid>https://example.com/b</guid></item>
+  <item><title>No link</title><guid isPermaLink="false">42</guid></item>
+</channel></rss>"""
+
+ATOM = b"""<feed xmlns="http://www.w3.org/2005/Atom">
+  <entry><link rel="self" href="https://example.com/self"/><link href="https://example.com/c"/>
+    <updated>2024-06-03T00:00:00Z</updated></entry>
+</feed>"""
+
+
+def parse_feed(document: bytes, chunk_size: int, max_bytes: int = 50 * 1024 * 1024) -> tuple:
+    parser = FeedParser(max_bytes=max_bytes)
+    entries = []
+    for i in range(0, len(document), chunk_size):
+        entries.extend(parser.feed(document[i:i + chunk_size]))
+    entries.extend(parser.close())
+    return parser.kind, entries
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1 << 20])
+def test_feed_parser_reads_sitemaps_and_feeds(chunk_size):
+    assert parse_feed(SITEMAP, chunk_size) == ("urlset", [
+        FeedEntry("https://example.com/blog/first-post", "2024-06-01", "page"),
+        FeedEntry("https://example.com/blog/second-post", None, "page"),
+    ])
+    assert parse_feed(SITEMAP_INDEX, chunk_size) == ("sitemapindex", [
+        FeedEntry("https://example.com/sitemap-posts.xml", "2024-06-02", "sitemap"),
+    ])
+    assert parse_feed(RSS, chunk_size) == ("rss", [
+        FeedEntry("https://example.com/a", "Sat, 01 Jun 2024 10:00:00 GMT", "page"),
+        FeedEntry("https://example.com/b", None, "page"),
+    ])
+    assert parse_feed(ATOM, chunk_size) == ("feed", [FeedEntry("https://example.com/c", "2024-06-03T00:00:00Z", "page")])
+    assert parse_feed(gzip.compress(SITEMAP), chunk_size) == parse_feed(SITEMAP, chunk_size)
+
+
+def test_feed_parser_keeps_the_entries_before_the_size_limit():
+    kind, entries = parse_feed(SITEMAP, 16, max_bytes=SITEMAP.index(b"</url>") + len(b"</url>"))
+    assert kind == "urlset"
+    assert [entry.url for entry in entries] == ["https://example.com/blog/first-post"]
+
+
+def test_sitemap_store_returns_new_and_changed_urls(tmp_path):
+    store = SitemapStore(str(tmp_path / "sitemaps.sqlite3"))
+    first = [FeedEntry("https://example.com/a", "2024-06-01", "page"),
+             FeedEntry("https://example.com/b", None, "page")]
+    assert store.update_entries(first) == (first, [])
+    assert store.update_entries(first) == ([], [])
+
+    again = [FeedEntry("https://www.example.com/a/?utm_source=rss", "2024-06-05", "page"),
+             # the same URL in a feed without a lastmod
+             FeedEntry("https://example.com/a", None, "page"),
+             FeedEntry("https://example.com/b", "2024-06-05", "page"),
+             FeedEntry("https://example.com/c", None, "page")]
+    new, changed = store.update_entries(again)
+    assert [entry.url for entry in new] == ["https://example.com/c"]
+    assert [entry.url for entry in changed] == ["https://www.example.com/a/?utm_source=rss"]
+
+    # b has a lastmod now, its next change counts
+    assert store.update_entries([FeedEntry("https://example.com/b", "2024-07-01", "page")])[1] != []
+
+
+def test_sitemap_store_keeps_the_source_state_on_304(tmp_path):
+    store = SitemapStore(str(tmp_path / "sitemaps.sqlite3"))
+    url = "https://example.com/sitemap.xml"
+    store.record_source(url, "https://example.com/", "urlset", 200, {'etag': '"s1"'}, "2024-06-01", 2)
+    store.record_source(url, "https://example.com/", "urlset", 304)
+
+    source = store.source(url)
+    assert (source['kind'], source['etag'], source['status'], source['entries']) == ("urlset", '"s1"', 304, 2)
+    assert store.source("https://example.com/feed") is None
+
+
+@pytest.mark.parametrize("root_url, kept", [
+    ("https://example.com/", ["https://example.com/blog/a", "https://www.example.com/blog", "https://example.com/news/b",
+                              "https://example.com/blogroll"]),
+    ("https://example.com/blog/", ["https://example.com/blog/a", "https://www.example.com/blog"]),
+])
+def test_discovery_keeps_the_pages_under_the_root(tmp_path, root_url, kept):
+    sitemap = [FeedEntry(url, None, "page") for url in [
+        "https://example.com/blog/a", "https://www.example.com/blog", "https://example.com/news/b",
+        "https://example.com/blogroll", "https://other.com/blog/c",
+    ]]
+    discovery = SiteDiscovery(SitemapStore(str(tmp_path / "sitemaps.sqlite3")), bot=None)
+    discovery.sources = lambda root_url: ["https://example.com/sitemap.xml"]
+    discovery.read = lambda url, root_url, source=None, lastmod=None: (sitemap, "urlset", 200)
+
+    result = discovery.discover_site(root_url)
+    assert result.new == kept
+
+
+def test_frontier_retries_failed_urls_with_a_backoff(tmp_path):
+    frontier = URLFrontier(str(tmp_path / "frontier.sqlite3"), min_delay=0)
+    frontier.add(["https://a.com/flaky", "https://a.com/next"], priority=1)
+    frontier.add(["https://a.com/last"])
+    assert frontier.lease(10) == ["https://a.com/flaky"]
+
+    assert frontier.retry("https://a.com/flaky", delay=60, max_attempts=3)
+    # the failed URL waits, the rest of its host does not
+    assert frontier.lease(10) == ["https://a.com/next"]
+    assert frontier.stats()['queued'] == 2
+
+    frontier.ack("https://a.com/next")
+    assert frontier.lease(10) == ["https://a.com/last"]
+    frontier.ack("https://a.com/last")
+    assert frontier.lease(10) == [] and len(frontier) == 1
+
+    # leased again once its retry time has passed, until the attempts run out
+    frontier._conn.execute("UPDATE urls SET retry_at = 0")
+    assert frontier.lease(10) == ["https://a.com/flaky"]
+    assert frontier.retry("https://a.com/flaky", delay=0, max_attempts=3)
+    assert frontier.lease(10) == ["https://a.com/flaky"]
+    assert not frontier.retry("https://a.com/flaky", delay=0, max_attempts=3)
+    assert frontier.lease(10) == [] and frontier.stats()['done'] == 3
+    # requeued URLs start over
+    assert frontier.add(["https://a.com/flaky"], requeue=True) == 1
+    assert frontier.lease(10) == ["https://a.com/flaky"]
+    assert frontier.retry("https://a.com/flaky", delay=0, max_attempts=2)
+
+
+@pytest.fixture
+def crawl_state(tmp_path, monkeypatch):
+    pytest.importorskip("fastapi")
+    import crawler
+
+    monkeypatch.setattr(BotArgs, "STATE_DIR", str(tmp_path / "crawl_state"))
+    monkeypatch.setattr(BotArgs, "MIN_HOST_DELAY", 0.0)
+    monkeypatch.setattr(BotArgs, "RETRY_DELAY_SECONDS", 0.0)
+    # the globals are put back to None after the test, the next init builds them again
+    for name in ("search_data", "db", "seen_filter", "validators", "frontier", "checkpoint", "harvester",
+                 "url_backlog", "archive", "retention", "writer", "pipeline", "discovery"):
+        monkeypatch.setattr(crawler, name, None)
+
+    collection = MemoryCollection()
+    crawler.init(collection, MemoryDatabase(collection))
+    yield crawler
+    crawler.pipeline.close()
+
+
+def test_transient_failures_are_retried_not_marked_crawled(crawl_state):
+    crawler = crawl_state
+    flaky, denied, ok = "https://a.com/flaky-page", "https://b.com/private", "https://c.com/some-article"
+    crawler.frontier.add([flaky, denied, ok])
+    assert len(crawler.frontier.lease(10)) == 3
+
+    page = {"url": ok, "content": {"title": "An article", "desc": "", "tags": [], "vote": 0, "links": []},
+            "simhash": None}
+    crawler.write_batch([IntrolixBot.error_result(flaky, None, 0, 'AbortError', 'timed out'),
+                         IntrolixBot.error_result(denied, None, 0, 'RobotsDenied', ''), page])
+
+    assert [crawler.seen_filter.seen(url) for url in (flaky, denied, ok)] == [False, True, True]
+    assert [d["url"] for d in crawler.search_data.documents] == [ok]
+
+    # failed again until the attempts run out: given up, but never marked as crawled
+    for _ in range(BotArgs.MAX_FETCH_ATTEMPTS - 1):
+        assert crawler.frontier.lease(10) == [flaky]
+        crawler.write_batch([IntrolixBot.error_result(flaky, None, 0, 'NoResponseText', '')])
+    assert crawler.frontier.lease(10) == [] and len(crawler.frontier) == 0
+    assert not crawler.seen_filter.seen(flaky)
+
+
+def test_written_urls_match_the_canonical_url(crawl_state):
+    crawler = crawl_state
+    crawler.search_data.insert_many([
+        {"url": "https://example.com/a", "canonical_url": "https://example.com/a"},
+        # stored from another variant of the leased URL
+        {"url": "https://www.example.com/b/?utm_source=rss", "canonical_url": "https://example.com/b"},
+    ])
+
+    leased = ["https://example.com/a", "https://example.com/b", "https://example.com/b#comments",
+              "https://example.com/c"]
+    assert crawler.written_urls(leased) == leased[:3]
+
+
+def test_frontier_leases_up_to_the_host_concurrency_limit(tmp_path):
+    hosts = HostController(initial_limit=2, max_limit=4)
+    frontier = URLFrontier(str(tmp_path / "frontier.sqlite3"), min_delay=0, hosts=hosts)
+    frontier.add([f"https://a.com/{i}" for i in range(10)] + ["https://b.com/1", "https://c.com/1"])
+
+    # one URL per host first, then the hosts allowed more
+    leased = frontier.lease(10)
+    assert sorted(leased[:3]) == ["https://a.com/0", "https://b.com/1", "https://c.com/1"]
+    assert leased[3:] == ["https://a.com/1"]
+    assert frontier.lease(10) == []
+
+    # fast answers raise the limit of the host, a 429 sets it aside
+    for _ in range(10):
+        hosts.record_response("a.com", 200, 0.1)
+    assert frontier.lease(10) == ["https://a.com/2", "https://a.com/3"]
+    hosts.record_response("b.com", 429, 0.1, retry_after="60")
+    frontier.ack("https://b.com/1")
+    frontier.add(["https://b.com/2"])
+    assert frontier.lease(10) == []
+    assert frontier.stats()['leased'] == 5
+
+
+def test_crawl_status_shows_the_crawler_process_state(tmp_path, monkeypatch):
+    hosts, registry = HostController(initial_limit=2), MetricsRegistry()
+    hosts.record_response("slow.com", 200, 5.0)
+    hosts.record_response("busy.com", 429, 0.1, retry_after="120")
+    hosts.record_response("fine.com", 200, 0.1)
+    registry.counter("crawler_pages_total", "Scraped pages", ("outcome", "host")).inc(outcome="ok", host="fine.com")
+    CrawlStatus(str(tmp_path)).publish(hosts, registry)
+
+    # read by another process, e.g. the web app
+    status = CrawlStatus(str(tmp_path))
+    assert status.read()['summary'] == registry.summary()
+    assert [state['host'] for state in status.hosts()] == [state['host'] for state in hosts.snapshot()]
+    assert [state['host'] for state in status.hosts(throttled_only=True)] == ["busy.com", "slow.com"]
+
+    # the backoff left goes down with the age of the status
+    published = json.loads((tmp_path / STATUS_FILE).read_text())
+    published['published_at'] -= 60
+    (tmp_path / STATUS_FILE).write_text(json.dumps(published))
+    assert 59 < status.hosts(throttled_only=True)[0]['blocked_for'] <= 60
+    assert CrawlStatus(str(tmp_path / "missing")).hosts() is None
+
+    pytest.importorskip("fastapi")
+    from introlix_api.app.routes.metrics import get_metrics
+    monkeypatch.setattr(BotArgs, "STATE_DIR", str(tmp_path))
+    assert 'crawler_pages_total{outcome="ok",host="fine.com"} 1' in get_metrics().body.decode()
+
+
+def test_pipeline_keeps_its_connections_between_runs():
+    pytest.importorskip("aiohttp")
+    from introlix_api.crawler.pipeline import CrawlPipeline
+    from tests.benchmarks.fixture_server import FixtureServer, SiteConfig
+
+    written = []
+    with FixtureServer(SiteConfig(pages=6, latency=0.0, latency_jitter=0.0, slow_every=0, huge_every=0)) as server:
+        urls = [url for url in server.urls() if "/private/" not in url]
+        pipeline = CrawlPipeline(write=written.extend, args=BotArgs, parse_workers=1, hosts=HostController())
+        try:
+            pipeline.run(urls[:3])
+            pool = pipeline.bot.async_http
+            opened, reused = pool.new_connections, pool.reused_connections
+            pipeline.run(urls[3:])
+            assert pipeline.bot.async_http is pool
+            # the connections of the first run serve the second one
+            assert pool.reused_connections - reused >= opened
+        finally:
+            pipeline.close()
+
+    assert pipeline.bot.async_http is None
+    assert sorted(d["url"] for d in written) == sorted(urls)
+
+
+def test_async_crawl_fetches_and_scrapes_pages():
+    pytest.importorskip("aiohttp")
+    import asyncio
+    from tests.benchmarks.fixture_server import FixtureServer, SiteConfig
+
+    config = SiteConfig(pages=6, latency=0.0, latency_jitter=0.0, private_every=3, slow_every=0, huge_every=4)
+    bot = IntrolixBot(urls=[], args=BotArgs, robots=RobotsCache(), hosts=HostController())
+
+    async def crawl(urls):
+        return [d async for d in bot.crawl_async(urls, max_concurrency=3)]
+
+    async def fetch(url):
+        async with AsyncHTTPPool().session() as session:
+            return await bot.fetch_async(session, url)
+
+    with FixtureServer(config) as server:
+        urls = server.urls()
+        results = {d['url']: d for d in asyncio.run(crawl(urls))}
+        # the body of a page with no Content-Length is cut at the fetch limit
+        huge = asyncio.run(fetch(urls[2]))
+        # the sync engine scrapes a page into the same result
+        scraped = bot.scrape(urls[0])
+
+    assert set(results) == set(urls)
+    for i, url in enumerate(urls):
+        if "/private/" in url:
+            assert results[url]['content'] is None and results[url]['error']['name'] == 'RobotsDenied'
+        else:
+            title = server.graph.render(i).split(b"<title>")[1].split(b"</title>")[0].decode()
+            assert results[url]['content']['title'] == title
+
+    assert huge.status_code == 200 and huge.truncated and huge.bytes_read == BotArgs.MAX_FETCH_SIZE
+    assert scraped['content'] == results[urls[0]]['content']
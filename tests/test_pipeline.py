@@ -0,0 +1,156 @@
+"""
+Crawl recovery: a crawl is killed mid-run, resumed from its checkpoint, and must
+end with every page saved once, without fetching again the pages it had finished.
+
+The crawl runs in a child process (`python -m tests.test_pipeline STATE_DIR BASE_URL STORE`)
+so it can be killed like a crashed container, process pool included.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import subprocess
+
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("lxml")
+
+from introlix_api.crawler.bot import BotArgs
+from tests.benchmarks.fixture_server import FixtureServer, FixtureHandler, SiteConfig, SiteGraph
+
+PAGES = 40
+
+
+class JsonlStore:
+    """
+    Stand-in for the database: one JSON line per saved result.
+    """
+    def __init__(self, path: str):
+        self.path = path
+
+    def read(self) -> list:
+        if not os.path.exists(self.path):
+            return []
+        results = []
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    results.append(json.loads(line))
+                except ValueError:
+                    pass  # line cut by the kill
+        return results
+
+    def written(self, urls: list) -> list:
+        saved = {result["url"] for result in self.read()}
+        return [url for url in urls if url in saved]
+
+    def save(self, batch: list):
+        with open(self.path, "a") as f:
+            f.write("".join(json.dumps({"url": d["url"], "ok": d.get("content") is not None,
+                                        "error": (d.get("error") or {}).get("name")}) + "\n" for d in batch))
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class Args(BotArgs):
+    # settings of the crawl, module level so the spawned parse workers can unpickle them
+    WRITE_FLUSH_SECONDS = 0.05
+
+
+def crawl(state_dir: str, base_url: str, store_path: str):
+    from introlix_api.crawler.checkpoint import CrawlCheckpoint
+    from introlix_api.crawler.frontier import URLFrontier
+    from introlix_api.crawler.pipeline import CrawlPipeline
+    from introlix_api.crawler.seen import SeenFilter
+
+    store = JsonlStore(store_path)
+    seen = SeenFilter(os.path.join(state_dir, "seen"), capacity=10_000)
+    frontier = URLFrontier(os.path.join(state_dir, "frontier.sqlite3"), min_delay=0.0, latency_factor=0.0,
+                           seen=seen)
+    checkpoint = CrawlCheckpoint(frontier, seen=seen, interval=0.2)
+    checkpoint.resume(is_written=store.written)
+
+    if not checkpoint.state.get("seeded"):
+        frontier.add([base_url + path for path in SiteGraph(SiteConfig(pages=PAGES)).paths])
+        checkpoint.update(seeded=True)
+        checkpoint.save()
+
+    def write(batch: list):
+        store.save(batch)
+        for d in batch:
+            frontier.ack(d["url"])
+
+    pipeline = CrawlPipeline(write=write, args=Args, batch_size=2, seen=seen, parse_workers=1)
+    try:
+        while True:
+            urls = frontier.lease(5)
+            if not urls:
+                if not len(frontier):
+                    break
+                time.sleep(0.01)
+                continue
+            pipeline.run(urls)
+            checkpoint.maybe_save()
+    finally:
+        pipeline.close()
+        checkpoint.save()
+
+
+class CountingHandler(FixtureHandler):
+    def do_GET(self):
+        if not self.path.endswith("robots.txt"):
+            counts = self.server.fetch_counts
+            counts[self.path] = counts.get(self.path, 0) + 1
+        super().do_GET()
+
+
+def start_crawl(state_dir, base_url, store_path) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, "-m", "tests.test_pipeline", str(state_dir), base_url, str(store_path)],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, start_new_session=True)
+
+
+def test_killed_crawl_resumes_without_losing_or_refetching_pages(tmp_path):
+    # every page answers in about 50ms, so the crawl is still running when it is killed
+    config = SiteConfig(pages=PAGES, latency=0.05, latency_jitter=0.0, slow_every=0, huge_every=0)
+    store = JsonlStore(str(tmp_path / "store.jsonl"))
+
+    with FixtureServer(config) as server:
+        server.httpd.RequestHandlerClass = CountingHandler
+        server.httpd.fetch_counts = {}
+
+        crawl_process = start_crawl(tmp_path / "state", server.base_url, store.path)
+        deadline = time.time() + 60
+        while len(store.read()) < PAGES // 4:
+            assert crawl_process.poll() is None, crawl_process.stderr.read().decode()
+            assert time.time() < deadline, "crawl did not start"
+            time.sleep(0.02)
+
+        os.killpg(crawl_process.pid, signal.SIGKILL)
+        crawl_process.wait()
+        finished_before_kill = {result["url"] for result in store.read()}
+        assert len(finished_before_kill) < PAGES, "crawl finished before it was killed"
+
+        crawl_process = start_crawl(tmp_path / "state", server.base_url, store.path)
+        _, stderr = crawl_process.communicate(timeout=120)
+        assert crawl_process.returncode == 0, stderr.decode()
+
+        fetch_counts = dict(server.httpd.fetch_counts)
+        urls = server.urls()
+
+    results = store.read()
+    saved = [result["url"] for result in results]
+    # no page lost, none saved twice
+    assert sorted(saved) == sorted(urls)
+    # every page went through the parse workers and was extracted, but those robots.txt disallows
+    failed = {result["url"]: result["error"] for result in results if not result["ok"]}
+    assert failed == {url: "RobotsDenied" for url in urls if "/private/" in url}
+    # pages finished before the kill are not fetched again
+    for url in finished_before_kill:
+        path = url[len(server.base_url):]
+        assert fetch_counts.get(path, 0) <= 1, f"{path} fetched again after the resume"
+
+
+if __name__ == "__main__":
+    crawl(*sys.argv[1:4])